@@ -0,0 +1,153 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import time
+
+try:
+    import resource     # peak RSS, not available on Windows
+except ImportError:
+    resource = None
+
+# (n_agvs, n_machines, n_warehouses, grid_size, max_coupling) - growing factories, every product fits on one AGV
+# (1, 1) or needs up to 2x2 coupled AGVs (2, 2). The heuristic controller of LoopTest couples the AGVs but does not
+# finish a coupled delivery, so the coupling cases measure the cost of coupling, not the throughput of products.
+SIZES = [(6, 3, 1, 16, (1, 1)), (12, 6, 2, 22, (1, 1)), (24, 12, 2, 36, (1, 1)), (48, 24, 4, 50, (1, 1)),
+         (96, 48, 4, 71, (1, 1)), (12, 6, 2, 22, (2, 2)), (48, 24, 4, 50, (2, 2))]
+TIME_STEPS = [0.1, 0.5, 1.0]
+SIMULATION_TIME = 300   # s of simulated time per case
+
+
+def run_case(n_agvs, n_machines, n_warehouses, grid_size, time_step, simulation_time=SIMULATION_TIME, seed=0,
+             fleet_engine=False, max_coupling=(1, 1)):
+    """
+    Runs the bare step loop of a generated factory (FactoryGenerator) with the heuristic controller of SimpleLoopTest
+    (headless).
+    :param max_coupling: (int, int) - maximal number of AGVs in width and length direction needed for a product
+    :param fleet_engine: bool - vectorized AGV kinematics (see Factory.enable_fleet_engine)
+    :return: dict - case parameters and measurements
+    """
+    import matplotlib
+    matplotlib.use('Agg')   # LoopTest switches pyplot to interactive mode
+    from FactoryObjects.Factory import Factory
+    from FactoryObjects.FactoryGenerator import FactoryGenerator
+    from SimpleLoopTest import LoopTest
+
+    random.seed(seed)
+    factory = Factory()
+    factory.time_step = time_step
+    FactoryGenerator(seed=seed, length=grid_size, width=grid_size, n_warehouses=n_warehouses, n_machines=n_machines,
+                     n_agvs=n_agvs, max_coupling=tuple(max_coupling)).generate(factory)
+    if fleet_engine:
+        factory.enable_fleet_engine()
+    loop_test = LoopTest(factory)
+    loop_test.time_step = time_step
+    steps = int(round(simulation_time / time_step))
+
+    start_time = time.perf_counter()
+    for loop_test.step_counter in range(steps):
+        loop_test.agv_basic_controller_step()
+    duration = time.perf_counter() - start_time
+
+    return dict(n_agvs=n_agvs, n_machines=n_machines, n_warehouses=n_warehouses, grid_size=grid_size,
+                max_coupling=list(max_coupling), time_step=time_step, fleet_engine=fleet_engine, steps=steps, seconds=duration,
+                steps_per_second=steps / duration,
+                us_per_agv_tick=duration / (steps * n_agvs) * 1e6, peak_rss_mb=get_peak_rss_mb(),
+                finished_products=sum(len(warehouse.end_product_store) for warehouse in factory.warehouses))
+
+
+def run_case_in_process(kwargs):
+    return run_case(**kwargs)
+
+
+def get_peak_rss_mb():
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':    # bytes on macOS, kB on Linux
+        return peak_rss / 1024 / 1024
+    return peak_rss / 1024
+
+
+def run_benchmark(sizes=SIZES, time_steps=TIME_STEPS, simulation_time=SIMULATION_TIME, seed=0, fleet_engine=False):
+    """
+    Runs every size with every time step, each case in a fresh process (peak RSS per case, no shared caches).
+    :return: dict - machine information and list of case results
+    """
+    context = multiprocessing.get_context('spawn')
+    cases = []
+    for n_agvs, n_machines, n_warehouses, grid_size, max_coupling in sizes:
+        for time_step in time_steps:
+            kwargs = dict(n_agvs=n_agvs, n_machines=n_machines, n_warehouses=n_warehouses, grid_size=grid_size,
+                          time_step=time_step, simulation_time=simulation_time, seed=seed, fleet_engine=fleet_engine,
+                          max_coupling=max_coupling)
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case_in_process, (kwargs,))
+            print(format_case(result))
+            cases.append(result)
+    return dict(created=time.strftime('%Y-%m-%d %H:%M:%S'), python=platform.python_version(),
+                platform=platform.platform(), processor=platform.processor(), cpu_count=os.cpu_count(),
+                simulation_time=simulation_time, seed=seed, fleet_engine=fleet_engine, cases=cases)
+
+
+def format_case(case):
+    peak_rss = '-' if case['peak_rss_mb'] is None else str(round(case['peak_rss_mb'], 1)) + ' MB'
+    return (str(case['n_agvs']) + ' AGVs, ' + str(case['n_machines']) + ' machines, ' + str(case['n_warehouses']) +
+            ' warehouses, ' + str(case['grid_size']) + 'x' + str(case['grid_size']) + ' grid, coupling ' +
+            'x'.join(str(n) for n in case['max_coupling']) + ', dt ' +
+            str(case['time_step']) + ': ' + str(round(case['steps_per_second'], 1)) + ' steps/s, ' +
+            str(round(case['us_per_agv_tick'], 1)) + ' us/AGV-tick, peak RSS ' + peak_rss)
+
+
+def get_case_key(case):
+    # results of earlier versions have no coupling cases
+    return (case['n_agvs'], case['n_machines'], case['n_warehouses'], case['grid_size'],
+            tuple(case.get('max_coupling', (1, 1))), case['time_step'])
+
+
+def compare_results(old_results, new_results):
+    # prints the change of us per AGV-tick of every case contained in both result files
+    old_cases = {get_case_key(case): case for case in old_results['cases']}
+    for case in new_results['cases']:
+        old_case = old_cases.get(get_case_key(case))
+        if old_case is None:
+            continue
+        change = case['us_per_agv_tick'] / old_case['us_per_agv_tick'] - 1
+        print(format_case(case) + ' (' + ('+' if change >= 0 else '') + str(round(change * 100, 1)) + '%)')
+
+
+def main():
+    # run from the repository root: python -m Benchmark.SimulationBenchmark
+    parser = argparse.ArgumentParser(description='Headless scaling benchmark of the factory simulation')
+    parser.add_argument('--output', default=None, help='JSON file of the results '
+                                                       '(default: Benchmark/results/<date>_<time>.json)')
+    parser.add_argument('--compare', default=None, help='JSON file of an earlier run to compare with')
+    parser.add_argument('--simulation-time', type=float, default=SIMULATION_TIME, help='simulated seconds per case')
+    parser.add_argument('--max-agvs', type=int, default=None, help='skip sizes with more AGVs')
+    parser.add_argument('--time-steps', type=float, nargs='+', default=TIME_STEPS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fleet-engine', action='store_true', help='vectorized AGV kinematics')
+    args = parser.parse_args()
+
+    sizes = [size for size in SIZES if args.max_agvs is None or size[0] <= args.max_agvs]
+    results = run_benchmark(sizes, args.time_steps, args.simulation_time, args.seed, args.fleet_engine)
+
+    output = args.output
+    if output is None:
+        output = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results',
+                              time.strftime('%Y%m%d_%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print('Results written to ' + output)
+
+    if args.compare is not None:
+        with open(args.compare) as file:
+            compare_results(json.load(file), results)
+
+
+if __name__ == '__main__':
+    main()
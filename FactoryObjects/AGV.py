@@ -1,12 +1,17 @@
 import math
-import time
 import config
 
-import threading
+# attributes kept in the fleet arrays while the AGV is attached to an AGVFleet (see FleetAGV)
+FLEET_STATE = ['pos_x', 'pos_y', 'move_target', 'max_speed', 'load_speed', 'couple_speed']
 
 
 class AGV:
     def __init__(self, start_position=None):
+        # optional struct-of-arrays kinematics engine (see FactoryObjects/AGVFleet.py) - the AGV becomes a FleetAGV
+        # (view of its row in the fleet arrays) when attached
+        self.fleet = None
+        self.fleet_index = -1
+        self._coupling_master = None    # registered in factory.coupling_registry (see coupling_master setter)
         if start_position is None:
             self.start_position = [0, 0]
         else:
@@ -40,15 +45,9 @@ class AGV:
 
         self.task_number = 0      # added for NN observation    - 0 represents 'no task'
 
-        # Threading !!! There is a possibility of an asynchronous behavior. If this is happening implement frame counter
-        # TODO integrate a threading attribute (related to 'def run_with_threads(self):'-TODO)
-        self.thread_running = True
-        self.thread_waiting = True
+        # AGVs are stepped in lockstep by the LockstepScheduler of the factory (see FactoryObjects/LockstepScheduler.py)
         self.time_step = 1.0
         self.waited_time = 0.0
-        self.sleep_time = 0.00001
-        # self.run_thread = threading.Thread(target=self.run_with_threads)
-        # self.run_thread.start()
         self.step_counter_last = 0
         self.step_counter_next = 1  # was once initialized with 0
         self.coupled_size = [1, 1]
@@ -59,6 +58,32 @@ class AGV:
 
         self.waiting_in_good_position_timer = 0.0
 
+        # route over the factory grid when factory.navigation is enabled (see FactoryObjects/Navigation.py)
+        self.navigation_target = None   # target cell the waypoint belongs to
+        self.navigation_waypoint = None     # next cell on the path
+        self.navigation_wait_time = 0.0     # time waited for a reservation (see FactoryObjects/ReservationTable.py)
+
+    @property
+    def coupling_master(self):
+        return self._coupling_master
+
+    @coupling_master.setter
+    def coupling_master(self, value):
+        old_master = self._coupling_master
+        self._coupling_master = value
+        if old_master is not value and self.factory is not None:
+            self.factory.coupling_registry.update(self, old_master, value)
+
+    def attach_to_fleet(self, fleet, index):  # called by AGVFleet.attach() after the row got filled
+        for name in FLEET_STATE:
+            del self.__dict__[name]
+        self.fleet = fleet
+        self.fleet_index = index
+        self.__class__ = FleetAGV
+
+    def detach_from_fleet(self):    # see FleetAGV
+        pass
+
     def reload_settings(self):
         self.max_speed = config.agv['max_speed']
         self.length = config.agv['length']
@@ -71,7 +96,6 @@ class AGV:
         self.is_free = True
         self.step_counter_last = 0
         self.step_counter_next = 1  # was once initialized with 0
-        self.thread_waiting = True
         self.command = 'idle'
         self.status = 'idle'
         self.output_object = None
@@ -91,6 +115,9 @@ class AGV:
         self.unload_stucked_agvs = False
 
         self.waiting_in_good_position_timer = 0.0
+        self.navigation_target = None
+        self.navigation_waypoint = None
+        self.navigation_wait_time = 0.0
 
     def set_target(self, target):
         self.move_target = target
@@ -131,23 +158,13 @@ class AGV:
         self.agv_couple_count = agv_couple_count
         self.coupled_size = coupled_size
 
-    def run_with_threads(self):     # !CAUTION! compare _simulate_factory_objects in StableBaselinesLearningTest.py
-        while self.thread_running:
-            time.sleep(0.0005)    # allows up to roughly 1000 fps (1/0.0005/2)
-            if not self.thread_waiting:
-                self.step_command()
-                self.thread_waiting = True
-                self.step_counter_last = self.step_counter_next
-    # TODO create a solution with one run function (test for threading)
-
-    def run_without_threads(self):  # !CAUTION! compare _simulate_factory_objects in StableBaselinesLearningTest.py
+    def run_without_threads(self):  # called by the LockstepScheduler (masters before slaves)
         self.step_command()
         self.step_counter_last = self.step_counter_next
 
     def step(self, time_step, step_counter):
         self.step_counter_next = step_counter
         self.time_step = time_step
-        self.thread_waiting = False
 
     def step_command(self):
         if self.command == 'move':
@@ -165,19 +182,32 @@ class AGV:
         else:
             self.idle_time = 0
 
-    def move_state(self):
-        self.is_moving = True
-
+    def get_speed(self):
         speed = self.max_speed
         if self.coupling_master == self and self.status != 'move_to_coupling_position':
             speed = self.couple_speed
         if self.loaded_product is not None:
             if self.load_speed < speed:
                 speed = self.load_speed
+        return speed
+
+    def move_state(self):
+        self.is_moving = True
+
+        speed = self.get_speed()
+
+        if self.factory is not None and self.factory.navigation is not None:
+            return self.navigate_state(speed)
+
+        if self.fleet is not None:  # precomputed by AGVFleet.prepare() unless target, position or speed changed
+            arrived = self.fleet.move(self.fleet_index, speed, self.time_step)
+            if arrived is not None:
+                return arrived
 
         move_vector = [self.move_target[0] - self.pos_x, self.move_target[1] - self.pos_y]
-        distance = math.sqrt(math.pow(move_vector[0], 2) + math.pow(move_vector[1], 2))
-        if distance < (speed * self.time_step):
+        # a * a instead of math.pow(a, 2) - same arithmetic as AGVFleet.prepare (pow may differ by one ulp)
+        distance = math.sqrt(move_vector[0] * move_vector[0] + move_vector[1] * move_vector[1])
+        if distance < (speed * self.time_step) or distance == 0.0:  # == 0.0 for zero-duration (event) steps
             self.pos_x = self.move_target[0]
             self.pos_y = self.move_target[1]
             return True
@@ -189,6 +219,53 @@ class AGV:
         self.pos_y += distance_vector[1]
         return False
 
+    def navigate_state(self, speed):
+        # follows the waypoints of the factory navigation - several waypoints can be passed within one time step
+        step_distance = speed * self.time_step
+        reservations = self.factory.reservations
+        while True:
+            waypoint = self.factory.navigation.get_waypoint(self)
+            if reservations is not None and not reservations.request(self, waypoint, speed):
+                return False    # next cell is reserved by another AGV - wait
+            move_vector = [waypoint[0] - self.pos_x, waypoint[1] - self.pos_y]
+            distance = math.sqrt(move_vector[0] * move_vector[0] + move_vector[1] * move_vector[1])
+            if distance > step_distance:
+                norm = 1 / distance
+                self.pos_x += norm * move_vector[0] * step_distance
+                self.pos_y += norm * move_vector[1] * step_distance
+                return False
+            self.pos_x = waypoint[0]
+            self.pos_y = waypoint[1]
+            step_distance -= distance
+            move_target = self.move_target
+            if waypoint[0] == move_target[0] and waypoint[1] == move_target[1]:
+                self.navigation_waypoint = None
+                return True
+            self.navigation_waypoint = None
+
+    def get_time_to_next_event(self):
+        """
+        Time until the AGV changes its state by itself (used by EventSimulation).
+        :return: float - 0.0 for transitions without duration, math.inf when waiting for other objects
+        """
+        if self.command == 'move' or (self.command == 'deliver' and self.status in ['move_to_output', 'move_to_input']) \
+                or (self.command == 'coupling' and self.status == 'move_to_coupling_position'):
+            if self.factory is not None and self.factory.navigation is not None:
+                return self.factory.navigation.get_path_length(self) / self.get_speed()
+            move_target = self.move_target
+            move_vector = [move_target[0] - self.pos_x, move_target[1] - self.pos_y]
+            distance = math.sqrt(move_vector[0] * move_vector[0] + move_vector[1] * move_vector[1])
+            return distance / self.get_speed()
+        if self.command == 'deliver' and self.status in ['idle', 'load_product', 'unload_product']:
+            return 0.0
+        if self.command == 'coupling':
+            if self.status in ['idle', 'master_slave_decision']:
+                return 0.0
+            if self.status == 'wait_for_coupling' and self.is_coupling_ready():
+                return max(self.coupling_time_max - self.coupling_time, 0.0)
+        # 'idle' and 'follow_master' (slaves move with their master)
+        return math.inf
+
     def deliver_state(self):
         if self.status == 'idle':
             self.move_target = self.output_object.pos_output
@@ -204,18 +281,16 @@ class AGV:
                 # added for RL
                 self.is_free = False
                 # For RL AGVs become locked
-                for agv in self.factory.agvs:
-                    if agv.coupling_master == self:
-                        agv.is_free = False
+                for agv in self.factory.coupling_registry.get_members(self):
+                    agv.is_free = False
                 self.move_target = self.input_object.pos_input
                 self.status = 'move_to_input'
             else:
                 # added for RL
                 self.is_free = True
                 # For RL AGVs become locked
-                for agv in self.factory.agvs:
-                    if agv.coupling_master == self:
-                        agv.is_free = True
+                for agv in self.factory.coupling_registry.get_members(self):
+                    agv.is_free = True
         elif self.status == 'move_to_input':
             if self.move_state():
                 self.status = 'unload_product'
@@ -244,10 +319,21 @@ class AGV:
         return False
 
     def move_to_loading_station(self):
-        for loading_station in self.factory.loading_stations:
-            if loading_station.register_agv(self):
+        clock = self.factory.clock
+        loading_stations = self.factory.loading_stations
+        for loading_station in loading_stations:
+            if loading_station.register_agv(self, clock):
+                for other_station in loading_stations:  # the AGV got a station - it waits nowhere else
+                    if other_station is not loading_station:
+                        other_station.leave_queue(self)
                 self.set_target([loading_station.pos_x, loading_station.pos_y])
                 return
+        if not loading_stations:
+            return
+        # all stations are taken - wait in the queue the AGV is already in, otherwise in the shortest one
+        waiting_at = [loading_station for loading_station in loading_stations if loading_station.is_waiting(self)]
+        loading_station = waiting_at[0] if waiting_at else min(loading_stations, key=lambda station: len(station.queue))
+        loading_station.enqueue(self, clock)
 
     def unload_if_stuck(self):
         # self.waited_time += self.time_step
@@ -283,33 +369,27 @@ class AGV:
                 self.command = 'deliver'
                 # self.status = 'idle'  # TODO reactivate if possible (does this line break anything?)
                 self.status = 'load_product'
-                for agv in self.factory.agvs:
-                    if agv.coupling_master == self:
-                        if agv != self:
-                            agv.status = "idle"
+                for agv in self.factory.coupling_registry.get_slaves(self):
+                    agv.status = "idle"
 
     def will_coupling_be_complete(self):
-        slave_count = 0
-        for agv in self.factory.agvs:
-            if agv != self and agv.coupling_master == self:
-                slave_count += 1
+        slave_count = self.factory.coupling_registry.get_slave_count(self)
         if self.agv_couple_count == slave_count:
             return True
         elif self.agv_couple_count < slave_count:
             print("AGV", str(self), "has more assigned slaves than mandatory")
         return False
 
+    def is_coupling_ready(self):     # all slaves are waiting with the master (see is_coupling_complete)
+        slave_count = self.factory.coupling_registry.get_ready_count(self)
+        return self.agv_couple_count == slave_count
+
     def is_coupling_complete(self):
-        slave_count = 0
-        for agv in self.factory.agvs:
-            if agv != self and agv.coupling_master == self:
-                if agv.command == 'follow_master':      # necessary ?
-                    slave_count += 1
+        slave_count = self.factory.coupling_registry.get_ready_count(self)   # only slaves that follow the master
         if self.agv_couple_count == slave_count:
             # For RL AGVs become locked (coupling_process)
-            for agv in self.factory.agvs:
-                if agv.coupling_master == self:
-                    agv.is_free = False
+            for agv in self.factory.coupling_registry.get_members(self):
+                agv.is_free = False
             self.coupling_time += self.time_step
             if self.coupling_time >= self.coupling_time_max:
                 self.coupling_time = 0
@@ -324,16 +404,15 @@ class AGV:
             self.waiting_in_good_position_timer = 0.0
             warehouse_as_target = False
         if self.coupling_master is not None:
-            for agv in self.factory.agvs:
-                if agv != self and agv.coupling_master == self:     # effects slaves
-                    if not warehouse_as_target:
-                        agv.waiting_in_good_position_timer = 0.0
-                    agv.is_slave = False
-                    agv.command = 'idle'        # status of slaves is 'idle' (already)
-                    agv.is_free = True
-                    agv.task_number = 0         # nothing task
-                    agv.coupling_master = None
-                    agv.is_moving = False
+            for agv in self.factory.coupling_registry.get_slaves(self):     # effects slaves
+                if not warehouse_as_target:
+                    agv.waiting_in_good_position_timer = 0.0
+                agv.is_slave = False
+                agv.command = 'idle'        # status of slaves is 'idle' (already)
+                agv.is_free = True
+                agv.task_number = 0         # nothing task
+                agv.coupling_master = None
+                agv.is_moving = False
             self.coupling_master = None
             self.coupled_size = [1, 1]
             self.agv_couple_count = 0
@@ -396,3 +475,66 @@ class AGV:
         self.input_object = None
         self.loaded_product = None
         self.target_product = None
+
+
+class FleetAGV(AGV):
+    """
+    AGV attached to an AGVFleet (see AGVFleet.attach()): position, move target and speeds are views of its row in the
+    fleet arrays. AGVs without fleet keep them as plain attributes - only attached AGVs pay for the properties.
+    """
+    @property
+    def pos_x(self):
+        return self.fleet.get_position(self.fleet_index, 0)
+
+    @pos_x.setter
+    def pos_x(self, value):
+        self.fleet.set_position(self.fleet_index, 0, value)
+
+    @property
+    def pos_y(self):
+        return self.fleet.get_position(self.fleet_index, 1)
+
+    @pos_y.setter
+    def pos_y(self, value):
+        self.fleet.set_position(self.fleet_index, 1, value)
+
+    @property
+    def move_target(self):
+        return self.fleet.target[self.fleet_index].tolist()
+
+    @move_target.setter
+    def move_target(self, value):
+        self.fleet.target[self.fleet_index] = value
+        self.fleet.invalidate(self.fleet_index)
+
+    @property
+    def max_speed(self):
+        return self.fleet.max_speed.item(self.fleet_index)
+
+    @max_speed.setter
+    def max_speed(self, value):
+        self.fleet.max_speed[self.fleet_index] = value
+
+    @property
+    def load_speed(self):
+        return self.fleet.load_speed.item(self.fleet_index)
+
+    @load_speed.setter
+    def load_speed(self, value):
+        self.fleet.load_speed[self.fleet_index] = value
+
+    @property
+    def couple_speed(self):
+        return self.fleet.couple_speed.item(self.fleet_index)
+
+    @couple_speed.setter
+    def couple_speed(self, value):
+        self.fleet.couple_speed[self.fleet_index] = value
+
+    def detach_from_fleet(self):
+        # the AGV gets its state back as plain attributes
+        state = {name: getattr(self, name) for name in FLEET_STATE}
+        self.__class__ = AGV
+        self.fleet = None
+        self.fleet_index = -1
+        self.__dict__.update(state)
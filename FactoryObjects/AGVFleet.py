@@ -0,0 +1,126 @@
+import numpy as np
+
+
+class AGVFleet:
+    """
+    Struct-of-arrays kinematics engine for all AGVs of a factory.
+
+    Positions, targets and speeds of every attached AGV are kept in contiguous NumPy arrays (one row per AGV, the
+    AGVs become FleetAGV views of their row). prepare() advances every row in one vectorized step at the beginning
+    of a simulation step. An AGV that moves in move_state() only marks its row as moved (reads of its position
+    return the precomputed position from then on) and commit() writes all moved rows into the position array in
+    one step at the end of the simulation step (see Factory.step_agvs). Rows whose target, position, speed or time
+    step changed after prepare() are computed by the AGV itself (same formula as without the fleet engine).
+    """
+    def __init__(self, agvs=None):
+        self.agvs = []
+        self.size = 0
+        self.position = np.zeros(shape=(0, 2))
+        self.target = np.zeros(shape=(0, 2))
+        self.max_speed = np.zeros(shape=(0,))
+        self.load_speed = np.zeros(shape=(0,))
+        self.couple_speed = np.zeros(shape=(0,))
+        self.speed = np.zeros(shape=(0,))   # speed used in the last move of the AGV (see AGV.move_state)
+
+        # results of prepare() - python lists for the single item access of the AGVs (faster than numpy arrays)
+        self.next_position = np.zeros(shape=(0, 2))
+        self.next_arrived = []
+        self.prepared_speed = []
+        self.prepared_time_step = None
+        self.prepared = []  # row not changed since prepare()
+        self.moved = []     # row moved to next_position, not committed yet
+
+        if agvs is not None:
+            self.attach(agvs)
+
+    def attach(self, agvs):
+        # copies the current state of the AGVs into the arrays and turns the AGVs into views of their row
+        self.commit()
+        start = self.size
+        agvs = list(agvs)
+        self.agvs.extend(agvs)
+        self.size = len(self.agvs)
+        self.position = np.concatenate((self.position, np.array([[agv.pos_x, agv.pos_y] for agv in agvs],
+                                                                 dtype=float).reshape(-1, 2)))
+        self.target = np.concatenate((self.target, np.array([agv.move_target for agv in agvs],
+                                                             dtype=float).reshape(-1, 2)))
+        self.max_speed = np.concatenate((self.max_speed, np.array([agv.max_speed for agv in agvs], dtype=float)))
+        self.load_speed = np.concatenate((self.load_speed, np.array([agv.load_speed for agv in agvs], dtype=float)))
+        self.couple_speed = np.concatenate((self.couple_speed, np.array([agv.couple_speed for agv in agvs],
+                                                                         dtype=float)))
+        self.speed = np.concatenate((self.speed, np.array([agv.max_speed for agv in agvs], dtype=float)))
+        self.next_position = np.zeros(shape=(self.size, 2))
+        self.next_arrived = [False] * self.size
+        self.prepared_speed = [0.0] * self.size
+        self.prepared = [False] * self.size
+        self.prepared_time_step = None
+        self.moved = [False] * self.size
+        for index, agv in enumerate(agvs, start):
+            agv.attach_to_fleet(self, index)
+
+    def detach(self):
+        for agv in self.agvs:
+            agv.detach_from_fleet()
+        self.__init__()
+
+    def invalidate(self, index):
+        self.prepared[index] = False
+
+    def get_position(self, index, axis):
+        if self.moved[index]:
+            return self.next_position.item(index, axis)
+        return self.position.item(index, axis)
+
+    def set_position(self, index, axis, value):
+        if self.moved[index]:   # keeps the other coordinate of the move
+            self.position[index] = self.next_position[index]
+            self.moved[index] = False
+        self.position[index, axis] = value
+        self.prepared[index] = False
+
+    def prepare(self, time_step):
+        """
+        Advances all AGVs towards their move target in one vectorized step (see AGV.move_state).
+        :param time_step: float
+        """
+        self.commit()
+        move_vector = self.target - self.position
+        distance = np.sqrt(move_vector[:, 0] * move_vector[:, 0] + move_vector[:, 1] * move_vector[:, 1])
+        step_distance = self.speed * time_step
+        next_arrived = (distance < step_distance) | (distance == 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            norm = 1 / distance
+            # same operations in the same order as AGV.move_state to get identical floating point results
+            distance_vector = (norm[:, None] * move_vector) * self.speed[:, None] * time_step
+        self.next_position = np.where(next_arrived[:, None], self.target, self.position + distance_vector)
+        self.next_arrived = next_arrived.tolist()
+        self.prepared_speed = self.speed.tolist()
+        self.prepared_time_step = time_step
+        self.prepared = [True] * self.size
+
+    def move(self, index, speed, time_step):
+        """
+        Moves an AGV to its precomputed position (written into the position array by commit()).
+        :return: True/False (arrived) or None when the row has to be computed by the AGV itself
+        """
+        if not self.prepared[index] or time_step != self.prepared_time_step or speed != self.prepared_speed[index]:
+            self.speed[index] = speed
+            return None
+        self.prepared[index] = False    # every AGV moves once per step
+        self.moved[index] = True
+        return self.next_arrived[index]
+
+    def commit(self):
+        # writes the positions of all AGVs moved since prepare() in one step
+        if True in self.moved:
+            moved = np.array(self.moved)
+            self.position[moved] = self.next_position[moved]
+            self.moved = [False] * self.size
+
+    def get_positions(self):
+        self.commit()
+        return self.position
+
+    def get_moving_indices(self):
+        self.commit()
+        return np.flatnonzero(np.any(self.position != self.target, axis=1))
@@ -0,0 +1,74 @@
+class CouplingRegistry:
+    """
+    Maps every coupling master to the AGVs coupled to it (the master itself and its slaves), so coupling queries do
+    not have to scan all AGVs of the factory.
+
+    The registry is maintained by the AGV.coupling_master setter (used by coupling, decouple, free_from_coupling and
+    reset). Members are kept in the order of factory.agvs, so iterating over them gives the same order as the former
+    scans over factory.agvs.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.members = {}   # coupling master -> list of AGVs with agv.coupling_master == master
+        self.agv_index = {}     # AGV -> index in factory.agvs
+        self.version = 0    # incremented on every change (e.g. to skip checks while the couplings are unchanged)
+
+    def get_index(self, agv):
+        if agv not in self.agv_index:   # AGVs were added to the factory
+            self.agv_index = {factory_agv: index for index, factory_agv in enumerate(self.factory.agvs)}
+        return self.agv_index.get(agv, len(self.agv_index))
+
+    def update(self, agv, old_master, new_master):
+        self.version += 1
+        if old_master is not None:
+            members = self.members.get(old_master)
+            if members is not None and agv in members:
+                members.remove(agv)
+                if not members:
+                    del self.members[old_master]
+        if new_master is not None:
+            members = self.members.setdefault(new_master, [])
+            index = self.get_index(agv)
+            position = len(members)
+            while position > 0 and self.get_index(members[position - 1]) > index:
+                position -= 1
+            members.insert(position, agv)
+
+    def get_members(self, master):
+        """
+        :param master: AGV
+        :return: list - master (if coupled to itself) and slaves in factory order
+        """
+        if master is None:  # uncoupled AGVs are not registered
+            return [agv for agv in self.factory.agvs if agv.coupling_master is None]
+        return list(self.members.get(master, []))
+
+    def get_slaves(self, master):
+        return [agv for agv in self.members.get(master, []) if agv is not master]
+
+    def get_slave_count(self, master):
+        members = self.members.get(master, [])
+        return len(members) - 1 if master in members else len(members)
+
+    def get_ready_count(self, master):
+        # slaves that arrived at their formation position and wait for the master
+        ready_count = 0
+        for agv in self.members.get(master, []):
+            if agv is not master and agv.command == 'follow_master':
+                ready_count += 1
+        return ready_count
+
+    def get_formation_slots(self, master):
+        return [agv.coupling_formation_position for agv in self.members.get(master, [])]
+
+    def is_formation_slot_free(self, master, formation_position):
+        for agv in self.get_members(master):
+            if agv.coupling_formation_position == formation_position:
+                return False
+        return True
+
+    def get_masters(self):
+        # AGVs that are their own coupling master in factory order
+        masters = [master for master, members in self.members.items() if master in members]
+        masters.sort(key=self.get_index)
+        return masters
@@ -0,0 +1,167 @@
+import heapq
+import math
+
+
+class EventSimulation:
+    """
+    Discrete-event core for the factory simulation.
+
+    Instead of advancing in fixed time steps, the clock jumps straight to the next state change of a factory object
+    (AGV arrival, coupling completion, Machine and Warehouse process completion). The factory objects keep their
+    time-step based step() functions; a jump is performed as one step with the exact duration to the event. State
+    transitions that take no time (e.g. loading a product after arrival) are processed with steps of duration 0.0
+    until the factory settles.
+    """
+    def __init__(self, factory, step_function=None, time_tolerance=1e-9, max_settle_steps=100):
+        """
+        :param factory: Factory
+        :param step_function: function(time_step) that advances all factory objects by time_step - by default AGVs
+                              (masters first), warehouses and machines are stepped like in CustomEnvironment
+        :param time_tolerance: float - added to every jump so arrivals and completions are not lost to rounding
+        :param max_settle_steps: int - maximum number of zero-duration steps at one point in time
+        """
+        self.factory = factory
+        self.step_function = step_function if step_function is not None else self.step_objects
+        self.time_tolerance = time_tolerance
+        self.max_settle_steps = max_settle_steps
+        self.clock = 0.0
+        self.step_counter = 0
+        self.events = []    # heap of (event time, sequence number, factory object)
+        self.scheduled = {}     # factory object -> event time in the heap (older heap entries are outdated)
+        self.sequence = 0
+        self.last_signature = None
+
+    def reset(self):
+        self.clock = 0.0
+        self.step_counter = 0
+        self.events = []
+        self.scheduled = {}
+        self.sequence = 0
+        self.last_signature = None
+
+    def get_state(self):
+        # state of the clock and the event heap (see CustomEnvironment.snapshot)
+        return {'clock': self.clock, 'step_counter': self.step_counter, 'events': self.events,
+                'scheduled': self.scheduled, 'sequence': self.sequence, 'last_signature': self.last_signature}
+
+    def set_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def get_factory_objects(self):
+        return self.factory.agvs + self.factory.machines + self.factory.warehouses
+
+    def schedule(self, factory_object):
+        time_to_event = factory_object.get_time_to_next_event()
+        if time_to_event <= 0.0:
+            # zero-duration transitions are processed by settle() - if they are still pending afterwards the object
+            # waits for another object (e.g. an AGV waiting for a product) and has no own event
+            time_to_event = math.inf
+        event_time = self.clock + max(time_to_event, self.time_tolerance)
+        if self.scheduled.get(factory_object) == event_time:
+            return
+        self.scheduled[factory_object] = event_time
+        if event_time != math.inf:
+            self.sequence += 1
+            heapq.heappush(self.events, (event_time, self.sequence, factory_object))
+
+    def update_schedule(self):
+        for factory_object in self.get_factory_objects():
+            self.schedule(factory_object)
+
+    def next_event_time(self):
+        # drop heap entries that got replaced by a newer schedule of the same object
+        while self.events and self.scheduled.get(self.events[0][2]) != self.events[0][0]:
+            heapq.heappop(self.events)
+        if not self.events:
+            return math.inf
+        return self.events[0][0]
+
+    def step_objects(self, time_step):
+        for agv in self.factory.agvs:
+            agv.step(time_step, self.step_counter)
+        self.factory.step_agvs(time_step)     # masters first
+        for warehouse in self.factory.warehouses:
+            warehouse.step(time_step)
+        for machine in self.factory.machines:
+            machine.step(time_step)
+
+    def get_signature(self):
+        # everything a zero-duration step can change
+        signature = []
+        for agv in self.factory.agvs:
+            signature.append((agv.command, agv.status, agv.is_free, agv.loaded_product, agv.coupling_master))
+        for machine in self.factory.machines:
+            signature.append((machine.status, len(machine.buffer_input_load), len(machine.buffer_output_load)))
+        for warehouse in self.factory.warehouses:
+            signature.append((warehouse.status, len(warehouse.buffer_output_load), len(warehouse.end_product_store),
+                              len(warehouse.temp_store)))
+        return signature
+
+    def _step(self, time_step):
+        self.step_counter += 1
+        self.step_function(time_step)
+
+    def settle(self):
+        """
+        Processes all state transitions that take no time.
+        :return: int - number of zero-duration steps
+        """
+        signature = self.get_signature()
+        for i in range(self.max_settle_steps):
+            self._step(0.0)
+            new_signature = self.get_signature()
+            if new_signature == signature:
+                self.last_signature = new_signature
+                self.update_schedule()
+                return i + 1
+            signature = new_signature
+        print("EVENT SIMULATION: factory did not settle within " + str(self.max_settle_steps) + " steps")
+        self.last_signature = signature
+        self.update_schedule()
+        return self.max_settle_steps
+
+    def jump(self, max_duration=math.inf):
+        """
+        Advances the clock to the next event, but at most by max_duration, and settles the factory.
+        :return: float - simulated time
+        """
+        self.update_schedule()
+        event_time = self.next_event_time()
+        duration = min(event_time - self.clock, max_duration)
+        if duration == math.inf:  # nothing will happen anymore
+            return 0.0
+        if duration > 0.0:
+            if event_time - self.clock <= max_duration:
+                duration += self.time_tolerance
+            self._step(duration)
+            self.clock += duration
+        self.settle()
+        return duration
+
+    def advance_to_next_event(self, max_duration=math.inf):
+        """
+        Jumps to the next event. If the state changed from outside since the last call (e.g. new commands for AGVs)
+        the resulting zero-duration transitions are processed first.
+        :return: float - simulated time
+        """
+        if self.last_signature is None or self.get_signature() != self.last_signature:
+            self.settle()
+        return self.jump(max_duration)
+
+    def advance(self, duration):
+        """
+        Fixed-tick compatibility: advances the clock by exactly duration, stopping at every event in between.
+        :return: int - number of performed jumps
+        """
+        end_time = self.clock + duration
+        jumps = 0
+        if self.last_signature is None or self.get_signature() != self.last_signature:
+            self.settle()
+        while end_time - self.clock > self.time_tolerance:
+            elapsed = self.jump(end_time - self.clock)
+            if elapsed == 0.0:
+                self.clock = end_time   # nothing happens until end_time
+                break
+            jumps += 1
+        return jumps
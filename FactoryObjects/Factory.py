@@ -4,11 +4,18 @@ import numpy as np
 
 # own packages
 from FactoryObjects.AGV import AGV
+from FactoryObjects.AGVFleet import AGVFleet
+from FactoryObjects.CouplingRegistry import CouplingRegistry
+from FactoryObjects.FactoryGrid import FactoryGrid
+from FactoryObjects.FactorySnapshot import FactorySnapshot
 from FactoryObjects.Forklift import Forklift
 from FactoryObjects.LoadingStation import LoadingStation
+from FactoryObjects.LockstepScheduler import LockstepScheduler
 from FactoryObjects.Machine import Machine
+from FactoryObjects.Navigation import Navigation
 from FactoryObjects.Path import Path
 from FactoryObjects.Product import Product
+from FactoryObjects.ReservationTable import ReservationTable
 from FactoryObjects.Warehouse import Warehouse
 from FactoryObjects.Product import Product
 
@@ -23,6 +30,7 @@ class Factory:
         self.no_rows = int(self.width / self.cell_size)
         self.np_factory_grid_layout = np.zeros(shape=(self.no_columns, self.no_rows))   # in this matrix all the data of
         # the factory cells is stored Zeilen, Spalten
+        self.grid = FactoryGrid()   # object ids of all cells (see factory_grid_layout)
         self.factory_grid_layout = self.np_factory_grid_layout.tolist()
 
         self.agvs = []
@@ -36,6 +44,13 @@ class Factory:
         self.products_id_count = 1000  # Product id's will start upwards with 1000
 
         self.time_step = 1.0
+        self.clock = 0.0    # simulation time in seconds - advanced by step_agvs, read by the loading stations
+        self.fleet = None   # optional vectorized kinematics of all AGVs (see enable_fleet_engine)
+        self.fleet_shared = False
+        self.navigation = None  # optional obstacle-aware routing over the grid (see enable_navigation)
+        self.reservations = None    # optional space-time reservations of cells (see enable_reservations)
+        self.scheduler = LockstepScheduler(self)  # steps the AGVs (see step_agvs)
+        self.coupling_registry = CouplingRegistry(self)   # coupling master -> coupled AGVs
 
         # self.create_temp_factory_machines()
         # self.create_temp_factory_machines_2()
@@ -43,6 +58,17 @@ class Factory:
         # print(f'Factory Grid Layout: {self.factory_grid_layout}')
         # print(f'Product Types: {self.product_types}')
 
+    @property
+    def factory_grid_layout(self):
+        # factory_grid_layout[x][y] is the object in the cell or 0.0 (backed by the integer grid self.grid)
+        return self.grid.layout
+
+    @factory_grid_layout.setter
+    def factory_grid_layout(self, grid_layout):
+        # accepts a list of columns, e.g. np.zeros(shape=(self.no_columns, self.no_rows)).tolist()
+        if grid_layout is not self.grid.layout:
+            self.grid.load(grid_layout)
+
     def create_default_product_types(self):
         self.product_types['default_product_2'] = dict(length=1000, width=1000, weight=100.0)
         self.product_types['default_product_3'] = dict(length=1500, width=1000, weight=150.0)
@@ -118,7 +144,90 @@ class Factory:
             machine.reset()
         for warehouse in self.warehouses:
             warehouse.reset()
+        for loading_station in self.loading_stations:
+            loading_station.reset()
         self.products = []
+        self.clock = 0.0
+        if self.reservations is not None:
+            self.reservations.reset()
+
+    def snapshot(self, extra=None):
+        """
+        Copies the mutable simulation state of all AGVs, machines, warehouses, loading stations and products.
+        :param extra: dict - further state referencing factory objects (e.g. bookkeeping of an environment)
+        :return: FactorySnapshot - can be restored any number of times, to_bytes() gives a compact blob
+        """
+        return FactorySnapshot.capture(self, extra)
+
+    def restore(self, snapshot):
+        """
+        Sets the factory to the state of the snapshot (the layout has to be the same).
+        :param snapshot: FactorySnapshot or bytes (FactorySnapshot.to_bytes())
+        :return: decoded extra state of the snapshot or None
+        """
+        if isinstance(snapshot, bytes):
+            snapshot = FactorySnapshot.from_bytes(snapshot)
+        return snapshot.restore(self)
+
+    def enable_fleet_engine(self, fleet=None):
+        # moves all AGVs of the factory in one vectorized step - AGVs have to be created before
+        if fleet is not None:   # fleet shared by several factories - it is prepared by its owner (see VectorFactory)
+            fleet.attach(self.agvs)
+            self.fleet = fleet
+            self.fleet_shared = True
+        elif self.fleet is None:
+            self.fleet = AGVFleet(self.agvs)
+        elif len(self.fleet.agvs) < len(self.agvs):
+            self.fleet.attach(self.agvs[len(self.fleet.agvs):])
+        return self.fleet
+
+    def disable_fleet_engine(self):
+        if self.fleet is not None:
+            if self.fleet_shared:
+                for agv in self.agvs:
+                    agv.detach_from_fleet()
+            else:
+                self.fleet.detach()
+            self.fleet = None
+            self.fleet_shared = False
+
+    def enable_navigation(self):
+        # AGVs follow cached flow fields around occupied cells to cell targets (ports, loading stations)
+        if self.navigation is None:
+            self.navigation = Navigation(self)
+        self.navigation.precompute()
+        return self.navigation
+
+    def disable_navigation(self):
+        self.disable_reservations()
+        self.navigation = None
+        for agv in self.agvs:
+            agv.navigation_target = None
+            agv.navigation_waypoint = None
+
+    def enable_reservations(self, slot_duration=0.5, lookahead=3, max_wait_time=5.0, max_block_time=None):
+        # AGVs reserve the cells of their path before they drive into them (requires the navigation)
+        self.enable_navigation()
+        self.reservations = ReservationTable(self, slot_duration, lookahead, max_wait_time, max_block_time)
+        return self.reservations
+
+    def disable_reservations(self):
+        self.reservations = None
+
+    def prepare_agv_step(self, time_step):
+        # has to be called before the AGVs are stepped (see AGVFleet.prepare)
+        if self.fleet is not None and not self.fleet_shared:
+            self.fleet.prepare(time_step)
+
+    def step_agvs(self, time_step):
+        # AGV.step(time_step, step_counter) has to be called for every AGV before
+        self.prepare_agv_step(time_step)
+        if self.reservations is not None:
+            self.reservations.advance(time_step)
+        self.scheduler.step()
+        if self.fleet is not None and not self.fleet_shared:
+            self.fleet.commit()     # positions of all moved AGVs in one step
+        self.clock += time_step
 
     def create_temp_factory_machines(self):
         self.length = 10
@@ -387,7 +496,7 @@ class Factory:
         self.fill_grid()
 
     def fill_grid(self):
-        self.factory_grid_layout = np.zeros(shape=(self.no_columns, self.no_rows)).tolist()
+        self.grid.reset(self.no_columns, self.no_rows)
         for warehouse in self.warehouses:
             self.add_to_grid(warehouse)
 
@@ -398,32 +507,25 @@ class Factory:
             self.add_to_grid(loading_station)
 
     def add_to_grid(self, factor_object):
-        for y in range(factor_object.width):
-            for x in range(factor_object.length):
-                self.factory_grid_layout[factor_object.pos_x + x][factor_object.pos_y + y] = factor_object
-                # self.factory_grid_layout[factor_object.pos_y + y][factor_object.pos_x + x] = factor_object
+        self.grid.add(factor_object)
 
     def delete_from_grid(self, factory_object):
-        for y in range(factory_object.width):
-            for x in range(factory_object.length):
-                self.factory_grid_layout[factory_object.pos_x + x][factory_object.pos_y + y] = 0.0
+        self.grid.delete(factory_object)
 
     def check_collision(self, factory_object):
-        for y in range(factory_object.width):
-            for x in range(factory_object.length):
-                if self.factory_grid_layout[factory_object.pos_x + x][factory_object.pos_y + y] != 0.0 and \
-                        factory_object.name != \
-                        self.factory_grid_layout[factory_object.pos_x + x][factory_object.pos_y + y].name:
-                    # print('COLLISON!!!')
-                    return True
+        for grid_object in self.grid.get_objects_in_region(factory_object):
+            if factory_object.name != grid_object.name:
+                # print('COLLISON!!!')
+                return True
         return False
 
     def check_factory_boundaries(self, factory_object):
-        for y in range(factory_object.width):
-            for x in range(factory_object.length):
-                if factory_object.pos_x + x >= self.length or factory_object.pos_y + y >= self.width:
-                    # print('OUT OF BOUNDARIES')
-                    return True
+        if factory_object.length <= 0 or factory_object.width <= 0:
+            return False
+        if factory_object.pos_x + factory_object.length > self.length or \
+                factory_object.pos_y + factory_object.width > self.width:
+            # print('OUT OF BOUNDARIES')
+            return True
         return False
 
     def check_for_duplicate_names(self, factory_object):
@@ -451,23 +553,8 @@ class Factory:
         print(type(self.factory_grid_layout[column][row]))
 
     def get_color_grid(self):
-        color_grid = np.ones(shape=(self.no_columns, self.no_rows)).tolist()
-        for y in range(self.no_rows):
-            for x in range(self.no_columns):
-                if self.factory_grid_layout[x][y] == 0.0:
-                    color_grid[x][y] = [255, 255, 255]
-                else:
-                    color_grid[x][y] = self.factory_grid_layout[x][y].get_color()
-                    block_type = self.factory_grid_layout[x][y].get_block_type([x, y])
-                    if block_type is not None or block_type != "machine_block":
-                        if block_type == "input":
-                            color_grid[x][y] = [255, 100, 100]
-                        elif block_type == "output":
-                            color_grid[x][y] = [100, 255, 100]
-                        elif block_type == "input_output":
-                            color_grid[x][y] = [255, 0, 220]
-
-        return color_grid
+        # (no_columns, no_rows, 3) uint8 array - color_grid[x][y] is the RGB color of a cell
+        return self.grid.get_color_grid()
 
     def create_product(self, product_name):
         new_product = Product()
@@ -599,5 +686,4 @@ class Factory:
         return dict_product_types
 
     def shout_down(self):
-        for agv in self.agvs:
-            agv.thread_running = False
+        pass    # no AGV threads to stop - the AGVs are stepped by the LockstepScheduler
@@ -0,0 +1,260 @@
+import os
+import random
+from collections import deque
+
+import pandas as pd
+
+from FactoryObjects.AGV import AGV
+from FactoryObjects.Factory import Factory
+from FactoryObjects.LoadingStation import LoadingStation
+from FactoryObjects.Machine import Machine
+from FactoryObjects.Warehouse import Warehouse
+
+AGV_SIZE = 500  # mm - length and width of an AGV (see config.agv)
+# size ranges of the objects in cells: (min length, max length, min width, max width)
+MACHINE_SIZE = (2, 4, 2, 4)
+WAREHOUSE_SIZE = (3, 6, 2, 3)
+
+
+class FactoryGenerator:
+    """
+    Seeded generator of random factories of arbitrary size (e.g. for benchmarks and training on other layouts).
+
+    Warehouses, machines and loading stations are placed at random free positions of the occupancy grid with at
+    least aisle free cells between them, inputs and outputs lie on the border of the objects facing a free cell and
+    every port and loading station is checked to be reachable. The products form a routing DAG: every warehouse
+    provides a raw product, every machine turns one product into a new one (several machines may process the same
+    product) and the products no machine processes are stored in the warehouses. Product sizes vary from one AGV up
+    to max_coupling AGVs, so deliveries need coupled AGVs. The AGVs start on the first loading stations.
+    """
+    def __init__(self, seed=None, length=50, width=50, n_warehouses=2, n_machines=10, n_agvs=10,
+                 n_loading_stations=None, max_coupling=(2, 2), aisle=1, max_attempts=100):
+        """
+        :param seed: int - same seed and parameters give the same factory
+        :param length: int - number of cells in x direction (cell size 1 m)
+        :param width: int - number of cells in y direction
+        :param n_loading_stations: int - default n_agvs
+        :param max_coupling: (int, int) - maximal number of AGVs in width and length direction needed for a product
+        :param aisle: int - minimal number of free cells between two objects
+        :param max_attempts: int - layouts tried before a ValueError is raised
+        """
+        self.seed = seed
+        self.length = length
+        self.width = width
+        self.n_warehouses = n_warehouses
+        self.n_machines = n_machines
+        self.n_agvs = n_agvs
+        self.n_loading_stations = n_agvs if n_loading_stations is None else n_loading_stations
+        self.max_coupling = max_coupling
+        self.aisle = aisle
+        self.max_attempts = max_attempts
+        self.random = random.Random(seed)
+        if self.n_agvs > self.n_loading_stations:
+            raise ValueError("Every AGV needs a loading station: " + str(self.n_agvs) + " AGVs, " +
+                             str(self.n_loading_stations) + " loading stations")
+        if self.n_warehouses < 1:
+            raise ValueError("A factory needs at least one warehouse")
+
+    def generate(self, factory=None):
+        """
+        :param factory: Factory - filled in place (its objects are replaced), a new Factory if None
+        :return: Factory
+        """
+        if factory is None:
+            factory = Factory()
+        factory.length = self.length * factory.cell_size
+        factory.width = self.width * factory.cell_size
+        factory.no_columns = self.length
+        factory.no_rows = self.width
+        self.create_product_types(factory)
+        for _ in range(self.max_attempts):
+            factory.warehouses = []
+            factory.machines = []
+            factory.loading_stations = []
+            factory.agvs = []
+            factory.grid.reset(factory.no_columns, factory.no_rows)
+            if self.place_objects(factory) and self.is_connected(factory):
+                break
+        else:
+            raise ValueError("No valid layout found in " + str(self.max_attempts) + " attempts - use a larger factory "
+                             "or less objects")
+        self.create_routing(factory)
+        for index in range(self.n_agvs):
+            loading_station = factory.loading_stations[index]
+            agv = AGV([loading_station.pos_x, loading_station.pos_y])
+            agv.factory = factory
+            agv.time_step = factory.time_step
+            factory.agvs.append(agv)
+        factory.fill_grid()
+        return factory
+
+    def create_product_types(self, factory):
+        # one raw product per warehouse and one product per machine
+        factory.product_types = {}
+        for index in range(self.n_warehouses + self.n_machines):
+            agvs_width = self.random.randint(1, self.max_coupling[0])
+            agvs_length = self.random.randint(1, self.max_coupling[1])
+            # slightly smaller than the AGVs carrying it (see Factory.get_agv_needed_for_product)
+            factory.product_types['product_' + str(index + 1)] = dict(
+                length=agvs_length * AGV_SIZE - self.random.choice([0, 100, 250]),
+                width=agvs_width * AGV_SIZE - self.random.choice([0, 100, 250]),
+                weight=round(self.random.uniform(1.0, 10.0) * agvs_width * agvs_length, 1))
+
+    def create_routing(self, factory):
+        product_names = list(factory.product_types)
+        unprocessed = []    # products no machine processes yet
+        for index, warehouse in enumerate(factory.warehouses):
+            warehouse.output_products = [product_names[index]]
+            unprocessed.append(product_names[index])
+        produced = list(unprocessed)
+        for index, machine in enumerate(factory.machines):
+            if unprocessed and self.random.random() < 0.8:
+                input_product = unprocessed.pop(self.random.randrange(len(unprocessed)))
+            else:   # fork - a second machine processes an already processed product
+                input_product = self.random.choice(produced)
+            output_product = product_names[self.n_warehouses + index]
+            machine.input_products = [input_product]
+            machine.output_products = [output_product]
+            unprocessed.append(output_product)
+            produced.append(output_product)
+        for warehouse in factory.warehouses:
+            warehouse.input_products = []
+        for index, product_name in enumerate(unprocessed):
+            factory.warehouses[index % len(factory.warehouses)].input_products.append(product_name)
+        for warehouse in factory.warehouses:
+            if not warehouse.input_products:    # every warehouse takes back a finished product
+                warehouse.input_products = [self.random.choice(unprocessed)]
+            warehouse.buffer_input = [-1] * len(warehouse.input_products)
+            warehouse.buffer_output = [1] * len(warehouse.output_products)
+            warehouse.loading_time_input = [0] * len(warehouse.input_products)
+            warehouse.loading_time_output = [0] * len(warehouse.output_products)
+
+    def place_objects(self, factory):
+        for index in range(self.n_warehouses):
+            warehouse = Warehouse()
+            warehouse.id = 'W' + str(index)
+            warehouse.name = 'warehouse_' + str(index)
+            warehouse.factory = factory
+            warehouse.process_time = self.random.choice([5, 10, 15])
+            warehouse.rest_process_time = warehouse.process_time
+            if not self.place(factory, warehouse, WAREHOUSE_SIZE):
+                return False
+            factory.warehouses.append(warehouse)
+        for index in range(self.n_machines):
+            machine = Machine()
+            machine.id = 'M' + str(index)
+            machine.name = 'machine_' + str(index)
+            machine.factory = factory
+            machine.process_time = self.random.choice([10, 15, 20, 30])
+            machine.rest_process_time = machine.process_time
+            machine.buffer_input = [1]
+            machine.buffer_output = [1]
+            machine.loading_time_input = [0]
+            machine.loading_time_output = [0]
+            if not self.place(factory, machine, MACHINE_SIZE):
+                return False
+            factory.machines.append(machine)
+        for index in range(self.n_loading_stations):
+            loading_station = LoadingStation()
+            loading_station.id = 'LS' + str(index)
+            loading_station.name = 'loading_station_' + str(index)
+            if not self.place(factory, loading_station, (1, 1, 1, 1)):
+                return False
+            factory.loading_stations.append(loading_station)
+        return True
+
+    def place(self, factory, factory_object, size, tries=200):
+        """
+        Places the object at a random free position (and its ports on its border) and adds it to the grid.
+        :param size: (min length, max length, min width, max width) in cells
+        :return: bool - False if no free position was found
+        """
+        ids = factory.grid.ids
+        for _ in range(tries):
+            length = self.random.randint(size[0], size[1])
+            width = self.random.randint(size[2], size[3])
+            if length > self.length or width > self.width:
+                continue
+            pos_x = self.random.randint(0, self.length - length)
+            pos_y = self.random.randint(0, self.width - width)
+            # the object and the aisle around it have to be free
+            if ids[max(0, pos_x - self.aisle):pos_x + length + self.aisle,
+                   max(0, pos_y - self.aisle):pos_y + width + self.aisle].any():
+                continue
+            factory_object.pos_x = pos_x
+            factory_object.pos_y = pos_y
+            factory_object.length = length
+            factory_object.width = width
+            if isinstance(factory_object, LoadingStation):
+                factory.add_to_grid(factory_object)
+                return True
+            ports = self.get_port_cells(pos_x, pos_y, length, width)
+            if len(ports) < 2:
+                continue
+            factory_object.pos_input, factory_object.pos_output = [list(port) for port in self.random.sample(ports, 2)]
+            factory.add_to_grid(factory_object)
+            return True
+        return False
+
+    def get_port_cells(self, pos_x, pos_y, length, width):
+        # border cells of the object next to a cell inside the factory (AGVs dock into the port cell)
+        ports = []
+        for x in range(pos_x, pos_x + length):
+            for y in range(pos_y, pos_y + width):
+                outside = [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
+                if any(not (pos_x <= cell[0] < pos_x + length and pos_y <= cell[1] < pos_y + width) and
+                       0 <= cell[0] < self.length and 0 <= cell[1] < self.width for cell in outside):
+                    ports.append((x, y))
+        return ports
+
+    def is_connected(self, factory):
+        # all ports and loading stations can be reached over free cells (4-neighbourhood)
+        ids = factory.grid.ids
+        targets = set()
+        for factory_object in factory.warehouses + factory.machines:
+            targets.add(tuple(factory_object.pos_input))
+            targets.add(tuple(factory_object.pos_output))
+        for loading_station in factory.loading_stations:
+            targets.add((loading_station.pos_x, loading_station.pos_y))
+        start = next(((x, y) for x in range(self.length) for y in range(self.width) if ids[x, y] == 0), None)
+        if start is None:
+            return False
+        reached = {start}
+        queue = deque([start])
+        while queue:
+            x, y = queue.popleft()
+            for cell in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]:
+                if cell in reached or not (0 <= cell[0] < self.length and 0 <= cell[1] < self.width):
+                    continue
+                if cell in targets:     # ports are entered but not passed
+                    reached.add(cell)
+                elif ids[cell] == 0:
+                    reached.add(cell)
+                    queue.append(cell)
+        return targets <= reached
+
+
+def save_factory_csv(factory, folder):
+    """
+    Writes the factory in the layout of data/Saved_Factories/<name> (Factory, Product, Warehouse, Machine and
+    Loading_Station data as ';' separated csv files, see GUI/WidgetLoadFactory.py).
+    """
+    os.makedirs(folder, exist_ok=True)
+    factory_pd = pd.DataFrame([[factory.name, factory.length, factory.width, factory.cell_size]],
+                              columns=['Name', 'Length', 'Width', 'Cell_Size'])
+    factory_pd.to_csv(os.path.join(folder, 'Factory_Data.csv'), sep=';')
+    product_types_pd = pd.DataFrame([[name, product_type['length'], product_type['width'], product_type['weight']]
+                                     for name, product_type in factory.product_types.items()],
+                                    columns=['Name', 'Length (mm)', 'Width (mm)', 'Weight (kg)'])
+    product_types_pd.to_csv(os.path.join(folder, 'Product_Data.csv'), sep=';')
+    columns = ['ID', 'Name', 'Length', 'Width', 'X-Position', 'Y-Position', 'Input-Position', 'Output-Position',
+               'Input Products', 'Output Products', 'Processing Times', 'Input Buffer Sizes', 'Output Buffer Sizes',
+               'Input Loading Times', 'Output Loading Times']
+    warehouses_pd = pd.DataFrame([warehouse.create_list() for warehouse in factory.warehouses], columns=columns)
+    warehouses_pd.to_csv(os.path.join(folder, 'Warehouse_Data.csv'), sep=';')
+    machines_pd = pd.DataFrame([machine.create_list() for machine in factory.machines], columns=columns)
+    machines_pd.to_csv(os.path.join(folder, 'Machine_Data.csv'), sep=';')
+    loading_stations_pd = pd.DataFrame([loading_station.create_list() for loading_station in factory.loading_stations],
+                                       columns=['ID', 'Name', 'Length', 'Width', 'X-Position', 'Y-Position',
+                                                'Charging Time', 'Capacity'])
+    loading_stations_pd.to_csv(os.path.join(folder, 'Loading_Station_Data.csv'), sep=';')
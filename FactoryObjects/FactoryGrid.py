@@ -0,0 +1,144 @@
+import numpy as np
+
+EMPTY_CELL_COLOR = [255, 255, 255]
+BLOCK_TYPE_COLORS = {"input": [255, 100, 100], "output": [100, 255, 100], "input_output": [255, 0, 220]}
+
+
+class FactoryGrid:
+    """
+    Occupancy grid of the factory: an np.int32 array of object ids (0 = empty cell) and an id -> object table.
+
+    Placement, collision and boundary checks work on array slices instead of cell by cell loops. The former
+    list-of-lists interface (factory_grid_layout[x][y] holding an object or 0.0) is provided by GridLayout.
+    """
+    def __init__(self, no_columns=0, no_rows=0):
+        self.ids = np.zeros(shape=(no_columns, no_rows), dtype=np.int32)
+        self.objects = [None]   # id -> factory object (id 0 is the empty cell)
+        self.object_ids = {}    # factory object -> id
+        self.version = 0    # incremented on every change (e.g. to rebuild cached backgrounds)
+        self.layout = GridLayout(self)
+
+    def reset(self, no_columns, no_rows):
+        self.ids = np.zeros(shape=(no_columns, no_rows), dtype=np.int32)
+        self.objects = [None]
+        self.object_ids = {}
+        self.version += 1
+
+    def load(self, grid_layout):
+        # grid_layout: list of columns (e.g. np.zeros(shape=(no_columns, no_rows)).tolist()) with objects or 0.0
+        no_columns = len(grid_layout)
+        no_rows = len(grid_layout[0]) if no_columns > 0 else 0
+        self.reset(no_columns, no_rows)
+        try:    # fast path for empty layouts
+            if not np.any(np.array(grid_layout, dtype=float)):
+                return
+        except (TypeError, ValueError):
+            pass
+        for x in range(no_columns):
+            for y in range(no_rows):
+                if not is_empty(grid_layout[x][y]):
+                    self.set_cell(x, y, grid_layout[x][y])
+
+    def get_id(self, factory_object):
+        object_id = self.object_ids.get(factory_object)
+        if object_id is None:
+            object_id = len(self.objects)
+            self.objects.append(factory_object)
+            self.object_ids[factory_object] = object_id
+        return object_id
+
+    def get_cell(self, x, y):
+        object_id = self.ids[x, y]
+        if object_id == 0:
+            return 0.0
+        return self.objects[object_id]
+
+    def set_cell(self, x, y, value):
+        self.ids[x, y] = 0 if is_empty(value) else self.get_id(value)
+        self.version += 1
+
+    def get_region(self, factory_object):
+        # cells covered by the object (x along its length, y along its width) - clipped at the grid border
+        pos_x, pos_y = factory_object.pos_x, factory_object.pos_y
+        return self.ids[pos_x:pos_x + factory_object.length, pos_y:pos_y + factory_object.width]
+
+    def add(self, factory_object):
+        self.get_region(factory_object)[...] = self.get_id(factory_object)
+        self.version += 1
+
+    def delete(self, factory_object):
+        self.get_region(factory_object)[...] = 0
+        self.version += 1
+
+    def get_objects_in_region(self, factory_object):
+        return [self.objects[object_id] for object_id in np.unique(self.get_region(factory_object)) if object_id != 0]
+
+    def get_color_grid(self):
+        """
+        :return: np.ndarray (no_columns, no_rows, 3) uint8 - indexed like the grid: color_grid[x][y]
+        """
+        colors = np.empty(shape=(len(self.objects), 3), dtype=np.uint8)
+        colors[0] = EMPTY_CELL_COLOR
+        for object_id in range(1, len(self.objects)):
+            colors[object_id] = self.objects[object_id].get_color()
+        color_grid = colors[self.ids]
+        # inputs and outputs are the only cells with a block type
+        for object_id in range(1, len(self.objects)):
+            factory_object = self.objects[object_id]
+            for pos in [getattr(factory_object, 'pos_input', None), getattr(factory_object, 'pos_output', None)]:
+                if pos is None or len(pos) != 2:
+                    continue
+                x, y = pos
+                if 0 <= x < self.ids.shape[0] and 0 <= y < self.ids.shape[1] and self.ids[x, y] == object_id:
+                    block_type = factory_object.get_block_type([x, y])
+                    if block_type in BLOCK_TYPE_COLORS:
+                        color_grid[x, y] = BLOCK_TYPE_COLORS[block_type]
+        return color_grid
+
+    def to_list(self):
+        return [[self.get_cell(x, y) for y in range(self.ids.shape[1])] for x in range(self.ids.shape[0])]
+
+
+class GridLayout:
+    # list-of-lists view of a FactoryGrid: layout[x][y] returns the object or 0.0, layout[x][y] = value sets a cell
+    def __init__(self, grid):
+        self.grid = grid
+
+    def __getitem__(self, x):
+        return GridColumn(self.grid, x)
+
+    def __len__(self):
+        return self.grid.ids.shape[0]
+
+    def __iter__(self):
+        for x in range(len(self)):
+            yield GridColumn(self.grid, x)
+
+    def __repr__(self):
+        return repr(self.grid.to_list())
+
+
+class GridColumn:
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+
+    def __getitem__(self, y):
+        return self.grid.get_cell(self.x, y)
+
+    def __setitem__(self, y, value):
+        self.grid.set_cell(self.x, y, value)
+
+    def __len__(self):
+        return self.grid.ids.shape[1]
+
+    def __iter__(self):
+        for y in range(len(self)):
+            yield self.grid.get_cell(self.x, y)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def is_empty(value):
+    return isinstance(value, (int, float)) and value == 0
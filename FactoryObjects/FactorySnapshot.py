@@ -0,0 +1,205 @@
+import pickle
+from collections import namedtuple
+
+import numpy as np
+
+from FactoryObjects.Product import Product
+
+# mutable simulation state of the factory objects (layout, configuration and back-references are not part of it)
+AGV_STATE = ['pos_x', 'pos_y', 'move_target', 'max_speed', 'load_speed', 'couple_speed', 'is_free', 'command',
+             'status', 'idle_time', 'output_object', 'input_object', 'loaded_product', 'target_product',
+             'coupling_master', 'agv_couple_count', 'coupling_time', 'coupling_position',
+             'coupling_formation_position', 'task_number', 'time_step', 'waited_time', 'step_counter_last',
+             'step_counter_next', 'coupled_size', 'is_slave', 'unload_stucked_agvs', 'is_moving',
+             'waiting_in_good_position_timer', 'navigation_target', 'navigation_waypoint',
+             'navigation_wait_time']
+MACHINE_STATE = ['status', 'rest_process_time', 'buffer_input_load', 'buffer_output_load', 'process_object']
+WAREHOUSE_STATE = ['status', 'rest_process_time', 'buffer_input_load', 'buffer_output_load', 'process_object',
+                   'end_product_store', 'temp_store']
+LOADING_STATION_STATE = ['last_time_in_use', 'in_use_by', 'queue']
+FACTORY_STATE = ['products', 'products_id_count', 'clock']
+
+PROPERTY_NAMES = {}     # class -> names of its properties (see get_property_names)
+
+# reference to a factory object in a snapshot: kind in OBJECT_KINDS or 'product', index in the list of that kind
+ObjectRef = namedtuple('ObjectRef', ['kind', 'index'])
+OBJECT_KINDS = [('agv', 'agvs', AGV_STATE), ('machine', 'machines', MACHINE_STATE),
+                ('warehouse', 'warehouses', WAREHOUSE_STATE),
+                ('loading_station', 'loading_stations', LOADING_STATION_STATE)]
+
+
+class FactorySnapshot:
+    """
+    Copy of the mutable simulation state of a factory (see Factory.snapshot() and Factory.restore()).
+
+    References between factory objects are stored as ObjectRef (kind, index), products are stored as plain
+    attribute dicts and created anew on every restore - so one snapshot can be restored any number of times (e.g.
+    for branched rollouts) and can be restored into another factory with the same layout. Containers are copied,
+    the snapshot does not share mutable data with the factory. to_bytes() / from_bytes() pickle the encoded state
+    (e.g. to send it to another process), only load blobs you created yourself.
+    """
+    def __init__(self):
+        # kind -> list of (plain attributes, other attributes) per object: plain attributes are immutable values that
+        # are written into the __dict__ of the object at once, other attributes (properties like coupling_master or
+        # the pos_x of a FleetAGV, containers and references) are set one by one as (name, value, has references)
+        self.objects = {}
+        self.products = []  # list of product attribute dicts
+        self.factory = []
+        self.reservations = None    # encoded state of factory.reservations
+        self.extra = None   # encoded extra state (e.g. bookkeeping of the environment)
+
+    @classmethod
+    def capture(cls, factory, extra=None):
+        """
+        :param factory: Factory
+        :param extra: dict - further state that references factory objects (restored by restore())
+        :return: FactorySnapshot
+        """
+        snapshot = cls()
+        encoder = StateEncoder(factory)
+        for kind, list_name, state_names in OBJECT_KINDS:
+            snapshot.objects[kind] = [encoder.encode_object(factory_object, state_names)
+                                      for factory_object in getattr(factory, list_name)]
+        snapshot.factory = [encoder.encode(getattr(factory, name)) for name in FACTORY_STATE]
+        if factory.reservations is not None:
+            snapshot.reservations = encoder.encode(factory.reservations.get_state())
+        if extra is not None:
+            snapshot.extra = encoder.encode(extra)
+        # products may reference other products or objects - encoded last, the table grows while encoding
+        index = 0
+        while index < len(encoder.products):
+            snapshot.products.append(encoder.encode(vars(encoder.products[index])))
+            index += 1
+        return snapshot
+
+    def restore(self, factory):
+        """
+        Writes the state into the factory (same layout: number and order of AGVs, machines, warehouses, ...).
+        :return: decoded extra state or None
+        """
+        decoder = StateDecoder(factory, len(self.products))
+        for product, product_state in zip(decoder.products, self.products):
+            product.__dict__.update(decoder.decode(product_state))
+        for kind, list_name, state_names in OBJECT_KINDS:
+            factory_objects = getattr(factory, list_name)
+            if len(factory_objects) != len(self.objects[kind]):
+                raise ValueError("Snapshot does not match the factory layout: " + str(len(self.objects[kind])) +
+                                 " " + list_name + " in the snapshot, " + str(len(factory_objects)) + " in the factory")
+            for factory_object, (plain_state, other_state) in zip(factory_objects, self.objects[kind]):
+                properties = get_property_names(type(factory_object))
+                if properties.isdisjoint(plain_state):
+                    factory_object.__dict__.update(plain_state)
+                else:   # captured from an object without these properties (e.g. AGV and FleetAGV)
+                    for name, value in plain_state.items():
+                        setattr(factory_object, name, value)
+                for name, value, has_references in other_state:
+                    if has_references:
+                        value = decoder.decode(value)
+                    elif isinstance(value, list):
+                        value = value[:]
+                    setattr(factory_object, name, value)
+        for name, value in zip(FACTORY_STATE, self.factory):
+            setattr(factory, name, decoder.decode(value))
+        if self.reservations is not None and factory.reservations is not None:
+            factory.reservations.set_state(decoder.decode(self.reservations))
+        if self.extra is None:
+            return None
+        return decoder.decode(self.extra)
+
+    def to_bytes(self):
+        return pickle.dumps((self.objects, self.products, self.factory, self.reservations, self.extra),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def from_bytes(cls, data):
+        # unpickles data - never use it on data from untrusted sources (pickle can execute arbitrary code)
+        snapshot = cls()
+        snapshot.objects, snapshot.products, snapshot.factory, snapshot.reservations, snapshot.extra = \
+            pickle.loads(data)
+        return snapshot
+
+
+class StateEncoder:
+    # replaces factory objects and products by ObjectRef and copies containers
+    def __init__(self, factory):
+        self.refs = {id(factory): ObjectRef('factory', 0)}
+        for kind, list_name, _ in OBJECT_KINDS:
+            for index, factory_object in enumerate(getattr(factory, list_name)):
+                self.refs[id(factory_object)] = ObjectRef(kind, index)
+        self.products = []
+
+    def encode_object(self, factory_object, state_names):
+        plain_state = {}
+        other_state = []
+        object_class = type(factory_object)
+        for name in state_names:
+            value = getattr(factory_object, name)
+            if not is_immutable(value):
+                other_state.append((name, self.encode(value), not is_flat(value)))
+            elif isinstance(getattr(object_class, name, None), property):
+                other_state.append((name, value, False))
+            else:
+                plain_state[name] = value
+        return plain_state, other_state
+
+    def encode(self, value):
+        if is_immutable(value):
+            return value
+        ref = self.refs.get(id(value))
+        if ref is not None:
+            return ref
+        if isinstance(value, list):
+            return [self.encode(item) for item in value]
+        if isinstance(value, tuple):
+            return tuple(self.encode(item) for item in value)
+        if isinstance(value, dict):
+            return {self.encode(key): self.encode(item) for key, item in value.items()}
+        if isinstance(value, Product):
+            ref = ObjectRef('product', len(self.products))
+            self.refs[id(value)] = ref
+            self.products.append(value)
+            return ref
+        if isinstance(value, np.ndarray):
+            return value.copy()
+        return value
+
+
+class StateDecoder:
+    def __init__(self, factory, n_products):
+        self.products = [Product.__new__(Product) for _ in range(n_products)]
+        self.objects = {'factory': [factory], 'product': self.products}
+        for kind, list_name, _ in OBJECT_KINDS:
+            self.objects[kind] = getattr(factory, list_name)
+
+    def decode(self, value):
+        if is_immutable(value):
+            return value
+        if isinstance(value, ObjectRef):
+            return self.objects[value.kind][value.index]
+        if isinstance(value, list):
+            return [self.decode(item) for item in value]
+        if isinstance(value, tuple):
+            return tuple(self.decode(item) for item in value)
+        if isinstance(value, dict):
+            return {self.decode(key): self.decode(item) for key, item in value.items()}
+        if isinstance(value, np.ndarray):
+            return value.copy()
+        return value
+
+
+def get_property_names(object_class):
+    property_names = PROPERTY_NAMES.get(object_class)
+    if property_names is None:
+        property_names = frozenset(name for name in dir(object_class)
+                                   if isinstance(getattr(object_class, name, None), property))
+        PROPERTY_NAMES[object_class] = property_names
+    return property_names
+
+
+def is_immutable(value):
+    return value is None or isinstance(value, (bool, int, float, str))
+
+
+def is_flat(value):
+    # immutable value or list of immutable values (copied without decoding)
+    return is_immutable(value) or (type(value) is list and all(is_immutable(item) for item in value))
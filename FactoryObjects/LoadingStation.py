@@ -1,4 +1,4 @@
-import time
+import math
 
 import config
 
@@ -14,9 +14,10 @@ class LoadingStation:
         self.charging_time = config.loading_station['charging_time']
         self.capacity = config.loading_station['capacity']
         self.list = []
-        self.last_time_in_use = time.time()
+        self.last_time_in_use = -math.inf   # simulation time (see Factory.clock)
         self.in_use_by = None
-        self.logout_time = 10  # seconds
+        self.logout_time = 10  # seconds of simulation time without registration until another AGV may register
+        self.queue = []     # (agv, expiry time) of the AGVs waiting for the station, first come first served
 
     def create_list(self):
         self.list = []
@@ -36,12 +37,46 @@ class LoadingStation:
     def get_color(self):
         return [255, 230, 0]
 
-    def register_agv(self, agv):
-        if agv == self.in_use_by:
-            self.last_time_in_use = time.time()
+    def reset(self):
+        self.last_time_in_use = -math.inf
+        self.in_use_by = None
+        self.queue = []
+
+    def expire(self, clock):
+        # releases the station and drops waiting AGVs that did not register within logout_time
+        if self.in_use_by is not None and clock - self.last_time_in_use > self.logout_time:
+            self.in_use_by = None
+        self.queue = [(agv, expiry) for agv, expiry in self.queue if expiry >= clock]
+
+    def register_agv(self, agv, clock):
+        """
+        The AGV keeps the station as long as it registers again within logout_time. A free station is assigned to the
+        first waiting AGV of the queue (see enqueue), to any AGV if nobody waits.
+        :param clock: float - simulation time in seconds (see Factory.clock)
+        :return: bool - station is assigned to the AGV
+        """
+        self.expire(clock)
+        if agv is self.in_use_by:
+            self.last_time_in_use = clock
             return True
-        if time.time() - self.last_time_in_use > self.logout_time:
-            self.last_time_in_use = time.time()
+        if self.in_use_by is None and (not self.queue or self.queue[0][0] is agv):
+            self.leave_queue(agv)
+            self.last_time_in_use = clock
             self.in_use_by = agv
             return True
         return False
+
+    def enqueue(self, agv, clock):
+        # the AGV waits for the station - it stays in the queue as long as it enqueues again within logout_time
+        expiry = clock + self.logout_time
+        for index, (waiting_agv, _) in enumerate(self.queue):
+            if waiting_agv is agv:
+                self.queue[index] = (agv, expiry)
+                return
+        self.queue.append((agv, expiry))
+
+    def leave_queue(self, agv):
+        self.queue = [(waiting_agv, expiry) for waiting_agv, expiry in self.queue if waiting_agv is not agv]
+
+    def is_waiting(self, agv):
+        return any(waiting_agv is agv for waiting_agv, _ in self.queue)
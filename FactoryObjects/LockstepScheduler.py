@@ -0,0 +1,34 @@
+class LockstepScheduler:
+    """
+    Steps the AGVs of a factory in lockstep - replaces the per AGV threads (busy waiting with time.sleep) and the
+    polling until all AGVs are synchronized.
+
+    Every step has two phases: coupling masters first, then all other AGVs (same order as before). All AGVs are
+    stepped one after another in the caller thread in factory order, so the results are deterministic and no sleeps
+    are needed.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+
+    @staticmethod
+    def step_phase(agvs):
+        for agv in agvs:
+            agv.run_without_threads()
+
+    def step(self):
+        # AGV.step(time_step, step_counter) has to be called for every AGV before
+        masters = []
+        slaves = []
+        for agv in self.factory.agvs:   # simulate masters first
+            if agv.coupling_master == agv:
+                masters.append(agv)
+            else:
+                slaves.append(agv)
+        self.step_phase(masters)
+        self.step_phase(slaves)
+
+    def is_synchronized(self, step_counter):
+        for agv in self.factory.agvs:
+            if agv.step_counter_last != step_counter:
+                return False
+        return True
@@ -1,3 +1,5 @@
+import math
+
 import config
 import numpy as np
 
@@ -178,7 +180,7 @@ class Machine:
                 self.status = 'idle'
 
     def process(self, time):
-        if self.rest_process_time == self.process_time:
+        if self.process_object is None:     # first process step (rest_process_time == process_time)
             self.process_object = self.buffer_input_load[0]
             self.buffer_input_load.pop(0)
             self.factory.change_product(self.process_object, self.output_products[0])
@@ -188,6 +190,15 @@ class Machine:
             return self.unload_process_buffer()
         return False
 
+    def get_time_to_next_event(self):
+        # used by EventSimulation: 0.0 for transitions without duration, math.inf when waiting for other objects
+        if self.status == 'idle':
+            if self.rest_process_time == self.process_time and len(self.buffer_input_load) > 0:
+                return self.process_time
+        elif self.status == 'process':
+            return max(self.rest_process_time, 0.0)
+        return math.inf
+
     def unload_process_buffer(self):
         if len(self.buffer_output_load) < self.buffer_output[0]:
             self.rest_process_time = self.process_time
@@ -0,0 +1,178 @@
+import heapq
+import math
+
+import numpy as np
+
+# 8-neighbourhood: (dx, dy, cost) - diagonal moves must not cut the corner of an occupied cell
+NEIGHBORS = [(1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+             (1, 1, math.sqrt(2)), (1, -1, math.sqrt(2)), (-1, 1, math.sqrt(2)), (-1, -1, math.sqrt(2))]
+
+
+class FlowField:
+    """
+    Shortest paths of all grid cells to one target cell: distance[x, y] is the path length to the target,
+    next_cell[x, y] the neighbouring cell to drive to next (-1 for the target and unreachable cells).
+    """
+    def __init__(self, distance, next_cell):
+        self.distance = distance
+        self.next_cell = next_cell
+
+
+class Navigation:
+    """
+    Obstacle-aware routing of AGVs over the occupancy grid of the factory (see Factory.enable_navigation()).
+
+    Every target cell (machine and warehouse ports, loading stations, ...) gets a flow field computed once with
+    Dijkstra from the target over all free cells. The fields are cached until the factory grid changes, so an AGV
+    only looks up the next cell of its path per waypoint - routing costs do not grow with the fleet size.
+    Cells occupied by machines, warehouses and loading stations are blocked except for the target cell itself (AGVs
+    dock into the port cells). Targets that are no grid cell (e.g. coupling positions between cells) and slaves
+    following their master are driven to in a straight line as before.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.fields = {}    # target cell (x, y) -> FlowField
+        self.blocked = None     # cells occupied by factory objects
+        self.grid_version = None
+
+    def get_target_cells(self):
+        target_cells = []
+        for factory_object in self.factory.warehouses + self.factory.machines:
+            target_cells.append(tuple(factory_object.pos_input))
+            target_cells.append(tuple(factory_object.pos_output))
+        for loading_station in self.factory.loading_stations:
+            target_cells.append((loading_station.pos_x, loading_station.pos_y))
+        return [cell for cell in target_cells if self.is_inside(cell)]
+
+    def precompute(self):
+        for target in self.get_target_cells():
+            self.get_field(target)
+
+    def is_inside(self, cell):
+        no_columns, no_rows = self.factory.grid.ids.shape
+        return 0 <= cell[0] < no_columns and 0 <= cell[1] < no_rows
+
+    def update_grid(self):
+        if self.grid_version != self.factory.grid.version:  # layout changed
+            self.fields = {}
+            self.blocked = self.factory.grid.ids != 0
+            self.grid_version = self.factory.grid.version
+
+    def get_field(self, target):
+        self.update_grid()
+        field = self.fields.get(target)
+        if field is None:
+            field = self.compute_field(target)
+            self.fields[target] = field
+        return field
+
+    def compute_field(self, target):
+        self.update_grid()
+        blocked = self.blocked.copy()
+        blocked[target] = False
+        no_columns, no_rows = blocked.shape
+        distance = np.full(shape=(no_columns, no_rows), fill_value=math.inf)
+        next_cell = np.full(shape=(no_columns, no_rows, 2), fill_value=-1, dtype=np.int32)
+        distance[target] = 0.0
+        queue = [(0.0, target)]
+        while queue:
+            cell_distance, (x, y) = heapq.heappop(queue)
+            if cell_distance > distance[x, y]:
+                continue
+            for dx, dy, cost in NEIGHBORS:
+                neighbor_x, neighbor_y = x + dx, y + dy
+                if not (0 <= neighbor_x < no_columns and 0 <= neighbor_y < no_rows) or blocked[neighbor_x, neighbor_y]:
+                    continue
+                if dx != 0 and dy != 0 and (blocked[x + dx, y] or blocked[x, y + dy]):
+                    continue
+                new_distance = cell_distance + cost
+                if new_distance < distance[neighbor_x, neighbor_y]:
+                    distance[neighbor_x, neighbor_y] = new_distance
+                    next_cell[neighbor_x, neighbor_y] = (x, y)
+                    heapq.heappush(queue, (new_distance, (neighbor_x, neighbor_y)))
+        return FlowField(distance, next_cell)
+
+    def get_neighbors(self, cell):
+        # free neighbouring cells that can be driven to from cell
+        self.update_grid()
+        blocked = self.blocked
+        neighbors = []
+        for dx, dy, _ in NEIGHBORS:
+            neighbor = (cell[0] + dx, cell[1] + dy)
+            if not self.is_inside(neighbor) or blocked[neighbor]:
+                continue
+            if dx != 0 and dy != 0 and (blocked[cell[0] + dx, cell[1]] or blocked[cell[0], cell[1] + dy]):
+                continue
+            neighbors.append(neighbor)
+        return neighbors
+
+    def get_target_cell(self, move_target):
+        # grid cell of move_target (nearest cell for positions between cells) or None outside of the grid
+        cell = (int(math.floor(move_target[0] + 0.5)), int(math.floor(move_target[1] + 0.5)))
+        return cell if self.is_inside(cell) else None
+
+    def get_next_cell(self, position, target):
+        """
+        :param position: [x, y] - position of the AGV (may lie between cells)
+        :return: (x, y) - next cell on the way to target, target if there is no path
+        """
+        cell = (int(math.floor(position[0] + 0.5)), int(math.floor(position[1] + 0.5)))
+        if cell == target or not self.is_inside(cell):
+            return target
+        field = self.get_field(target)
+        if field.distance[cell] != math.inf:
+            return int(field.next_cell[cell][0]), int(field.next_cell[cell][1])
+        # AGV stands on an occupied cell (e.g. a port it just left or a formation position) - leave it over the
+        # neighbour with the shortest way to the target
+        best_cell = target
+        best_distance = math.inf
+        for dx, dy, _ in NEIGHBORS:
+            neighbor = (cell[0] + dx, cell[1] + dy)
+            if self.is_inside(neighbor) and field.distance[neighbor] != math.inf:
+                distance = math.sqrt(math.pow(neighbor[0] - position[0], 2) + math.pow(neighbor[1] - position[1], 2))
+                if distance + field.distance[neighbor] < best_distance:
+                    best_cell = neighbor
+                    best_distance = distance + field.distance[neighbor]
+        return best_cell
+
+    def get_waypoint(self, agv):
+        """
+        :return: [x, y] - position the AGV drives to next, the last waypoint is move_target itself (it may lie
+                 between cells, e.g. coupling positions)
+        """
+        move_target = agv.move_target
+        target = self.get_target_cell(move_target) if agv.command != 'follow_master' else None
+        if target is None:
+            agv.navigation_waypoint = None
+            return move_target
+        waypoint = agv.navigation_waypoint
+        # waypoints are neighbouring cells - anything else is left over from an earlier route (e.g. as slave)
+        if agv.navigation_target != target or waypoint is None or abs(waypoint[0] - agv.pos_x) > 1.0 or \
+                abs(waypoint[1] - agv.pos_y) > 1.0:
+            next_cell = self.get_next_cell([agv.pos_x, agv.pos_y], target)
+            agv.navigation_target = target
+            if next_cell == target:
+                agv.navigation_waypoint = [move_target[0], move_target[1]]
+            else:
+                agv.navigation_waypoint = [next_cell[0], next_cell[1]]
+        return agv.navigation_waypoint
+
+    def get_path_length(self, agv):
+        # remaining length of the path of the AGV to its move target
+        waypoint = self.get_waypoint(agv)
+        length = math.sqrt(math.pow(waypoint[0] - agv.pos_x, 2) + math.pow(waypoint[1] - agv.pos_y, 2))
+        move_target = agv.move_target
+        if waypoint[0] == move_target[0] and waypoint[1] == move_target[1]:
+            return length
+        # walk the cached path - the last leg goes from the cell next to the target cell to move_target
+        target = agv.navigation_target
+        field = self.get_field(target)
+        cell = (waypoint[0], waypoint[1])
+        while True:
+            next_cell = (int(field.next_cell[cell][0]), int(field.next_cell[cell][1]))
+            if next_cell[0] < 0:    # unreachable
+                return length
+            if next_cell == target:
+                return length + math.sqrt(math.pow(move_target[0] - cell[0], 2) + math.pow(move_target[1] - cell[1], 2))
+            length += math.sqrt(math.pow(next_cell[0] - cell[0], 2) + math.pow(next_cell[1] - cell[1], 2))
+            cell = next_cell
@@ -0,0 +1,209 @@
+import math
+
+
+class ReservationTable:
+    """
+    Space-time reservations of grid cells for conflict-free AGV movement (see Factory.enable_reservations()).
+
+    Reservations are kept in a hash map (x, y, time slot) -> AGV. A navigating AGV reserves the next lookahead cells
+    of its path (see Navigation) with the time slots it will need them and only drives into a cell it holds. AGVs
+    that stand still keep their cell reserved. Coupled formations reserve the cells covered by the whole formation,
+    slaves do not reserve cells of their own. Every AGV only touches its own few reservations per step, so the costs
+    grow linear with the fleet size - there are no pairwise collision checks.
+
+    An AGV that can not enter its next cell waits. After max_wait_time it looks for a detour over a free neighbour
+    cell every step until it can drive on, so AGVs never drive into a reserved cell. AGVs blocked for good (e.g. by
+    an AGV parked on a port) wait until the cell is released - with max_block_time they drive on without reservation
+    after that time instead (counted in conflicts, the movement is no longer conflict-free).
+    """
+    def __init__(self, factory, slot_duration=0.5, lookahead=3, max_wait_time=5.0, max_block_time=None):
+        """
+        :param factory: Factory
+        :param slot_duration: float - length of a time slot in seconds
+        :param lookahead: int - number of path cells reserved ahead
+        :param max_wait_time: float - waiting time in seconds before a detour is planned
+        :param max_block_time: float - waiting time in seconds before an AGV drives on without reservation, None
+            waits until the cell is free
+        """
+        self.factory = factory
+        self.slot_duration = slot_duration
+        self.lookahead = lookahead
+        self.max_wait_time = max_wait_time
+        self.max_block_time = max_block_time
+        self.clock = 0.0
+        self.cells = {}     # (x, y, slot) -> AGV, slot None for standing AGVs
+        self.agv_keys = {}  # AGV -> keys of its reservations
+        self.conflicts = 0  # moves without reservation (see class description)
+
+    def reset(self):
+        self.clock = 0.0
+        self.cells = {}
+        self.agv_keys = {}
+        self.conflicts = 0
+
+    def get_slot(self, time):
+        return int(math.floor(time / self.slot_duration + 1e-9))
+
+    def advance(self, time_step):
+        # called once per step before the AGVs are stepped (see Factory.step_agvs)
+        self.clock += time_step
+        for agv in self.factory.agvs:
+            if agv.command == 'follow_master':   # covered by the footprint of the master
+                if agv in self.agv_keys:
+                    self.release(agv)
+            elif not agv.is_moving or agv.navigation_waypoint is None:  # not on its way (e.g. loading at a port)
+                self.hold(agv)
+
+    def release(self, agv):
+        for key in self.agv_keys.pop(agv, []):
+            if self.cells.get(key) is agv:
+                del self.cells[key]
+
+    def get_cells(self, position):
+        # cells covered by an AGV at position - up to four if it stands between cells
+        x = round(position[0], 6)
+        y = round(position[1], 6)
+        columns = {int(math.floor(x)), int(math.ceil(x))}
+        rows = {int(math.floor(y)), int(math.ceil(y))}
+        return [(column, row) for column in columns for row in rows]
+
+    def get_footprint(self, agv, cells):
+        # cells covered by the AGV (and its slaves if it is a coupling master)
+        if agv.coupling_master is not agv:
+            return cells
+        cell_size = self.factory.cell_size * 1000
+        extent_x = max(1, int(math.ceil(agv.coupled_size[0] * agv.width / cell_size)))
+        extent_y = max(1, int(math.ceil(agv.coupled_size[1] * agv.length / cell_size)))
+        return list({(cell[0] + x, cell[1] + y) for cell in cells for x in range(extent_x) for y in range(extent_y)})
+
+    def get_owner(self, agv, key):
+        # other AGV holding the reservation - members of the same formation do not block each other
+        owner = self.cells.get(key)
+        if owner is None or owner is agv:
+            return None
+        if agv.coupling_master is not None and owner.coupling_master is agv.coupling_master:
+            return None
+        return owner
+
+    def is_free(self, agv, cells, first_slot, last_slot):
+        for cell in self.get_footprint(agv, cells):
+            if self.get_owner(agv, (cell[0], cell[1], None)) is not None:     # AGV standing in the cell
+                return False
+            for slot in range(first_slot, last_slot + 1):
+                if self.get_owner(agv, (cell[0], cell[1], slot)) is not None:
+                    return False
+        return True
+
+    def add(self, agv, cells, first_slot, last_slot, keys):
+        for cell in self.get_footprint(agv, cells):
+            for slot in range(first_slot, last_slot + 1):
+                key = (cell[0], cell[1], slot)
+                self.cells[key] = agv
+                keys.append(key)
+
+    def hold(self, agv):
+        # standing AGVs keep their cells until they move again (slot None)
+        self.release(agv)
+        keys = []
+        for cell in self.get_footprint(agv, self.get_cells([agv.pos_x, agv.pos_y])):
+            key = (cell[0], cell[1], None)
+            self.cells[key] = agv
+            keys.append(key)
+        self.agv_keys[agv] = keys
+
+    def reserve(self, agv, path, speed):
+        """
+        Reserves the cells covered by the AGV and the positions of its path as far as they are free. A path position
+        is reserved from the time the AGV leaves the position before until it has passed it.
+        :param path: list of [x, y] - next waypoint first
+        :param speed: float - cells per second
+        :return: int - number of reserved path positions
+        """
+        if speed <= 0.0:    # the AGV can not move
+            self.hold(agv)
+            return 0
+        self.release(agv)
+        keys = []
+        cells = self.get_cells([agv.pos_x, agv.pos_y])
+        slot = self.get_slot(self.clock)
+        crossing_time = 1.0 / speed
+        time = self.clock
+        position = [agv.pos_x, agv.pos_y]
+        reserved = 0
+        for waypoint in path[:self.lookahead]:
+            arrival_time = time + math.sqrt(math.pow(waypoint[0] - position[0], 2) +
+                                            math.pow(waypoint[1] - position[1], 2)) / speed
+            # cells of the waypoint and the cells swept on the way to it (corners of diagonal moves)
+            middle = [(waypoint[0] + position[0]) / 2, (waypoint[1] + position[1]) / 2]
+            waypoint_cells = list(set(self.get_cells(waypoint) + self.get_cells(middle)))
+            first_slot = self.get_slot(time)
+            last_slot = self.get_slot(arrival_time + crossing_time)
+            # cells the AGV already covers are held by it
+            if not self.is_free(agv, [cell for cell in waypoint_cells if cell not in cells], first_slot, last_slot):
+                break
+            self.add(agv, waypoint_cells, first_slot, last_slot, keys)
+            reserved += 1
+            if reserved == 1:   # the current cells are left on the way to the first waypoint
+                self.add(agv, cells, slot, max(slot + 1, self.get_slot(arrival_time)), keys)
+            time = arrival_time
+            position = waypoint
+        if reserved == 0:
+            self.hold(agv)
+            return 0
+        self.agv_keys[agv] = keys
+        return reserved
+
+    def request(self, agv, waypoint, speed):
+        """
+        Called by a navigating AGV before it drives to its next waypoint.
+        :return: True if the AGV may drive to the waypoint
+        """
+        navigation = self.factory.navigation
+        path = [waypoint]
+        target = agv.navigation_target
+        while len(path) < self.lookahead and target is not None:
+            cell = (int(math.floor(path[-1][0] + 0.5)), int(math.floor(path[-1][1] + 0.5)))
+            if cell == target:
+                break
+            next_cell = navigation.get_next_cell(path[-1], target)
+            if next_cell == cell:
+                break
+            path.append(next_cell if next_cell != target else agv.move_target)
+        if self.reserve(agv, path, speed) > 0:
+            agv.navigation_wait_time = 0.0
+            return True
+        agv.navigation_wait_time += agv.time_step
+        if self.max_block_time is not None and agv.navigation_wait_time >= self.max_block_time:
+            self.conflicts += 1
+            agv.navigation_wait_time = 0.0
+            return True
+        if agv.navigation_wait_time >= self.max_wait_time:
+            detour = self.get_detour(agv, target)
+            if detour is not None:
+                agv.navigation_waypoint = [detour[0], detour[1]]
+        return False
+
+    def get_detour(self, agv, target):
+        # free neighbour cell with the shortest remaining way to the target (may lead away from the target)
+        if target is None:
+            return None
+        cell = (int(math.floor(agv.pos_x + 0.5)), int(math.floor(agv.pos_y + 0.5)))
+        field = self.factory.navigation.get_field(target)
+        slot = self.get_slot(self.clock)
+        best_cell = None
+        best_distance = math.inf
+        for neighbor in self.factory.navigation.get_neighbors(cell):
+            if field.distance[neighbor] < best_distance and \
+                    self.is_free(agv, self.get_cells([(cell[0] + neighbor[0]) / 2, (cell[1] + neighbor[1]) / 2]),
+                                 slot, slot + 1):
+                best_cell = neighbor
+                best_distance = field.distance[neighbor]
+        return best_cell
+
+    def get_state(self):
+        # see FactorySnapshot
+        return {'clock': self.clock, 'cells': self.cells, 'agv_keys': self.agv_keys, 'conflicts': self.conflicts}
+
+    def set_state(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
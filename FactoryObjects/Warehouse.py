@@ -1,3 +1,5 @@
+import math
+
 import config
 import numpy as np
 
@@ -129,6 +131,15 @@ class Warehouse:
             return True
         return False
 
+    def get_time_to_next_event(self):
+        # used by EventSimulation: 0.0 for transitions without duration, math.inf when waiting for other objects
+        if self.rest_process_time > 0.0 and self.rest_process_time != self.process_time:
+            return self.rest_process_time
+        for i in range(len(self.output_products)):  # same selection as process()
+            if len(self.buffer_output_load) < self.buffer_output[i]:
+                return max(self.rest_process_time, 0.0)
+        return math.inf
+
     def find_output_product(self, product_name):
         for output_product_name in self.output_products:
             if product_name == output_product_name:
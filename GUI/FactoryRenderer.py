@@ -0,0 +1,129 @@
+from collections import Counter
+
+import numpy as np
+import pygame
+
+AGV_COLOR = (0, 0, 0)
+PRODUCT_COLOR = (180, 180, 0)
+TEXT_COLOR = (0, 0, 0)
+
+
+class FactoryRenderer:
+    """
+    Draws a factory on a pygame screen (grid, AGVs, loaded products, machine and warehouse labels).
+
+    The static layout is drawn once into a background surface and only rebuilt when the factory grid changes. Every
+    frame the overlays (AGVs, products, labels) are compared with the ones of the frame before: only the rectangles of
+    overlays that moved or changed are restored from the background, redrawn (with every overlay touching them) and
+    passed to pygame.display.update. Fonts and rendered texts are cached.
+    """
+    def __init__(self, factory, screen, pixel_size, reference_size, font_name='arial', font_size=20):
+        """
+        :param factory: Factory
+        :param screen: pygame display surface
+        :param pixel_size: int - pixels per grid cell
+        :param reference_size: float - size of a grid cell in mm (AGV and product dimensions)
+        """
+        self.factory = factory
+        self.screen = screen
+        self.pixel_size = pixel_size
+        self.reference_size = reference_size
+        self.font = pygame.font.SysFont(font_name, font_size)
+        self.glyphs = {}    # text -> rendered surface
+        self.max_glyphs = 1024
+        self.background = None
+        self.grid_version = None
+        self.items = []     # overlays of the last frame
+
+    def invalidate(self):
+        # the next draw() repaints the whole screen
+        self.background = None
+
+    def get_glyph(self, text):
+        glyph = self.glyphs.get(text)
+        if glyph is None:
+            if len(self.glyphs) >= self.max_glyphs:
+                self.glyphs = {}
+            glyph = self.font.render(text, True, TEXT_COLOR)
+            self.glyphs[text] = glyph
+        return glyph
+
+    def build_background(self):
+        self.background = pygame.Surface(self.screen.get_size(), 0, self.screen)
+        self.background.fill((0, 0, 0))
+        # color_grid[x][y] - cells outside the screen are not drawn
+        color_grid = self.factory.get_color_grid()
+        no_columns = min(color_grid.shape[0], self.screen.get_width() // self.pixel_size)
+        no_rows = min(color_grid.shape[1], self.screen.get_height() // self.pixel_size)
+        if no_columns > 0 and no_rows > 0:
+            pixels = np.repeat(np.repeat(color_grid[:no_columns, :no_rows], self.pixel_size, axis=0),
+                               self.pixel_size, axis=1)
+            grid_area = self.background.subsurface((0, 0, no_columns * self.pixel_size, no_rows * self.pixel_size))
+            pygame.surfarray.blit_array(grid_area, pixels)
+        self.grid_version = self.factory.grid.version
+
+    def get_items(self):
+        """
+        :return: list of overlays in drawing order - ('rect', rect, color, border_radius) or ('text', rect, text)
+        """
+        items = []
+        scale = self.pixel_size / self.reference_size
+        for agv in self.factory.agvs:
+            rect = pygame.Rect(agv.pos_x * self.pixel_size, agv.pos_y * self.pixel_size,
+                               agv.width * scale, agv.length * scale)
+            items.append(('rect', tuple(rect), AGV_COLOR, 3))
+        for agv in self.factory.agvs:
+            if agv.loaded_product is not None:
+                rect = pygame.Rect(agv.pos_x * self.pixel_size + 2, agv.pos_y * self.pixel_size + 2,
+                                   agv.loaded_product.width * scale, agv.loaded_product.length * scale)
+                items.append(('rect', tuple(rect), PRODUCT_COLOR, 0))
+        for machine in self.factory.machines:
+            items.append(self.get_text_item(machine.get_status() + " I:" + str(len(machine.buffer_input_load)) +
+                                            " O:" + str(len(machine.buffer_output_load)),
+                                            machine.pos_x, machine.pos_y))
+            items.append(self.get_text_item(str(int(machine.rest_process_time)), machine.pos_x, machine.pos_y + 1))
+        for warehouse in self.factory.warehouses:
+            items.append(self.get_text_item(str(int(warehouse.rest_process_time)), warehouse.pos_x,
+                                            warehouse.pos_y + 1))
+        return items
+
+    def get_text_item(self, text, x, y):
+        rect = self.get_glyph(text).get_rect(topleft=(self.pixel_size * x, self.pixel_size * y))
+        return 'text', tuple(rect), text
+
+    def draw_item(self, item):
+        if item[0] == 'rect':
+            pygame.draw.rect(self.screen, item[2], item[1], border_radius=item[3])
+        else:
+            self.screen.blit(self.get_glyph(item[2]), item[1][:2])
+
+    def draw(self):
+        items = self.get_items()
+        if self.background is None or self.grid_version != self.factory.grid.version:
+            self.build_background()
+            self.screen.blit(self.background, (0, 0))
+            for item in items:
+                self.draw_item(item)
+            self.items = items
+            pygame.display.flip()
+            return
+
+        # overlays that disappeared or appeared (moved AGVs, changed labels)
+        changed = (Counter(self.items) - Counter(items)) + (Counter(items) - Counter(self.items))
+        screen_rect = self.screen.get_rect()
+        dirty_rects = []
+        for item in changed:
+            rect = screen_rect.clip(pygame.Rect(item[1]))
+            if rect.width > 0 and rect.height > 0 and rect not in dirty_rects:
+                dirty_rects.append(rect)
+        # repaint every dirty rect completely: background and all overlays touching it in drawing order
+        for rect in dirty_rects:
+            self.screen.set_clip(rect)
+            self.screen.blit(self.background, rect, rect)
+            for item in items:
+                if rect.colliderect(item[1]):
+                    self.draw_item(item)
+        self.screen.set_clip(None)
+        self.items = items
+        if dirty_rects:
+            pygame.display.update(dirty_rects)
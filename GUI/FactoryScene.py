@@ -43,8 +43,8 @@ class FactoryScene(QGraphicsScene):
             for x in range(no_horizontal_cells):
                 brush = QBrush()
                 brush_color = QColor()
-                brush_color.setRgb(
-                    factory_color_grid[y][x][0], factory_color_grid[y][x][1], factory_color_grid[y][x][2])
+                brush_color.setRgb(int(factory_color_grid[y][x][0]), int(factory_color_grid[y][x][1]),
+                                   int(factory_color_grid[y][x][2]))
                 brush.setStyle(Qt.SolidPattern)
                 brush.setColor(brush_color)
                 factory_scene_grid[y][x] = self.addRect(pixels * y, pixels * x, pixels, pixels, brush=brush)
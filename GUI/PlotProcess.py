@@ -0,0 +1,104 @@
+import multiprocessing
+import queue
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+is_ipython = 'inline' in matplotlib.get_backend()
+if is_ipython:
+    from IPython import display
+
+
+def plot_durations(system_transport_data, system_stock_data, agvs_workload, machines_workload, show_result=False):
+    # plots the stock and workload data collected by LoopTest.collect_data
+    plt.clf()
+    plt.subplot(1, 2, 1)  # row 1, column 2, count 1
+    plt.plot(system_transport_data, label='transport stock', color='r', linewidth=4)
+    plt.plot(system_stock_data, label='system stock', color='g', linewidth=2)
+    if show_result:
+        plt.title('Result')
+    else:
+        plt.title('Running...')
+    plt.xlabel('Time in 0.1s Steps')
+    plt.ylabel('Count')
+    plt.legend()
+
+    # using subplot function and creating plot two
+    # row 1, column 2, count 2
+    plt.subplot(1, 2, 2)
+    for i in range(len(agvs_workload)):
+        plt.plot(agvs_workload[i], label='AGV ' + str(i), linewidth=4-i)
+    for i in range(len(machines_workload)):
+        plt.plot(machines_workload[i], label='Machine ' + str(i), linewidth=4-i)
+    plt.title('Workload')
+    plt.xlabel('Time in 0.1s Steps')
+    plt.ylabel('Count')
+    plt.legend()
+
+    plt.tight_layout(pad=1.0)
+    plt.pause(0.001)  # pause a bit so that plots are updated
+    if is_ipython:
+        if not show_result:
+            display.display(plt.gcf())
+            display.clear_output(wait=True)
+        else:
+            display.display(plt.gcf())
+
+
+def run_plot_process(data_queue, n_agvs, n_machines):
+    # receives the new data points of LoopTest and redraws the plot with the latest data
+    system_transport_data = []
+    system_stock_data = []
+    agvs_workload = [[] for _ in range(n_agvs)]
+    machines_workload = [[] for _ in range(n_machines)]
+    plt.ion()
+    finished = False
+    while not finished:
+        try:
+            message = data_queue.get(timeout=0.1)
+        except queue.Empty:
+            plt.pause(0.05)     # keep the window responsive
+            continue
+        messages = [message]
+        while not data_queue.empty():   # only the last plot of a backlog is drawn
+            messages.append(data_queue.get())
+        for message in messages:
+            if message is None:
+                finished = True
+                break
+            transport_data, stock_data, agvs_data, machines_data = message
+            system_transport_data.extend(transport_data)
+            system_stock_data.extend(stock_data)
+            for workload, new_data in zip(agvs_workload + machines_workload, agvs_data + machines_data):
+                workload.extend(new_data)
+        plot_durations(system_transport_data, system_stock_data, agvs_workload, machines_workload, finished)
+    plt.ioff()
+    plt.show()
+
+
+class PlotProcess:
+    """
+    Plots the data of LoopTest in a separate process, so drawing (plt.pause) does not stop the simulation.
+
+    send() passes only the data points added since the last call, the process keeps the complete series. close()
+    draws the result and returns after the plot window is closed.
+    """
+    def __init__(self, n_agvs, n_machines):
+        context = multiprocessing.get_context('spawn')  # no copy of the pygame display and the factory threads
+        self.queue = context.Queue()
+        self.process = context.Process(target=run_plot_process, args=(self.queue, n_agvs, n_machines), daemon=True)
+        self.sent = 0   # data points already sent per series
+
+    def start(self):
+        self.process.start()
+
+    def send(self, system_transport_data, system_stock_data, agvs_workload, machines_workload):
+        start = self.sent
+        self.queue.put((system_transport_data[start:], system_stock_data[start:],
+                        [workload[start:] for workload in agvs_workload],
+                        [workload[start:] for workload in machines_workload]))
+        self.sent = len(system_stock_data)
+
+    def close(self):
+        self.queue.put(None)
+        self.process.join()
@@ -0,0 +1,77 @@
+import time
+
+
+class SimulationPacer:
+    """
+    Wall clock pacing of a displayed simulation, independent of the frame rate.
+
+    The simulation runs ahead in one batch per frame: all steps that are due at simulation_speed since the last frame
+    are done at once, then a single frame is rendered and the pacer sleeps until the next frame (fps frames per
+    second). A batch stops when max_frame_load of the frame time is used up, so the display stays responsive. If the
+    simulation cannot keep up with simulation_speed, the steps that are behind are dropped (the simulation runs
+    slower than requested instead of catching up in ever larger batches) and counted in dropped_time.
+    """
+    def __init__(self, time_step, simulation_speed=1.0, fps=30, max_frame_load=0.8):
+        """
+        :param time_step: float - simulated seconds per step
+        :param simulation_speed: float - simulated seconds per real second
+        :param fps: float - frames per second of the display
+        :param max_frame_load: float - share of the frame time the simulation steps may use
+        """
+        self.time_step = time_step
+        self.simulation_speed = simulation_speed
+        self.frame_time = 1.0 / fps
+        self.max_frame_load = max_frame_load
+        self.start_time = None
+        self.next_frame_time = None
+        self.step_count = 0     # steps done since start
+        self.dropped_time = 0.0     # simulated seconds the simulation fell behind simulation_speed
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        self.next_frame_time = self.start_time + self.frame_time
+        self.step_count = 0
+        self.dropped_time = 0.0
+
+    def get_real_time_lapsed(self):
+        return time.perf_counter() - self.start_time
+
+    def get_simulation_time(self):
+        return self.step_count * self.time_step
+
+    def get_due_steps(self):
+        # steps the simulation is behind the wall clock
+        target_time = (time.perf_counter() - self.start_time) * self.simulation_speed - self.dropped_time
+        return int(target_time / self.time_step + 1e-9) - self.step_count
+
+    def run_batch(self, step_function):
+        """
+        Calls step_function for every due step until the frame budget is used up.
+        :param step_function: function without parameters - one simulation step
+        :return: int - number of steps done
+        """
+        deadline = self.next_frame_time - self.frame_time * (1.0 - self.max_frame_load)
+        due_steps = self.get_due_steps()
+        steps = 0
+        while steps < due_steps:
+            step_function()
+            steps += 1
+            if time.perf_counter() > deadline:
+                break
+        self.step_count += steps
+        behind_steps = self.get_due_steps()
+        if behind_steps > 0 and steps < due_steps:  # budget used up - do not catch up later
+            self.dropped_time += behind_steps * self.time_step
+        return steps
+
+    def wait_for_next_frame(self):
+        sleep_time = self.next_frame_time - time.perf_counter()
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+            self.next_frame_time += self.frame_time
+        else:   # frame took too long - restart the frame clock instead of rendering several frames at once
+            self.next_frame_time = time.perf_counter() + self.frame_time
+
+    def get_achieved_speed(self):
+        real_time = self.get_real_time_lapsed()
+        return self.get_simulation_time() / real_time if real_time > 0 else 0.0
@@ -0,0 +1,43 @@
+from collections import namedtuple
+
+# delivery command of the environment: the AGV formation is [AGVs in width direction, AGVs in length direction]
+AgvCommand = namedtuple('AgvCommand', ['output_object', 'input_object', 'product', 'formation', 'coupling'])
+
+
+class ActionTable:
+    """
+    Action space of CustomEnvironment derived from the delivery relationships of the factory.
+
+    Command 0 sends stuck AGVs to the temporary storage, every further command is one delivery relationship (output
+    product of a warehouse or machine that is an input product of another one) in the order of the station lists
+    (warehouses, then machines). Action a is command a // n_agv for AGV a % n_agv - decoded from a precomputed list.
+    """
+    def __init__(self, factory):
+        self.commands = [None]  # command 0: unload stuck AGVs
+        stations = factory.warehouses + factory.machines
+        agv = factory.agvs[0] if factory.agvs else None
+        for output_object in stations:
+            for product in output_object.output_products:
+                for input_object in stations:
+                    if input_object is output_object or product not in input_object.input_products:
+                        continue
+                    formation = [1, 1] if agv is None else factory.get_agv_needed_for_product(product, agv)
+                    self.commands.append(AgvCommand(output_object, input_object, product, formation,
+                                                    formation[0] > 1 or formation[1] > 1))
+        self.n_commands = len(self.commands)
+        self.n_agv = len(factory.agvs)
+        self.n_actions = self.n_agv * self.n_commands
+        self.actions = [divmod(action, self.n_agv) for action in range(self.n_actions)]
+
+    def decode(self, action):
+        """
+        :param action: int
+        :return: (int, int) - command index, AGV index
+        """
+        return self.actions[action]
+
+    def get_command(self, command_index):
+        return self.commands[command_index]
+
+    def __len__(self):
+        return self.n_commands
@@ -53,7 +53,7 @@ class ActorCritic:
         self.batch_size, self.max_memory = batch_size, 100000
         self.eps_step_by_done = eps_step_by_done
         self.random_action = RandomAction(eps_start, eps_steps, eps_end, self.eps_step_by_done)
-        self.memory = DiscreteBuffer(self.max_memory, state_d, self.device)
+        self.memory = DiscreteBuffer(self.max_memory, state_d, self.device, action_d)
         self.actor = ActorNet([state_d, 100, action_d], [torch.nn.LeakyReLU, torch.nn.Identity]).to(self.device)
         self.critic = CriticNet([state_d, 100, action_d], [torch.nn.LeakyReLU, torch.nn.Identity]).to(self.device)
         self.critic_target = CriticNet([state_d, 100, action_d], [torch.nn.LeakyReLU, torch.nn.Identity]).to(
@@ -0,0 +1,242 @@
+import multiprocessing
+import queue
+import random
+import time
+
+import numpy as np
+import torch
+
+from MachineLearning.EnvironmentPool import EnvironmentFactory
+from MachineLearning.RainbowLearning import RainbowLearning
+
+# arguments of RainbowLearning the actors need for their copy of the nets and the initial priorities
+ACTOR_ARGUMENTS = ('state_d', 'action_d', 'net', 'gamma', 'std_init', 'v_min', 'v_max', 'atom_size', 'prior_eps')
+
+
+class ActorLearner:
+    """
+    Rainbow training with decoupled actors and learner.
+
+    Every actor is a process with its own environment and a CPU copy of the policy and target net. It steps its
+    environment without waiting for the learner and sends chunks of chunk_size transitions with their initial
+    priorities (the loss of the transitions with its nets, like the priorities of the learner) through a queue. The
+    learner (this process) owns the RainbowLearning agent with the prioritized memories: it adds the received chunks
+    and trains continuously, without a garbage collection per update. Every sync_interval updates the weights are
+    sent to the actors, which load them before their next step.
+
+    The memories build n-step transitions from consecutive transitions - every actor has its own n-step windows, so
+    the transitions of different actors are not mixed.
+    """
+    def __init__(self, env_class, n_actors=2, agent_kwargs=None, env_kwargs=None, chunk_size=64, sync_interval=100,
+                 max_steps=None, seed=None, start_method='spawn'):
+        """
+        :param env_class: gymnasium.Env class, e.g. CustomEnvironment
+        :param agent_kwargs: dict - keyword arguments of RainbowLearning (state_d, action_d and net are needed)
+        :param env_kwargs: dict - keyword arguments of env_class
+        :param chunk_size: int - transitions an actor sends at once
+        :param sync_interval: int - updates between two weight synchronizations of the actors
+        :param max_steps: int - episode length of the actors, None: until done or truncated. Like a truncation of
+            the environment the time limit is stored as terminal transition (its next state is not bootstrapped)
+        :param seed: int - seed of the actors (actor rank + seed)
+        """
+        agent_kwargs = dict(agent_kwargs or {})
+        agent_kwargs.setdefault('gc_interval', 0)
+        self.agent = RainbowLearning(**agent_kwargs)
+        self.actor_kwargs = {key: value for key, value in agent_kwargs.items() if key in ACTOR_ARGUMENTS}
+        self.env_factories = [EnvironmentFactory(env_class, rank, **(env_kwargs or {})) for rank in range(n_actors)]
+        self.n_actors = n_actors
+        self.chunk_size = chunk_size
+        self.sync_interval = sync_interval
+        self.max_steps = max_steps
+        self.seed = seed
+        self.context = multiprocessing.get_context(start_method)
+
+        self.transition_queue = None
+        self.weight_queues = []
+        self.stop_event = None
+        self.actors = []
+
+        self.update_counter = 0
+        self.received_transitions = 0
+        self.losses = []
+        self.start_time = None
+        self.start_counts = (0, 0)  # updates and received transitions at start()
+
+    def is_running(self):
+        return self.stop_event is not None
+
+    def start(self):
+        # starts the actor processes - they keep running over several run() calls until stop()
+        self.transition_queue = self.context.Queue(maxsize=4 * self.n_actors)
+        self.weight_queues = [self.context.Queue(maxsize=1) for _ in range(self.n_actors)]
+        self.stop_event = self.context.Event()
+        self.actors = []
+        self.agent.clear_streams()  # the actors start new episodes
+        for rank in range(self.n_actors):
+            actor = self.context.Process(target=run_actor, daemon=True, args=(
+                rank, self.env_factories[rank], self.actor_kwargs, self.transition_queue, self.weight_queues[rank],
+                self.stop_event, self.chunk_size, self.max_steps, self.seed))
+            actor.start()
+            self.actors.append(actor)
+        self.publish_weights()
+        self.start_time = time.time()
+        self.start_counts = (self.update_counter, self.received_transitions)
+
+    def run(self, n_updates, log_interval=1000):
+        """
+        Trains for n_updates updates of the learner. Actors that are not running yet are started and stopped at the end
+        (call start() and stop() around several run() calls, e.g. to save the agent in between, to keep them running).
+        :return: RainbowLearning - the trained agent
+        """
+        started = not self.is_running()
+        if started:
+            self.start()
+        try:
+            target = self.update_counter + n_updates
+            while self.update_counter < target:
+                self.receive(block=not self.agent.memory.ready_to_sample())
+                loss = self.agent.train()
+                if loss is None:
+                    continue
+                self.losses.append(loss)
+                self.update_counter += 1
+                if self.update_counter % self.sync_interval == 0:
+                    self.publish_weights()
+                if log_interval and self.update_counter % log_interval == 0:
+                    duration = time.time() - self.start_time
+                    print("Updates: " + str(self.update_counter) + " transitions: " + str(self.received_transitions) +
+                          " loss: " + str(round(float(np.mean(self.losses[-log_interval:])), 4)) + " (" +
+                          str(round((self.update_counter - self.start_counts[0]) / duration, 1)) + " updates/s, " +
+                          str(round((self.received_transitions - self.start_counts[1]) / duration, 1)) +
+                          " transitions/s)")
+        finally:
+            if started:
+                self.stop()
+        return self.agent
+
+    def receive(self, block=False, max_chunks=None):
+        """
+        Adds the chunks of the actors waiting in the queue to the memories.
+        :param block: bool - wait for at least one chunk
+        :return: int - number of added chunks
+        """
+        if max_chunks is None:
+            max_chunks = self.n_actors
+        chunks = 0
+        while chunks < max_chunks:
+            try:
+                chunk = self.transition_queue.get(timeout=1.0) if block and chunks == 0 else \
+                    self.transition_queue.get_nowait()
+            except queue.Empty:
+                if block and chunks == 0:
+                    if not any(actor.is_alive() for actor in self.actors):
+                        raise RuntimeError("All actor processes stopped")
+                    continue
+                break
+            self.add_chunk(*chunk)
+            chunks += 1
+        return chunks
+
+    def add_chunk(self, rank, states, actions, rewards, next_states, dones, priorities):
+        self.agent.select_stream(rank)  # n-step windows of the actor
+        for k in range(len(states)):
+            self.agent.add_transition(states[k], int(actions[k]), float(rewards[k]), next_states[k], int(dones[k]),
+                                      float(priorities[k]))
+        self.received_transitions += len(states)
+
+    def publish_weights(self):
+        # replaces weights the actors did not load yet
+        weights = ({key: value.cpu() for key, value in self.agent.policy_net.state_dict().items()},
+                   {key: value.cpu() for key, value in self.agent.target_net.state_dict().items()})
+        for weight_queue in self.weight_queues:
+            try:
+                weight_queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                weight_queue.put_nowait(weights)
+            except queue.Full:  # the actor loaded the old weights in between - it gets the next ones
+                pass
+
+    def stop(self):
+        if self.stop_event is None:
+            return
+        self.stop_event.set()
+        deadline = time.time() + 10.0
+        while any(actor.is_alive() for actor in self.actors) and time.time() < deadline:
+            try:    # actors waiting to put a chunk stop after the next timeout
+                self.transition_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for actor in self.actors:
+            if actor.is_alive():
+                actor.terminate()
+            actor.join()
+        for weight_queue in self.weight_queues:
+            weight_queue.cancel_join_thread()   # weights nobody reads anymore
+        self.stop_event = None
+
+
+def run_actor(rank, env_factory, actor_kwargs, transition_queue, weight_queue, stop_event, chunk_size=64,
+              max_steps=None, seed=None):
+    # actor process: steps the environment with the latest weights and sends transition chunks to the learner
+    torch.set_num_threads(1)    # one core per actor
+    if seed is not None:
+        random.seed(seed + rank)
+        np.random.seed(seed + rank)
+        torch.manual_seed(seed + rank)
+    env = env_factory()
+    agent = RainbowLearning(memory_size=chunk_size, batch_size=chunk_size, device='cpu', gc_interval=0,
+                            **actor_kwargs)
+    state = np.asarray(env.reset()[0], dtype=np.float32)
+    chunk = []
+    steps = 0
+    while not stop_event.is_set():
+        try:
+            policy_weights, target_weights = weight_queue.get_nowait()
+            agent.policy_net.load_state_dict(policy_weights)
+            agent.target_net.load_state_dict(target_weights)
+        except queue.Empty:
+            pass
+
+        action = agent.get_action_from_numpy(state)
+        next_state, reward, done, truncated, _ = env.step(action)
+        next_state = np.asarray(next_state, dtype=np.float32)
+        steps += 1
+        if max_steps is not None and steps >= max_steps:   # episode end is reached
+            truncated = True
+        # the memories have no truncation flag - a truncated episode (time limit, max_steps) is stored as done, so no
+        # n-step window spans two episodes (CustomEnvironment resets itself inside step() when it truncates)
+        done = done or truncated
+        chunk.append((state, action, reward, next_state, done))
+        if done:
+            state = np.asarray(env.reset()[0], dtype=np.float32)
+            steps = 0
+        else:
+            state = next_state
+
+        if len(chunk) == chunk_size:
+            send_chunk(rank, agent, chunk, transition_queue, stop_event)
+            agent.reset_noise()
+            chunk = []
+    env.close()
+
+
+def send_chunk(rank, agent, chunk, transition_queue, stop_event):
+    states = np.stack([transition[0] for transition in chunk])
+    actions = np.array([transition[1] for transition in chunk], dtype=np.int64)
+    rewards = np.array([transition[2] for transition in chunk], dtype=np.float32)
+    next_states = np.stack([transition[3] for transition in chunk])
+    dones = np.array([transition[4] for transition in chunk], dtype=np.uint8)
+    with torch.no_grad():   # initial priorities - loss of the transitions like in RainbowLearning.q_learning_batch
+        loss = agent.compute_loss(torch.from_numpy(states), torch.from_numpy(actions).unsqueeze(1),
+                                  torch.from_numpy(rewards).unsqueeze(1), torch.from_numpy(next_states),
+                                  torch.from_numpy(dones).long().unsqueeze(1), agent.gamma)
+    priorities = loss.numpy() + agent.prior_eps
+    item = (rank, states, actions, rewards, next_states, dones, priorities)
+    while not stop_event.is_set():
+        try:
+            transition_queue.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
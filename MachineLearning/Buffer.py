@@ -1,196 +1,132 @@
 import numpy
 import torch
-import random
 from collections import deque
-from typing import Deque, List
+from typing import Deque
+from MachineLearning.ReplayStorage import ReplayStorage, get_index_dtype
 from MachineLearning.SegmentTree import MinSegmentTree, SumSegmentTree
 
 
-class ContinuesBuffer:
-    def __init__(self, max_size, state_d, action_d, device):
-        self.max_size = max_size
-        self.index = 0
-        self.size = 0
+def to_tensors(batch, device, action_type=torch.long):
+    # numpy batch of ReplayStorage.get_batch -> float states, actions of action_type, float rewards, long dones
+    states, actions, rewards, next_states, dones = batch
+    return (
+        torch.from_numpy(states).to(device),
+        torch.from_numpy(actions).to(device=device, dtype=action_type),
+        torch.from_numpy(rewards).to(device),
+        torch.from_numpy(next_states).to(device),
+        torch.from_numpy(dones).to(device=device, dtype=torch.long)
+    )
 
-        if type(state_d) is int:
-            self.state = numpy.zeros((max_size, state_d))
-            self.next_state = numpy.zeros((max_size, state_d))
-        else:
-            self.state = numpy.zeros(shape=(max_size, state_d[0], state_d[1], state_d[2]))
-            self.next_state = numpy.zeros(shape=(max_size, state_d[0], state_d[1], state_d[2]))
-        self.action = numpy.zeros((max_size, action_d))
-        self.reward = numpy.zeros((max_size, 1))
-        self.dones = numpy.zeros((max_size, 1))
 
+class ContinuesBuffer:
+    def __init__(self, max_size, state_d, action_d, device, obs_dtype=numpy.float32, obs_scale=None):
+        self.max_size = max_size
+        self.storage = ReplayStorage(max_size, state_d, (action_d,), numpy.float32, obs_dtype, obs_scale)
         self.device = device
 
     def add(self, state, action, reward, next_state, done):
-        self.state[self.index] = state
-        self.action[self.index] = action
-        self.reward[self.index] = reward
-        self.next_state[self.index] = next_state
-        self.dones[self.index] = done  # 0,0,0，...，1
+        self.storage.add(state, action, reward, next_state, done)  # 0,0,0，...，1
 
-        self.index = (self.index + 1) % self.max_size
-        self.size = min(self.size + 1, self.max_size)
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        self.storage.add_batch(states, actions, rewards, next_states, dones)
 
     def sample(self, batch_size):
-        indices = numpy.random.randint(0, self.size, size=batch_size)
+        indices = self.storage.sample_indices(batch_size)
+        return to_tensors(self.storage.get_batch(indices), self.device, torch.float)
 
-        return (
-            torch.tensor(self.state[indices], dtype=torch.float, device=self.device),
-            torch.tensor(self.action[indices], dtype=torch.float, device=self.device),
-            torch.tensor(self.reward[indices], dtype=torch.float, device=self.device),
-            torch.tensor(self.next_state[indices], dtype=torch.float, device=self.device),
-            torch.tensor(self.dones[indices], dtype=torch.long, device=self.device)
-        )
+    @property
+    def size(self):
+        return self.storage.size
 
 
 class DiscreteBuffer:
-    def __init__(self, max_size, state_d, device):
+    def __init__(self, max_size, state_d, device, n_actions=None, obs_dtype=numpy.float32, obs_scale=None):
         self.max_size = max_size
-        self.index = 0
-        self.size = 0
-
-        if type(state_d) is int:
-            self.state = numpy.zeros((max_size, state_d))
-            self.next_state = numpy.zeros((max_size, state_d))
-        else:
-            self.state = numpy.zeros(shape=(max_size, state_d[0], state_d[1], state_d[2]))
-            self.next_state = numpy.zeros(shape=(max_size, state_d[0], state_d[1], state_d[2]))
-        self.action_index = numpy.zeros((max_size, 1))
-        self.reward = numpy.zeros((max_size, 1))
-        self.dones = numpy.zeros((max_size, 1))
-
+        self.storage = ReplayStorage(max_size, state_d, (1,), get_index_dtype(n_actions), obs_dtype, obs_scale)
         self.device = device
 
     def add(self, state, action_index, reward, next_state, done):
-        self.state[self.index] = state
-        self.action_index[self.index] = action_index
-        self.reward[self.index] = reward
-        self.next_state[self.index] = next_state
-        self.dones[self.index] = done  # 0,0,0，...，1
+        self.storage.add(state, action_index, reward, next_state, done)  # 0,0,0，...，1
 
-        self.index = (self.index + 1) % self.max_size
-        self.size = min(self.size + 1, self.max_size)
+    def add_batch(self, states, action_indices, rewards, next_states, dones):
+        self.storage.add_batch(states, action_indices, rewards, next_states, dones)
 
     def sample(self, batch_size):
-        indices = numpy.random.randint(0, self.size, size=batch_size)
+        indices = self.storage.sample_indices(batch_size)
+        return to_tensors(self.storage.get_batch(indices), self.device)
 
-        return (
-            torch.tensor(self.state[indices], dtype=torch.float, device=self.device),
-            torch.tensor(self.action_index[indices], dtype=torch.long, device=self.device),
-            torch.tensor(self.reward[indices], dtype=torch.float, device=self.device),
-            torch.tensor(self.next_state[indices], dtype=torch.float, device=self.device),
-            torch.tensor(self.dones[indices], dtype=torch.long, device=self.device)
-        )
+    @property
+    def size(self):
+        return self.storage.size
 
 
 class MultiDiscreteBuffer:
-    def __init__(self, max_size, state_d, device, num_discrete=1):
+    def __init__(self, max_size, state_d, device, num_discrete=1, n_actions=None, obs_dtype=numpy.float32,
+                 obs_scale=None):
         self.max_size = max_size
-        self.index = 0
-        self.size = 0
         self.device = device
-
-        if type(state_d) is int:
-            self.state = torch.zeros((max_size, state_d), dtype=torch.float, device=torch.device('cpu'))
-            self.next_state = torch.zeros((max_size, state_d), dtype=torch.float, device=torch.device('cpu'))
-        else:
-            self.state = torch.zeros((max_size, state_d[0], state_d[1], state_d[2]), dtype=torch.float,
-                                     device=torch.device('cpu'))
-            self.next_state = torch.zeros((max_size, state_d[0], state_d[1], state_d[2]), dtype=torch.float,
-                                          device=torch.device('cpu'))
-        self.action = torch.zeros((max_size, num_discrete), dtype=torch.long, device=torch.device('cpu'))
-        self.reward = torch.zeros((max_size, 1), dtype=torch.float, device=torch.device('cpu'))
-        self.dones = torch.zeros((max_size, 1), dtype=torch.long, device=torch.device('cpu'))
+        self.storage = ReplayStorage(max_size, state_d, (num_discrete,), get_index_dtype(n_actions), obs_dtype,
+                                     obs_scale)
 
     def add(self, state, action, reward, next_state, done):
+        self.storage.add(state, action, reward, next_state, done)
 
-        action = torch.tensor(action, dtype=torch.long, device=torch.device('cpu'))
-        reward = torch.tensor(reward, dtype=torch.float, device=torch.device('cpu'))
-        done = torch.tensor(done, dtype=torch.long, device=torch.device('cpu'))
-
-        self.state[self.index] = state
-        self.action[self.index] = action
-        self.reward[self.index] = reward
-        self.next_state[self.index] = next_state
-        self.dones[self.index] = done
-
-        self.index = (self.index + 1) % self.max_size
-        self.size = min(self.size + 1, self.max_size)
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        self.storage.add_batch(states, actions, rewards, next_states, dones)
 
     def sample(self, batch_size):
         if batch_size > self.size:
             batch_size = self.size
-        indices = numpy.random.randint(0, self.size, size=batch_size)
+        indices = self.storage.sample_indices(batch_size)
+        return to_tensors(self.storage.get_batch(indices), self.device)
 
-        return (
-            self.state[indices].to(self.device),
-            self.action[indices].to(self.device),
-            self.reward[indices].to(self.device),
-            self.next_state[indices].to(self.device),
-            self.dones[indices].to(self.device)
-        )
+    @property
+    def size(self):
+        return self.storage.size
 
 
 class DiscreteRNNBuffer:
-    def __init__(self, max_size, state_d, device, hidden_size, n_layers):
+    def __init__(self, max_size, state_d, device, hidden_size, n_layers, n_actions=None, obs_dtype=numpy.float32,
+                 obs_scale=None):
         self.max_size = max_size
-        self.index = 0
-        self.size = 0
         self.device = device
 
         if type(state_d) is int:
-            self.state = torch.zeros((max_size, 1, state_d), dtype=torch.float, device=self.device)
-            self.next_state = torch.zeros((max_size, 1, state_d), dtype=torch.float, device=self.device)
-        else:
-            self.state = torch.zeros((max_size, state_d[0], state_d[1], state_d[2]), dtype=torch.float,
-                                     device=self.device)
-            self.next_state = torch.zeros((max_size, state_d[0], state_d[1], state_d[2]), dtype=torch.float,
-                                          device=self.device)
-        self.action_index = torch.zeros((max_size, 1), dtype=torch.long, device=self.device)
-        self.reward = torch.zeros((max_size, 1), dtype=torch.float, device=self.device)
-        self.dones = torch.zeros((max_size, 1), dtype=torch.long, device=self.device)
-        self.last_hx = torch.zeros((max_size, n_layers, 1, hidden_size), dtype=torch.float, device=self.device)
+            state_d = (1, state_d)
+        self.storage = ReplayStorage(max_size, state_d, (1,), get_index_dtype(n_actions), obs_dtype, obs_scale)
+        self.last_hx = torch.zeros((self.storage.capacity, n_layers, 1, hidden_size), dtype=torch.float,
+                                   device=self.device)
 
     def add(self, state, action_index, reward, next_state, done, last_hx):
-
-        action_index = torch.tensor(action_index, dtype=torch.long, device=self.device)
-        reward = torch.tensor(reward, dtype=torch.float, device=self.device)
-        done = torch.tensor(done, dtype=torch.long, device=self.device)
-
-        self.state[self.index] = state
-        self.action_index[self.index] = action_index
-        self.reward[self.index] = reward
-        self.next_state[self.index] = next_state
-        self.dones[self.index] = done
-        self.last_hx[self.index] = last_hx
-
-        self.index = (self.index + 1) % self.max_size
-        self.size = min(self.size + 1, self.max_size)
+        slot = self.storage.add(state, action_index, reward, next_state, done)
+        self.last_hx[slot] = last_hx
 
     def sample(self, batch_size):
         if batch_size > self.size:
             batch_size = self.size
-        indices = numpy.random.randint(0, self.size, size=batch_size)
+        indices = self.storage.sample_indices(batch_size)
         # ind = torch.randint(0, self.size, device=self.device, size=(batch_size,))
+        states, action_index, reward, next_states, dones = to_tensors(self.storage.get_batch(indices), self.device)
 
         hx = self.last_hx[indices]
         hx = hx.squeeze()
         hx = hx.permute(1, 0, 2)
 
         return (
-            self.state[indices].squeeze(1),
-            self.state[indices],
-            self.action_index[indices],
-            self.reward[indices],
-            self.next_state[indices].squeeze(1),
-            self.next_state[indices],
-            self.dones[indices],
+            states.squeeze(1),
+            states,
+            action_index,
+            reward,
+            next_states.squeeze(1),
+            next_states,
+            dones,
             hx
         )
 
+    @property
+    def size(self):
+        return self.storage.size
+
 
 class PrioritizedDiscreteBuffer(DiscreteBuffer):
     def __init__(
@@ -214,55 +150,80 @@ class PrioritizedDiscreteBuffer(DiscreteBuffer):
 
 
 class NStepDiscreteBuffer:
-    def __init__(self, max_size, batch_size, state_d, device, n_step: int = 1, gamma: float = 0.99):
+    def __init__(self, max_size, batch_size, state_d, device, n_step: int = 1, gamma: float = 0.99,
+                 n_actions=None, obs_dtype=numpy.float32, obs_scale=None, path=None):
         self.max_size = max_size
         self.batch_size = batch_size
-        self.index = 0
-        self.size = 0
-
-        if type(state_d) is int:
-            self.states = torch.zeros((max_size, state_d), dtype=torch.float, device=torch.device('cpu'))
-            self.next_states = torch.zeros((max_size, state_d), dtype=torch.float, device=torch.device('cpu'))
-        else:
-            self.states = torch.zeros((max_size, state_d[0], state_d[1], state_d[2]), dtype=torch.float,
-                                      device=torch.device('cpu'))
-            self.next_states = torch.zeros((max_size, state_d[0], state_d[1], state_d[2]), dtype=torch.float,
-                                           device=torch.device('cpu'))
-        self.actions = torch.zeros((max_size, 1), dtype=torch.long, device=torch.device('cpu'))
-        self.rewards = torch.zeros((max_size, 1), dtype=torch.float, device=torch.device('cpu'))
-        self.dones = torch.zeros((max_size, 1), dtype=torch.long, device=torch.device('cpu'))
+        # the next state of an n-step transition is not the state of the following one - stored separately
+        # with a path the transitions are kept in memory-mapped files and reopened by the next buffer with this path
+        self.storage = ReplayStorage(max_size, state_d, (1,), get_index_dtype(n_actions), obs_dtype, obs_scale,
+                                     share_next_state=False, path=path)
 
         #N-step
         self.n_step_buffer = deque(maxlen=n_step)
+        self.priority_buffer = deque(maxlen=n_step)     # initial priorities of the transitions in n_step_buffer
+        self.pending = deque()  # n-step transitions of add_pending that are not stored yet
         self.n_step = n_step
         self.gamma = gamma
+        # n-step windows of every stream of consecutive transitions (e.g. one per environment), stream 0 is current
+        self.streams = {0: (self.n_step_buffer, self.priority_buffer, self.pending)}
 
         self.device = device
 
-    def add(self, state, action, reward, next_state, done):
-        action = torch.tensor(action, dtype=torch.long, device=torch.device('cpu'))
-        reward = torch.tensor(reward, dtype=torch.float, device=torch.device('cpu'))
-        done = torch.tensor(done, dtype=torch.long, device=torch.device('cpu'))
-        return self.adding_to_buffer(state, action, reward, next_state, done)
+    def select_stream(self, stream):
+        """
+        Makes the n-step window of stream current - the following adds continue the transitions of this stream.
+        :param stream: hashable - e.g. the index of the environment
+        """
+        if stream not in self.streams:
+            self.streams[stream] = (deque(maxlen=self.n_step), deque(maxlen=self.n_step), deque())
+        self.n_step_buffer, self.priority_buffer, self.pending = self.streams[stream]
+
+    def clear_streams(self):
+        # all streams start new episodes
+        for window in self.streams.values():
+            for transitions in window:
+                transitions.clear()
+
+    def add(self, state, action, reward, next_state, done, priority=None):
+        return self.adding_to_buffer(state, action, reward, next_state, done, priority)
+
+    def adding_to_buffer(self, state, action, reward, next_state, done, priority=None):
+        n_step_transition = self._add_to_window(state, action, reward, next_state, done, priority)
+        if not n_step_transition:
+            return ()
+
+        self.storage.add(*n_step_transition)  # 0,0,0，...，1
+        return self.n_step_buffer[0]
+
+    def add_pending(self, state, action, reward, next_state, done, priority=None):
+        """
+        Like add, but the n-step transition is only stored by store_pending - e.g. at the same time as the returned
+        transition is stored in another buffer, so both buffers have the same indices for any order of the streams.
+        """
+        n_step_transition = self._add_to_window(state, action, reward, next_state, done, priority)
+        if not n_step_transition:
+            return ()
 
-    def adding_to_buffer(self, state, action, reward, next_state, done):
+        self.pending.append(n_step_transition)
+        return self.n_step_buffer[0]
+
+    def store_pending(self):
+        # stores the oldest pending n-step transition of the current stream
+        self.storage.add(*self.pending.popleft())
+
+    def _add_to_window(self, state, action, reward, next_state, done, priority=None):
+        # n-step transition of the oldest transition in the window, () while the window is not full
         transition = (state, action, reward, next_state, done)
         self.n_step_buffer.append(transition)
+        self.priority_buffer.append(priority)
 
         if len(self.n_step_buffer) < self.n_step:
             return ()
 
         reward, next_state, done = self._get_n_step_info(self.n_step_buffer, self.gamma)
         state, action = self.n_step_buffer[0][:2]
-
-        self.states[self.index] = state
-        self.actions[self.index] = action
-        self.rewards[self.index] = reward
-        self.next_states[self.index] = next_state
-        self.dones[self.index] = done  # 0,0,0，...，1
-        self.index = (self.index + 1) % self.max_size
-        self.size = min(self.size + 1, self.max_size)
-        return self.n_step_buffer[0]
+        return state, action, reward, next_state, done
 
     def sample(self):
         if self.size > 0:
@@ -271,25 +232,12 @@ class NStepDiscreteBuffer:
             indices = numpy.random.randint(0, 1, size=self.batch_size)
             # indices = [0]
 
-        return (
-            self.states[indices].to(self.device),
-            self.actions[indices].to(self.device),
-            self.rewards[indices].to(self.device),
-            self.next_states[indices].to(self.device),
-            self.dones[indices].to(self.device),
-            indices  # n-step
-        )
+        return self.sample_batch_from_indices(indices) + (indices,)  # n-step
 
     def sample_batch_from_indices(self, indices=None):  # n-step
         # if indices == None:
         #     indices = [self.index]
-        return (
-            self.states[indices].to(self.device),
-            self.actions[indices].to(self.device),
-            self.rewards[indices].to(self.device),
-            self.next_states[indices].to(self.device),
-            self.dones[indices].to(self.device)
-        )
+        return to_tensors(self.storage.get_batch(indices), self.device)
 
     @staticmethod
     def _get_n_step_info(n_step_buffer: Deque, gamma: float):
@@ -303,6 +251,17 @@ class NStepDiscreteBuffer:
 
         return reward, next_state, done
 
+    @property
+    def index(self):
+        return self.storage.index
+
+    def flush(self):
+        self.storage.flush()
+
+    @property
+    def size(self):
+        return self.storage.size
+
     def __len__(self) -> int:
         return self.size
 
@@ -326,15 +285,18 @@ class PrioritizedReplayBuffer(NStepDiscreteBuffer):
             device,
             n_step: int = 1,
             gamma: float = 0.99,
-            alpha: float = 0.6
+            alpha: float = 0.6,
+            n_actions: int = None,
+            obs_dtype=numpy.float32,
+            obs_scale: float = None,
+            path: str = None
     ):
         """Initialization."""
         assert alpha >= 0
 
         super(PrioritizedReplayBuffer, self).__init__(
-            max_size, batch_size, state_d, device, n_step, gamma
+            max_size, batch_size, state_d, device, n_step, gamma, n_actions, obs_dtype, obs_scale, path
         )
-        self.max_priority, self.tree_ptr = 1.0, 0
         self.alpha = alpha
 
         # capacity must be positive and a power of 2.
@@ -342,20 +304,38 @@ class PrioritizedReplayBuffer(NStepDiscreteBuffer):
         while tree_capacity < self.max_size:
             tree_capacity *= 2
 
-        self.sum_tree = SumSegmentTree(tree_capacity)
-        self.min_tree = MinSegmentTree(tree_capacity)
+        # trees and max priority are stored with the transitions (memory-mapped with a path)
+        self.sum_tree = SumSegmentTree(tree_capacity, self.storage.open_array(
+            'sum_tree', (2 * tree_capacity,), numpy.float64))
+        self.min_tree = MinSegmentTree(tree_capacity, self.storage.open_array(
+            'min_tree', (2 * tree_capacity,), numpy.float64, float("inf")))
+        self.stored_max_priority = self.storage.open_array('max_priority', (1,), numpy.float64, 1.0)
+        self.max_priority, self.tree_ptr = float(self.stored_max_priority[0]), self.storage.index
 
-    def add(self, state, action, reward, next_state, done):
-        """Store experience and priority."""
-        transition = super().adding_to_buffer(state, action, reward, next_state, done)
+    def add(self, state, action, reward, next_state, done, priority=None):
+        """Store experience and priority (max priority if None, e.g. the TD error computed by an actor otherwise)."""
+        transition = super().adding_to_buffer(state, action, reward, next_state, done, priority)
 
         if transition:
-            self.sum_tree[self.tree_ptr] = self.max_priority ** self.alpha
-            self.min_tree[self.tree_ptr] = self.max_priority ** self.alpha
+            priority = self.priority_buffer[0]
+            if priority is None:
+                priority = self.max_priority
+            else:
+                self.max_priority = max(self.max_priority, priority)
+                self.stored_max_priority[0] = self.max_priority
+            self.sum_tree[self.tree_ptr] = priority ** self.alpha
+            self.min_tree[self.tree_ptr] = priority ** self.alpha
             self.tree_ptr = (self.tree_ptr + 1) % self.max_size
 
         return transition
 
+    def remove_newest(self):
+        # drops the newest transition and its priority
+        slot = self.storage.remove_newest()
+        self.sum_tree[slot] = 0.0
+        self.min_tree[slot] = float("inf")
+        self.tree_ptr = self.storage.index
+
     def ready_to_sample(self):
         return self.size >= self.batch_size
 
@@ -365,54 +345,40 @@ class PrioritizedReplayBuffer(NStepDiscreteBuffer):
             return None, None, None, None, None, None, None
 
         indices = self._sample_proportional()
-        return (
-            self.states[indices].to(self.device),
-            self.actions[indices].to(self.device),
-            self.rewards[indices].to(self.device),
-            self.next_states[indices].to(self.device),
-            self.dones[indices].to(self.device),
-            torch.tensor([self._calculate_weight(i, beta) for i in indices]).unsqueeze(1).to(self.device),
+        return self.sample_batch_from_indices(indices) + (
+            torch.tensor(self._calculate_weights(indices, beta), dtype=torch.float).unsqueeze(1).to(self.device),
             indices
         )
-    # numpy.array([self._calculate_weight(i, beta) for i in indices])
 
-    def update_priorities(self, indices: List[int], priorities: numpy.ndarray):
-        """Update priorities of sampled transiti ons."""
+    def update_priorities(self, indices: numpy.ndarray, priorities: numpy.ndarray):
+        """Update priorities of sampled transitions."""
+        indices = numpy.asarray(indices)
+        priorities = numpy.asarray(priorities, dtype=numpy.float64).reshape(-1)
         assert len(indices) == len(priorities)
+        assert numpy.all(priorities > 0)
+        assert numpy.all((0 <= indices) & (indices < self.storage.filled))
 
-        for idx, priority in zip(indices, priorities):
-            assert priority > 0
-            assert 0 <= idx < len(self)
-
-            self.sum_tree[idx] = priority ** self.alpha
-            self.min_tree[idx] = priority ** self.alpha
+        priorities_alpha = priorities ** self.alpha
+        self.sum_tree.update(indices, priorities_alpha)
+        self.min_tree.update(indices, priorities_alpha)
 
-            self.max_priority = max(self.max_priority, priority)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.stored_max_priority[0] = self.max_priority
 
-    def _sample_proportional(self) -> List[int]:
-        """Sample indices based on proportions."""
-        indices = []
-        p_total = self.sum_tree.sum(0, self.size - 1)
-        segment = p_total / self.batch_size
+    def _sample_proportional(self) -> numpy.ndarray:
+        """Sample indices based on proportions - one upper bound in each of batch_size equal segments."""
+        segment = self.sum_tree.sum() / self.batch_size   # leaves after size are 0
+        upperbounds = segment * (numpy.arange(self.batch_size) + numpy.random.uniform(size=self.batch_size))
+        return self.sum_tree.retrieve(upperbounds)
 
-        for i in range(self.batch_size):
-            a = segment * i
-            b = segment * (i + 1)
-            upperbound = random.uniform(a, b)
-            idx = self.sum_tree.retrieve(upperbound)
-            indices.append(idx)
-
-        return indices
-
-    def _calculate_weight(self, idx: int, beta: float):
-        """Calculate the weight of the experience at idx."""
+    def _calculate_weights(self, indices: numpy.ndarray, beta: float) -> numpy.ndarray:
+        """Calculate the weights of the experiences at indices."""
+        p_total = self.sum_tree.sum()
         # get max weight
-        p_min = self.min_tree.min() / self.sum_tree.sum()
+        p_min = self.min_tree.min() / p_total
         max_weight = (p_min * len(self)) ** (-beta)
 
         # calculate weights
-        p_sample = self.sum_tree[idx] / self.sum_tree.sum()
-        weight = (p_sample * len(self)) ** (-beta)
-        weight = weight / max_weight
-
-        return weight
+        p_sample = self.sum_tree[indices] / p_total
+        weights = (p_sample * len(self)) ** (-beta)
+        return weights / max_weight
@@ -0,0 +1,96 @@
+class CouplingTask:
+    # coupling state of one command of CustomEnvironment
+    def __init__(self):
+        self.active = False     # a master waits for slaves
+        self.master = None      # AGV the next slave is assigned to
+        self.count = 0      # slaves that still have to be assigned
+        self.formation = [1, 1]     # AGVs in width and length direction
+
+
+class CouplingTaskTable:
+    """
+    Coupling tasks of CustomEnvironment - one CouplingTask per command (see MachineLearning/ActionTable.py).
+
+    The slaves of a master are the members of factory.coupling_registry (kept up to date by the AGV.coupling_master
+    setter), so the table holds no copy of them. Free formation slots are taken from a bitmap of the slots of the
+    members (bit length * AGVs in width direction + width). The registry version tells whether coupling assignments
+    changed since the last check for two masters searching slaves for the same task.
+    """
+    def __init__(self, factory, n_commands):
+        self.registry = factory.coupling_registry
+        self.tasks = [CouplingTask() for _ in range(n_commands)]
+        self.checked_version = None     # registry version of the last duplicate master check
+
+    def __getitem__(self, command_index):
+        return self.tasks[command_index]
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def reset(self):
+        for task in self.tasks:
+            task.__init__()
+        self.checked_version = None
+
+    def start(self, command_index, master, formation):
+        # master waits for formation[0] * formation[1] - 1 slaves
+        task = self.tasks[command_index]
+        task.formation = formation
+        task.master = master
+        task.count = formation[0] * formation[1] - 1
+        task.active = True
+
+    def reopen(self, master):
+        # a coupled AGV left the master - the task needs another slave
+        task = self.tasks[master.task_number]
+        task.master = master
+        task.count += 1
+
+    def close(self, command_index):
+        # master left without slaves to take over
+        task = self.tasks[command_index]
+        task.master = None
+        task.active = False
+
+    def has_searching_master(self, command_index, agv):
+        # another master of the task still waits for slaves
+        for master in self.registry.get_masters():
+            if master.task_number == command_index and master is not agv and not master.will_coupling_be_complete():
+                return True
+        return False
+
+    def get_free_slot(self, command_index):
+        """
+        First free formation slot of the task's master in the order length, width - [0, 0] if none is free. If the
+        slot [0, 0] of the master is free, the search continues in the second row.
+        :return: list - [width, length]
+        """
+        task = self.tasks[command_index]
+        n_width, n_length = task.formation
+        occupied = 0
+        for agv in self.registry.get_members(task.master):
+            width, length = agv.coupling_formation_position
+            if 0 <= width < n_width and 0 <= length < n_length:
+                occupied |= 1 << int(length * n_width + width)
+        free = ~occupied & ((1 << n_width * n_length) - 1)
+        if free & 1:
+            free = free >> n_width << n_width
+        if not free:
+            return [0, 0]
+        slot = (free & -free).bit_length() - 1
+        return [slot % n_width, slot // n_width]
+
+    def has_assignments_changed(self):
+        # True once after every change of the coupling registry
+        if self.registry.version == self.checked_version:
+            return False
+        self.checked_version = self.registry.version
+        return True
+
+    def get_state(self):
+        return [(task.active, task.master, task.count, task.formation) for task in self.tasks]
+
+    def set_state(self, state):
+        for task, (active, master, count, formation) in zip(self.tasks, state):
+            task.active, task.master, task.count, task.formation = active, master, count, formation
+        self.checked_version = None
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+# histories saved by CustomEnvironment.close() when variation_training is active
+HISTORY_NAMES = ["_end_product_counts", "_reward_history", "_machine_status_history", "_agv_free_history",
+                 "_restart_history"]
+
+
+class EnvironmentFactory:
+    """
+    Picklable constructor for the environments of an EnvironmentPool (lambdas can not be sent to worker processes).
+    Every worker saves its histories under var_save_name + "_worker<rank>", without a rank (single environment) under
+    var_save_name.
+    """
+    def __init__(self, env_class, rank=None, **env_kwargs):
+        self.env_class = env_class
+        self.rank = rank
+        self.env_kwargs = env_kwargs
+
+    def __call__(self):
+        env_kwargs = dict(self.env_kwargs)
+        if self.rank is not None and env_kwargs.get('var_save_name') is not None:
+            env_kwargs['var_save_name'] = get_worker_save_name(env_kwargs['var_save_name'], self.rank)
+        return self.env_class(**env_kwargs)
+
+
+class EnvironmentPool(SubprocVecEnv):
+    """
+    Runs every environment in its own process (one core each). The per-worker histories are merged when the pool
+    is closed.
+    """
+    def __init__(self, env_class, n_envs, start_method=None, **env_kwargs):
+        """
+        :param env_class: gymnasium.Env class, e.g. CustomEnvironment
+        :param n_envs: int - number of worker processes
+        :param env_kwargs: keyword arguments of env_class (render is not supported in worker processes)
+        """
+        self.var_save_path = env_kwargs.get('var_save_path')
+        self.var_save_name = env_kwargs.get('var_save_name')
+        self.merge_histories = env_kwargs.get('variation_training', False)
+        super().__init__([EnvironmentFactory(env_class, rank, **env_kwargs) for rank in range(n_envs)],
+                         start_method=start_method)
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()     # workers save their histories in CustomEnvironment.close()
+        if self.merge_histories:
+            merge_worker_histories(self.var_save_path, self.var_save_name, self.num_envs)
+
+
+def make_environment_pool(env_class, n_envs=1, **env_kwargs):
+    # n_envs == 1 keeps the environment in the main process (e.g. for rendering) and its history file names
+    if n_envs == 1:
+        return DummyVecEnv([EnvironmentFactory(env_class, **env_kwargs)])
+    return EnvironmentPool(env_class, n_envs, **env_kwargs)
+
+
+def get_worker_save_name(save_name, rank):
+    return str(save_name) + "_worker" + str(rank)
+
+
+def merge_worker_histories(save_path, save_name, n_envs, remove_worker_files=True):
+    """
+    Concatenates the histories of all workers along the time axis (worker 0 first) and saves them under save_name,
+    so they can be evaluated like the histories of a single environment.
+    :return: list of the merged file paths
+    """
+    merged_files = []
+    for history_name in HISTORY_NAMES:
+        worker_files = [os.path.join(save_path, get_worker_save_name(save_name, rank) + history_name + ".npy")
+                        for rank in range(n_envs)]
+        worker_files = [file_path for file_path in worker_files if os.path.exists(file_path)]
+        if not worker_files:
+            continue
+        histories = [np.load(file_path) for file_path in worker_files]
+        file_path = os.path.join(save_path, str(save_name) + history_name + ".npy")
+        np.save(file_path, np.concatenate(histories, axis=-1))
+        merged_files.append(file_path)
+        if remove_worker_files:
+            for worker_file in worker_files:
+                os.remove(worker_file)
+    return merged_files
@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class ObservationBuilder:
+    """
+    Builds the observations of CustomEnvironment for N factories with the same layout in one preallocated
+    (N, size) np.float32 buffer - N = 1 for a single environment, N copies in VectorFactory.
+
+    Layout of a row (same order as before):
+        per AGV: free, not loaded, normalized distances to all warehouses and machines, task
+        per warehouse: has output, rest process time
+        per machine: input priority, output priority, rest process time
+
+    Every part is written for all factories at once: the attributes of all AGVs, warehouses and machines are read
+    in one pass each, the distances of all AGVs of all factories to their stations are computed in one broadcast.
+    The middle positions of warehouses and machines are cached until a factory grid changes.
+    """
+    def __init__(self, factories, n_agv_commands):
+        """
+        :param factories: list of Factory - same number of AGVs, warehouses and machines
+        :param n_agv_commands: int
+        """
+        self.factories = factories
+        self.n_agv_commands = n_agv_commands
+        factory = factories[0]
+        self.n_factories = len(factories)
+        self.n_agv = len(factory.agvs)
+        self.n_stations = len(factory.warehouses) + len(factory.machines)
+        self.agv_size = 2 + self.n_stations + 1
+        self.size = self.n_agv * self.agv_size + len(factory.warehouses) * 2 + len(factory.machines) * 3
+
+        self.buffer = np.zeros(shape=(self.n_factories, self.size), dtype=np.float32)
+        # views into the buffer - rows of all factories one after another
+        agv_end = self.n_agv * self.agv_size
+        warehouse_end = agv_end + len(factory.warehouses) * 2
+        self.agv_observation = self.buffer[:, :agv_end].reshape(self.n_factories, self.n_agv, self.agv_size)
+        self.warehouse_observation = self.buffer[:, agv_end:warehouse_end].reshape(self.n_factories, -1, 2)
+        self.machine_observation = self.buffer[:, warehouse_end:].reshape(self.n_factories, -1, 3)
+
+        self.agv_positions = np.zeros(shape=(self.n_factories, self.n_agv, 2), dtype=np.float64)
+        self.station_positions = None
+        self.grid_versions = None
+
+    def update_station_positions(self):
+        self.station_positions = np.array([[station.get_middle_position()
+                                            for station in factory.warehouses + factory.machines]
+                                           for factory in self.factories],
+                                          dtype=np.float64).reshape(self.n_factories, -1, 2)
+        self.grid_versions = [factory.grid.version for factory in self.factories]
+
+    def build(self, positions=None, machine_priorities=None):
+        """
+        :param positions: np.ndarray (N * n_agv, 2) - AGV positions of all factories (e.g. of a shared AGVFleet),
+            read from the AGVs if None
+        :param machine_priorities: list of (input priority, output priority) of all machines of all factories (e.g.
+            of the RewardState of the step), read from the machines if None
+        :return: np.ndarray float32 (N, size) - the reused buffer, copy it to keep the observations
+        """
+        factories = self.factories
+        if self.station_positions is None or self.grid_versions != [factory.grid.version for factory in factories]:
+            self.update_station_positions()
+
+        shape = (self.n_factories, -1)
+        agvs = [agv for factory in factories for agv in factory.agvs]
+        if positions is None:
+            positions = [agv.get_middle_position() for agv in agvs]
+        self.agv_positions.reshape(-1, 2)[:] = positions
+        agv_observation = self.agv_observation
+        agv_observation[:, :, 0] = np.reshape([agv.is_free for agv in agvs], shape)  # free status
+        agv_observation[:, :, 1] = np.reshape([agv.loaded_product is None for agv in agvs], shape)     # load status
+        agv_observation[:, :, -1] = np.reshape([agv.task_number for agv in agvs], shape)   # AGVs' task
+        agv_observation[:, :, -1] /= self.n_agv_commands - 1
+
+        # distances of every AGV to every station of its factory, normalized by the largest distance of the AGV
+        differences = self.agv_positions[:, :, np.newaxis, :] - self.station_positions[:, np.newaxis, :, :]
+        distances = np.sqrt(differences[..., 0] * differences[..., 0] + differences[..., 1] * differences[..., 1])
+        agv_observation[:, :, 2:2 + self.n_stations] = distances / distances.max(axis=2, keepdims=True)
+
+        self.warehouse_observation[:] = np.reshape([[len(warehouse.buffer_output_load) > 0,
+                                                     warehouse.get_production_rest_time_percent()]
+                                                    for factory in factories for warehouse in factory.warehouses],
+                                                   self.warehouse_observation.shape)
+        machines = [machine for factory in factories for machine in factory.machines]
+        if machine_priorities is None:
+            machine_priorities = [machine.get_buffer_status() for machine in machines]
+        machine_observation = self.machine_observation
+        machine_observation[:, :, :2] = np.reshape(machine_priorities, machine_observation[:, :, :2].shape)
+        machine_observation[:, :, :2] *= 0.25
+        machine_observation[:, :, 2] = np.reshape([machine.get_production_rest_time_percent() for machine in machines],
+                                                  shape)
+        return self.buffer
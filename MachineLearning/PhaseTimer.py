@@ -0,0 +1,94 @@
+import time
+
+
+class PhaseTimer:
+    """
+    Wall time of the phases of CustomEnvironment.step (action, simulation, reward, observation, ...) per step and per
+    episode, measured with time.perf_counter.
+
+    Usage: start = timer.start() before the first phase, start = timer.lap('phase', start) after every phase. A
+    disabled timer returns at once without reading the clock, so it can stay in the step code.
+    """
+    def __init__(self, enabled=False, summary_interval=0):
+        """
+        :param enabled: bool
+        :param summary_interval: int - episodes between two printed summaries, 0 for no summaries
+        """
+        self.enabled = enabled
+        self.summary_interval = summary_interval
+        self.step_times = {}    # phase -> seconds of the current step
+        self.episode_times = {}     # phase -> seconds of the current episode
+        self.episode_steps = 0
+        self.last_episode_times = {}    # phase -> seconds of the last finished episode
+        self.last_episode_steps = 0
+        self.summary_times = {}     # phase -> seconds since the last summary
+        self.summary_steps = 0
+        self.episodes = 0
+
+    def start(self):
+        if not self.enabled:
+            return 0.0
+        return time.perf_counter()
+
+    def begin_step(self):
+        # start() of the first phase of a step
+        if not self.enabled:
+            return 0.0
+        self.episode_steps += 1
+        return time.perf_counter()
+
+    def lap(self, phase, start):
+        """
+        Adds the time since start to phase.
+        :return: float - start of the next phase
+        """
+        if not self.enabled:
+            return 0.0
+        now = time.perf_counter()
+        self.add(phase, now - start)
+        return now
+
+    def add(self, phase, duration):
+        # e.g. share of a phase that VectorFactory runs for all environments at once
+        if not self.enabled:
+            return
+        self.step_times[phase] = self.step_times.get(phase, 0.0) + duration
+        self.episode_times[phase] = self.episode_times.get(phase, 0.0) + duration
+
+    def end_step(self):
+        # :return: dict phase -> seconds of the finished step
+        step_times = self.step_times
+        self.step_times = {}
+        return step_times
+
+    def end_episode(self):
+        if self.episode_steps == 0:
+            return
+        self.last_episode_times = self.episode_times
+        self.last_episode_steps = self.episode_steps
+        for phase, duration in self.episode_times.items():
+            self.summary_times[phase] = self.summary_times.get(phase, 0.0) + duration
+        self.summary_steps += self.episode_steps
+        self.episode_times = {}
+        self.episode_steps = 0
+        self.episodes += 1
+        if self.summary_interval > 0 and self.episodes % self.summary_interval == 0:
+            print(self.get_summary(self.summary_times, self.summary_steps))
+            self.summary_times = {}
+            self.summary_steps = 0
+
+    def add_info(self, info, episode_done=False):
+        # phase times of the step (and of the finished episode) for the info dict of step()
+        info['phase_times'] = self.end_step()
+        if episode_done:
+            info['episode_phase_times'] = dict(self.last_episode_times, steps=self.last_episode_steps)
+
+    def get_summary(self, times=None, steps=None):
+        if times is None:
+            times, steps = self.last_episode_times, self.last_episode_steps
+        total = sum(times.values())
+        lines = ["Step phases (" + str(steps) + " steps, " + str(round(total / max(steps, 1) * 1e6, 1)) + " us/step):"]
+        for phase, duration in sorted(times.items(), key=lambda item: -item[1]):
+            lines.append("  " + phase.ljust(20) + str(round(duration / max(steps, 1) * 1e6, 1)).rjust(10) +
+                         " us/step " + str(round(duration / total * 100 if total > 0 else 0.0, 1)).rjust(6) + " %")
+        return "\n".join(lines)
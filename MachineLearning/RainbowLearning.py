@@ -1,6 +1,8 @@
 import gc
+import os
 import random
 
+import numpy
 import torch
 from torch.nn.modules import loss
 
@@ -28,18 +30,29 @@ class RainbowLearning:
             v_min (float): min value of support in the net
             v_max (float): max value of support in the net
             atom_size (int): the unit number of support in the net
+            obs_dtype (str): storage type of the observations in the memories (float32, float16 or uint8)
+            obs_scale (float): quantization factor of uint8 observations (see MachineLearning/ReplayStorage.py)
+            memory_path (str): folder of memory-mapped memories - the memories of an earlier run with this folder are
+                reopened and continued, save() flushes them
+            device (str): torch device, cuda if available if None
+            gc_interval (int): updates between two garbage collections (gc.collect), 0 never collects
         """
 
     def __init__(self, state_d: int, action_d: int, net=None, lr=1e-3, gamma: float = 0.95,
                  memory_size: int = 1024, batch_size: int = 256, alpha: float = 0.2, beta: float = 0.6,
                  prior_eps: float = 1e-6, target_update: int = 100, std_init: float = 0.5, n_step: int = 2,
-                 v_min: float = 0.0, v_max: float = 200.0, atom_size: int = 20):
+                 v_min: float = 0.0, v_max: float = 200.0, atom_size: int = 20, obs_dtype='float32',
+                 obs_scale: float = None, memory_path: str = None, device: str = None, gc_interval: int = 1):
         if net is None:
             raise ValueError('Error: Got no neural net class!')
 
         self.gamma = gamma
         self.batch_size = batch_size
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        if device is None:
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.device = torch.device(device)
+        self.gc_interval = gc_interval
+        self.update_counter = 0
 
         # categorical
         self.v_min = v_min
@@ -50,7 +63,6 @@ class RainbowLearning:
         self.target_update = target_update
         self.target_update_counter = 0
 
-        self.memory = PrioritizedReplayBuffer(memory_size, self.batch_size, state_d, self.device, n_step, self.gamma, alpha)
         self.policy_net = net(state_d, action_d, atom_size, self.support, std_init).to(self.device)
         self.target_net = net(state_d, action_d, atom_size, self.support, std_init).to(self.device)
         self.target_net.load_state_dict(self.policy_net.state_dict())
@@ -58,18 +70,41 @@ class RainbowLearning:
         self.optimizer = torch.optim.AdamW(self.policy_net.parameters(), lr=lr)
         self.action = 0
         self.state = torch.FloatTensor([0.5, 0.5]).to(self.device)
+        self.actions = None     # actions and states of the environments of the last get_actions call
+        self.states = None
         self.train_thread = None
 
         self.beta = beta
         self.prior_eps = prior_eps
         self.memory = PrioritizedReplayBuffer(
-            memory_size, batch_size, state_d, self.device, n_step, gamma, alpha
+            memory_size, batch_size, state_d, self.device, n_step, gamma, alpha, action_d, obs_dtype, obs_scale,
+            None if memory_path is None else os.path.join(memory_path, 'memory')
         )
 
         self.use_n_step = True if n_step > 1 else False
         if self.use_n_step:
             self.n_step = n_step
-            self.memory_n = NStepDiscreteBuffer(memory_size, self.batch_size, state_d, self.device, n_step, self.gamma)
+            self.memory_n = NStepDiscreteBuffer(memory_size, self.batch_size, state_d, self.device, n_step, self.gamma,
+                                                action_d, obs_dtype, obs_scale,
+                                                None if memory_path is None else os.path.join(memory_path, 'memory_n'))
+            if memory_path is not None:
+                self.check_memories()
+
+    def check_memories(self):
+        """
+        Checks that reopened memories hold the same transitions (memory_n stores its transition right after
+        memory, see add_transition). A process killed in between leaves memory one transition ahead - it is dropped
+        (if it overwrote an old transition, memory_n keeps that one in the slot, it is not sampled).
+        """
+        memory, memory_n = self.memory.storage, self.memory_n.storage
+        if (memory.index, memory.size) == (memory_n.index, memory_n.size):
+            return
+        if memory.index == (memory_n.index + 1) % memory.capacity and memory.size in (memory_n.size, memory_n.size + 1):
+            self.memory.remove_newest()
+            return
+        raise ValueError("Memories in " + str(memory.path) + " and " + str(memory_n.path) + " do not match: index " +
+                         str(memory.index) + " and " + str(memory_n.index) + ", size " + str(memory.size) + " and " +
+                         str(memory_n.size))
 
     def set_state(self, state):
         self.state = torch.tensor([state], device=self.device, dtype=torch.float)
@@ -91,6 +126,49 @@ class RainbowLearning:
         self.action = torch.argmax(probability).item()
         return self.action
 
+    def get_actions(self, states):
+        """
+        Actions of several environments (e.g. of an EnvironmentPool) with one forward pass of the policy net.
+        :param states: numpy.ndarray or tensor - one state per environment (n_envs x state_d)
+        :return: numpy.ndarray - action index per environment
+        """
+        if not torch.is_tensor(states):
+            states = torch.from_numpy(numpy.asarray(states, dtype=numpy.float32))
+        self.states = states.to(self.device, torch.float)
+        with torch.no_grad():
+            probability = self.policy_net(self.states)
+        self.actions = probability.argmax(1).cpu().numpy()
+        return self.actions
+
+    def add_batch(self, next_states, rewards, dones, infos=None):
+        """
+        Adds the transitions of the environments of the last get_actions call to the memories. Every environment has
+        its own n-step window, so the episodes of the environments may end independently.
+        :param next_states: one state per environment after the step - of a stable_baselines3 VecEnv the first state
+            of the new episode for done environments
+        :param infos: list of dict - infos of a VecEnv, the 'terminal_observation' is the next state of a done
+            environment
+        """
+        states = self.states.cpu().numpy()
+        next_states = next_states.cpu().numpy() if torch.is_tensor(next_states) else numpy.asarray(next_states)
+        for k in range(len(states)):
+            next_state = next_states[k]
+            if dones[k] and infos is not None and 'terminal_observation' in infos[k]:
+                next_state = numpy.asarray(infos[k]['terminal_observation'])
+            self.select_stream(k)
+            self.add_transition(states[k], int(self.actions[k]), float(rewards[k]), next_state, int(dones[k]))
+
+    def select_stream(self, stream):
+        # n-step windows of stream (e.g. an environment index) for the following transitions, see add_batch
+        self.memory.select_stream(stream)
+        if self.use_n_step:
+            self.memory_n.select_stream(stream)
+
+    def clear_streams(self):
+        self.memory.clear_streams()
+        if self.use_n_step:
+            self.memory_n.clear_streams()
+
     def add_memory_data(self, next_state, reward, done, action=None):
         next_state = torch.tensor([next_state], device=self.device, dtype=torch.float)
         self.add_data_to_memories(next_state, reward, done, action)
@@ -102,26 +180,38 @@ class RainbowLearning:
     def add_data_to_memories(self, next_state, reward, done, action=None):
         if action is None:
             action = self.action
-
-            # N-step transition
-            if self.use_n_step:
-                one_step_transition = self.memory_n.add(self.state, action, reward, next_state, done)
-            # 1-step transition
-            else:
-                one_step_transition = (self.state, action, reward, next_state, done)
-
-            # add a single step transition
-            if one_step_transition:
-                self.memory.add(*one_step_transition)
+            self.select_stream(0)
+            self.add_transition(self.state, action, reward, next_state, done)
         else:
             print("action error")
         self.state = next_state
 
+    def add_transition(self, state, action, reward, next_state, done, priority=None):
+        """
+        Adds a transition of any state (e.g. of an actor process) to the memories.
+        :param priority: float - initial priority, the max priority of the memory if None
+        """
+        # N-step transition - stored in memory_n together with the transition in memory (same index)
+        if self.use_n_step:
+            one_step_transition = self.memory_n.add_pending(state, action, reward, next_state, done, priority)
+            priority = self.memory_n.priority_buffer[0]     # priority of the returned transition
+        # 1-step transition
+        else:
+            one_step_transition = (state, action, reward, next_state, done)
+
+        # add a single step transition
+        if one_step_transition:
+            if self.memory.add(*one_step_transition, priority=priority) and self.use_n_step:
+                self.memory_n.store_pending()
 
     def train(self):
+        """
+        :return: float - loss of the update, None if the memory holds less than batch_size transitions
+        """
         states, actions, rewards, next_states, dones, weights, indices = self.memory.sample_batch(self.beta)
         if states is not None:
-            self.q_learning_batch(states, actions, rewards, next_states, dones, weights, indices)
+            return self.q_learning_batch(states, actions, rewards, next_states, dones, weights, indices)
+        return None
 
     def q_learning_batch(self, states, actions, rewards, next_states, dones, weights, indices):
         elementwise_loss = self.compute_loss(states, actions, rewards, next_states, dones, self.gamma)
@@ -155,7 +245,9 @@ class RainbowLearning:
         del states, actions, rewards, next_states, dones, weights, indices
         del elementwise_loss, loss_rain, n_gamma, n_states, n_action, n_rewards, n_next_states, n_dones
         del elementwise_n_loss
-        gc.collect()
+        self.update_counter += 1
+        if self.gc_interval and self.update_counter % self.gc_interval == 0:
+            gc.collect()
 
         return loss_number
 
@@ -178,14 +270,22 @@ class RainbowLearning:
 
     def save(self, name):
         self.policy_net.save(name)
+        self.flush_memories()
+
+    def flush_memories(self):
+        # writes memory-mapped memories to disk (see memory_path)
+        self.memory.flush()
+        if self.use_n_step:
+            self.memory_n.flush()
 
     def compute_loss(self, states, actions, rewards, next_states, dones, gamma):
+        batch_size = states.shape[0]    # batch_size or any other number of transitions
         delta_z = float(self.v_max - self.v_min) / (self.atom_size - 1)
 
         with torch.no_grad():
             next_action = self.policy_net(next_states).argmax(1)
             next_dist = self.target_net.dist(next_states)
-            next_dist = next_dist[range(self.batch_size), next_action]
+            next_dist = next_dist[range(batch_size), next_action]
 
             t_z = rewards + (1 - dones) * gamma * self.support
             t_z = t_z.clamp(self.v_min, self.v_max)
@@ -193,14 +293,14 @@ class RainbowLearning:
             lower = bound.floor().long()
             upper = bound.ceil().long()
 
-            offset = torch.linspace(0, (self.batch_size - 1) * self.atom_size, self.batch_size
-                                    ).long().unsqueeze(1).expand(self.batch_size, self.atom_size).to(self.device)
+            offset = torch.linspace(0, (batch_size - 1) * self.atom_size, batch_size
+                                    ).long().unsqueeze(1).expand(batch_size, self.atom_size).to(self.device)
             proj_dist = torch.zeros(next_dist.size(), device=self.device)
             proj_dist.view(-1).index_add_(0, (lower + offset).view(-1), (next_dist * (upper.float() - bound)).view(-1))
             proj_dist.view(-1).index_add_(0, (upper + offset).view(-1), (next_dist * (bound - lower.float())).view(-1))
 
         dist = self.policy_net.dist(states)
-        log_p = torch.log(dist[range(self.batch_size), actions.squeeze()])  # + 1e-6 ???
+        log_p = torch.log(dist[range(batch_size), actions.squeeze(1)])  # + 1e-6 ???
 
         elementwise_loss = -(proj_dist * log_p).sum(1)
 
@@ -0,0 +1,290 @@
+import json
+import os
+
+import numpy
+import torch
+from numpy.lib.format import open_memmap
+
+
+def get_index_dtype(n_values):
+    """
+    :param n_values: int - number of different values (e.g. actions), None if unknown
+    :return: numpy.dtype - smallest unsigned integer type holding 0 ... n_values - 1
+    """
+    if n_values is None:
+        return numpy.dtype(numpy.int32)
+    return numpy.min_scalar_type(max(n_values - 1, 0))
+
+
+class ReplayStorage:
+    """
+    Ring storage of transitions (state, action, reward, next_state, done) in compact NumPy arrays.
+
+    With share_next_state the storage keeps one observation array: the next state of a transition is the state of the
+    following slot. Each add writes the next state into the following slot, and the next transition starts there if
+    its state is the same (the usual case within an episode). Otherwise (e.g. after a reset) that slot is a gap that
+    only keeps the next state and the transition starts one slot later. Gaps take a slot but are not sampled. Without
+    share_next_state the next states are stored in their own array (transitions whose next state is not the
+    following one, e.g. n-step transitions).
+
+    With a path the arrays are .npy memory maps in the folder path (can exceed the RAM, the OS page cache keeps the
+    used parts), the counters are kept in a small memory-mapped header that is updated with every add. A storage
+    created with the path of an existing one reopens its files without reading them and continues with the stored
+    transitions (e.g. a resumed training run). flush() writes the changed pages to disk - every flush_interval adds
+    and on request, the data of a killed process is kept by the OS anyway.
+
+    Observations are stored as obs_dtype: float32, float16 (exact for 0, 0.25, 0.5, 1.0, about 3 digits for other
+    values) or an integer type with obs_scale - stored value round(obs * obs_scale), e.g. uint8 with obs_scale 252
+    stores 0, 0.25, 0.5 and 1.0 exactly and other values of 0 ... 1 with an error of at most 1 / 504. Dones are
+    stored as uint8, rewards as float32.
+    """
+    def __init__(self, max_size, state_d, action_shape=(1,), action_dtype=numpy.int32, obs_dtype=numpy.float32,
+                 obs_scale=None, share_next_state=True, path=None, flush_interval=10000):
+        """
+        :param state_d: int or tuple - size of the observation or shape (e.g. (channels, height, width))
+        :param action_shape: tuple - shape of one action
+        :param obs_dtype: numpy dtype (or name) of the stored observations
+        :param obs_scale: float - quantization factor, needed for integer obs_dtype
+        :param path: str - folder of the memory-mapped files, None keeps the arrays in the RAM
+        :param flush_interval: int - adds between two flushes of the memory-mapped files
+        """
+        self.max_size = max_size
+        self.state_shape = (state_d,) if type(state_d) is int else tuple(state_d)
+        self.obs_dtype = numpy.dtype(obs_dtype)
+        if self.obs_dtype.kind in 'iu' and obs_scale is None:
+            raise ValueError("Integer observation storage needs an obs_scale")
+        self.obs_scale = obs_scale
+        self.share_next_state = share_next_state
+        # one extra slot for the next state of the newest transition
+        self.capacity = max_size + 1 if share_next_state else max_size
+        self.path = path
+        self.flush_interval = flush_interval
+        self.adds_since_flush = 0
+        self.memory_maps = []
+        meta = dict(max_size=max_size, state_shape=list(self.state_shape), action_shape=list(action_shape),
+                    action_dtype=numpy.dtype(action_dtype).str, obs_dtype=self.obs_dtype.str, obs_scale=obs_scale,
+                    share_next_state=share_next_state)
+        is_new = path is None or self.open_folder(meta)
+
+        self.obs = self.open_array('obs', (self.capacity,) + self.state_shape, self.obs_dtype)
+        self.next_obs = None if share_next_state else self.open_array('next_obs', (max_size,) + self.state_shape,
+                                                                      self.obs_dtype)
+        self.action = self.open_array('action', (self.capacity,) + tuple(action_shape), action_dtype)
+        self.reward = self.open_array('reward', (self.capacity, 1), numpy.float32)
+        self.done = self.open_array('done', (self.capacity, 1), numpy.uint8)
+        self.valid = self.open_array('valid', (self.capacity,), bool)   # slot holds a transition (not a gap)
+        # index, size, filled, has_next_slot
+        self.header = self.open_array('header', (4,), numpy.int64) if path is not None else None
+
+        self.index = 0  # next slot
+        self.size = 0   # number of transitions
+        self.filled = 0     # slots written at least once
+        self.has_next_slot = False  # the slot at index holds the next state of the newest transition
+        self.pending_meta = meta if is_new and path is not None else None
+        if not is_new:
+            self.index, self.size, self.filled, has_next_slot = (int(value) for value in self.header)
+            self.has_next_slot = bool(has_next_slot)
+
+    def open_folder(self, meta):
+        """
+        Creates the folder of the memory-mapped files or checks that the existing storage has the same layout.
+        :return: bool - True if the storage is new
+        """
+        meta_file = os.path.join(self.path, 'storage.json')
+        if os.path.exists(meta_file):
+            with open(meta_file) as file:
+                stored_meta = json.load(file)
+            if stored_meta != meta:
+                raise ValueError("Replay storage in " + self.path + " has another layout: " + str(stored_meta))
+            return False
+        os.makedirs(self.path, exist_ok=True)
+        for name in os.listdir(self.path):  # arrays of an incomplete storage
+            if name.endswith('.npy'):
+                os.remove(os.path.join(self.path, name))
+        return True
+
+    def write_meta(self, meta):
+        # written with the first transition (after the buffer opened its arrays) - a storage with storage.json is
+        # complete
+        meta_file = os.path.join(self.path, 'storage.json')
+        with open(meta_file + '.tmp', 'w') as file:
+            json.dump(meta, file)
+        os.replace(meta_file + '.tmp', meta_file)
+
+    def open_array(self, name, shape, dtype, fill_value=0):
+        """
+        :return: numpy.ndarray - memory-mapped .npy file in the folder path (reopened if it exists), filled with
+            fill_value if new
+        """
+        if self.path is None:
+            return numpy.full(shape, fill_value, dtype=dtype)
+        file_name = os.path.join(self.path, name + '.npy')
+        if os.path.exists(file_name):
+            array = open_memmap(file_name, mode='r+')
+            if array.shape != tuple(shape) or array.dtype != numpy.dtype(dtype):
+                raise ValueError("Array " + file_name + " has shape " + str(array.shape) + " and type " +
+                                 str(array.dtype) + ", expected " + str(tuple(shape)) + " " + str(numpy.dtype(dtype)))
+        else:
+            array = open_memmap(file_name, mode='w+', dtype=dtype, shape=tuple(shape))
+            if fill_value != 0:     # new files are filled with zeros
+                array[:] = fill_value
+        self.memory_maps.append(array)
+        return array
+
+    def _write_header(self):
+        self.header[:] = (self.index, self.size, self.filled, self.has_next_slot)
+        if self.pending_meta is not None:
+            self.write_meta(self.pending_meta)
+            self.pending_meta = None
+        self.adds_since_flush += 1
+        if self.adds_since_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        # writes the changed pages of the memory-mapped files to disk
+        for array in self.memory_maps:
+            array.flush()
+        self.adds_since_flush = 0
+
+    def encode(self, observations):
+        if torch.is_tensor(observations):
+            observations = observations.detach().cpu().numpy()
+        observations = numpy.asarray(observations)
+        if self.obs_scale is not None:
+            info = numpy.iinfo(self.obs_dtype)
+            return numpy.clip(numpy.rint(observations * self.obs_scale), info.min, info.max).astype(self.obs_dtype)
+        return observations.astype(self.obs_dtype, copy=False)
+
+    def decode(self, observations):
+        if self.obs_scale is not None:
+            return observations.astype(numpy.float32) * numpy.float32(1.0 / self.obs_scale)
+        return observations.astype(numpy.float32, copy=False)
+
+    def _write_slot(self, slot):
+        # a slot is overwritten - the transition it held is dropped
+        if self.valid[slot]:
+            self.valid[slot] = False
+            self.size -= 1
+        self.filled = max(self.filled, slot + 1)
+
+    def add(self, state, action, reward, next_state, done):
+        """
+        :return: int - slot of the transition
+        """
+        return self._add(self.encode(state).reshape(self.state_shape), action, reward,
+                         self.encode(next_state).reshape(self.state_shape), done)
+
+    def _add(self, state, action, reward, next_state, done):
+        # state and next_state are encoded
+        slot = self.index
+        if self.share_next_state:
+            if not (self.has_next_slot and numpy.array_equal(self.obs[slot], state)):
+                if self.has_next_slot:  # the slot keeps the next state of the newest transition - gap
+                    slot = (slot + 1) % self.capacity
+                self._write_slot(slot)
+                self.obs[slot] = state
+            next_slot = (slot + 1) % self.capacity
+            self._write_slot(next_slot)
+            self.obs[next_slot] = next_state
+            self.has_next_slot = True
+        else:
+            self._write_slot(slot)
+            self.obs[slot] = state
+            self.next_obs[slot] = next_state
+            next_slot = (slot + 1) % self.capacity
+        self.action[slot] = action
+        self.reward[slot] = reward
+        self.done[slot] = done
+        self.valid[slot] = True
+        self.size += 1
+        self.index = next_slot
+        if self.header is not None:
+            self._write_header()
+        return slot
+
+    def remove_newest(self):
+        """
+        Drops the newest transition (e.g. to match another storage after an interrupted add). Only for storages
+        without share_next_state.
+        :return: int - slot of the dropped transition
+        """
+        assert not self.share_next_state and self.size > 0
+        slot = (self.index - 1) % self.capacity
+        self.valid[slot] = False
+        self.size -= 1
+        self.index = slot
+        if self.header is not None:
+            self._write_header()
+        return slot
+
+    def add_batch(self, states, actions, rewards, next_states, dones):
+        """
+        Adds n transitions at once - with one array operation per field if the transitions follow each other (always
+        without share_next_state), otherwise one by one.
+        :return: numpy.ndarray - slots of the transitions
+        """
+        states = self.encode(states).reshape((-1,) + self.state_shape)
+        next_states = self.encode(next_states).reshape((-1,) + self.state_shape)
+        n = len(states)
+        if self.share_next_state:   # states have to continue the newest transition and each other
+            vectorized = (n < self.capacity and self.has_next_slot and
+                          numpy.array_equal(self.obs[self.index], states[0]) and
+                          numpy.array_equal(states[1:], next_states[:-1]))
+        else:
+            vectorized = n <= self.capacity
+        if not vectorized:
+            return numpy.array([self._add(states[k], actions[k], rewards[k], next_states[k], dones[k])
+                                for k in range(n)])
+        slots = (self.index + numpy.arange(n)) % self.capacity
+        written = slots if not self.share_next_state else (self.index + numpy.arange(1, n + 1)) % self.capacity
+        self.size -= int(numpy.count_nonzero(self.valid[written]))
+        self.valid[written] = False
+        self.filled = max(self.filled, int(written.max()) + 1)
+        if self.share_next_state:
+            self.obs[written] = next_states
+        else:
+            self.obs[slots] = states
+            self.next_obs[slots] = next_states
+        self.action[slots] = numpy.asarray(actions).reshape((n,) + self.action.shape[1:])
+        self.reward[slots] = numpy.asarray(rewards, dtype=numpy.float32).reshape(n, 1)
+        self.done[slots] = numpy.asarray(dones).reshape(n, 1)
+        self.valid[slots] = True
+        self.size += n
+        self.index = int((slots[-1] + 1) % self.capacity)
+        if self.header is not None:
+            self._write_header()
+        return slots
+
+    def sample_indices(self, batch_size):
+        # uniform with replacement over the stored transitions
+        if not self.share_next_state:
+            return numpy.random.randint(0, self.size, size=batch_size)
+        indices = numpy.random.randint(0, self.filled, size=batch_size)
+        invalid = ~self.valid[indices]
+        while invalid.any():    # gaps and the slot of the newest next state are redrawn
+            indices[invalid] = numpy.random.randint(0, self.filled, size=int(invalid.sum()))
+            invalid = ~self.valid[indices]
+        return indices
+
+    def get_states(self, indices):
+        return self.decode(self.obs[indices])
+
+    def get_next_states(self, indices):
+        if self.share_next_state:
+            return self.decode(self.obs[(numpy.asarray(indices) + 1) % self.capacity])
+        return self.decode(self.next_obs[indices])
+
+    def get_batch(self, indices):
+        """
+        :return: tuple of numpy.ndarray - float32 states, actions, float32 rewards, float32 next states, uint8 dones
+        """
+        return (self.get_states(indices), self.action[indices], self.reward[indices], self.get_next_states(indices),
+                self.done[indices])
+
+    def get_memory_size(self):
+        # bytes of the stored arrays
+        arrays = [self.obs, self.next_obs, self.action, self.reward, self.done, self.valid]
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def __len__(self):
+        return self.size
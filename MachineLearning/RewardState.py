@@ -0,0 +1,81 @@
+from FactoryObjects.Machine import Machine
+
+# statuses of AGVs that arrived at the output of their coupled delivery
+ARRIVED_STATUSES = frozenset(['waiting_with_master', 'wait_for_coupling', 'master_slave_decision'])
+
+
+class RewardState:
+    """
+    Per-step state of the reward function of CustomEnvironment.
+
+    Machine buffer priorities are computed once per machine, product availability once per (output object, product)
+    and step - instead of once per AGV. The conditions of the AGVs are bitmasks (bit i: AGV i), so the set operations
+    of the reward function cost a few integer operations:
+        arrived: coupled AGV waits at the output of its delivery
+        available: the output object holds the product of the delivery
+        needed: the input machine has an input priority above 0 or the product is an end product of warehouse 0
+        moving: AGV is moving
+    An AGV is in a "good" position if it arrived, the product is available and needed.
+    """
+    def __init__(self, factory):
+        self.factory = factory
+        self.machine_index = {machine: index for index, machine in enumerate(factory.machines)}
+        self.machine_priority = []  # (input priority, output priority) per machine
+        self.arrived = 0
+        self.available = 0
+        self.needed = 0
+        self.moving = 0
+
+    def update_machines(self):
+        self.machine_priority = [machine.get_buffer_status() for machine in self.factory.machines]
+        return self.machine_priority
+
+    def update_agvs(self):
+        # call after update_machines() - the input priorities of the machines are reused
+        end_products = self.factory.warehouses[0].input_products
+        has_product = {}    # (output object, product) -> bool
+        arrived = available = needed = moving = 0
+        bit = 1
+        for agv in self.factory.agvs:
+            if agv.is_moving:
+                moving |= bit
+            master = agv.coupling_master
+            if master:  # coupling_master only exists if task requires coupling
+                if agv.status in ARRIVED_STATUSES:
+                    arrived |= bit
+                key = (master.output_object, master.target_product)
+                product_available = has_product.get(key)
+                if product_available is None:
+                    product_available = has_product[key] = master.output_object.has_product(master.target_product)
+                if product_available:
+                    available |= bit
+                if master.target_product in end_products:
+                    needed |= bit
+                elif isinstance(master.input_object, Machine):
+                    machine_index = self.machine_index.get(master.input_object)
+                    if machine_index is None:
+                        input_priority = master.input_object.get_buffer_status()[0]
+                    else:
+                        input_priority = self.machine_priority[machine_index][0]
+                    if input_priority > 0:
+                        needed |= bit
+            bit <<= 1
+        self.arrived = arrived
+        self.available = available
+        self.needed = needed
+        self.moving = moving
+
+    def is_delivering(self, index):
+        # AGV (or its coupling master) carries the product to the input
+        agv = self.factory.agvs[index]
+        if agv.coupling_master:
+            return agv.coupling_master.status == 'move_to_input'
+        return agv.status == 'move_to_input'
+
+
+def get_indices(mask):
+    # indices of the set bits in ascending order
+    while mask:
+        low_bit = mask & -mask
+        yield low_bit.bit_length() - 1
+        mask ^= low_bit
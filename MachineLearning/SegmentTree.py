@@ -1,78 +1,87 @@
 # -*- coding: utf-8 -*-
 """Segment tree for Prioritized Replay Buffer."""
 
-import operator
 from typing import Callable
 
+import numpy
+
 
 class SegmentTree:
     """ Create SegmentTree.
 
-    Taken from OpenAI baselines github repository:
+    Based on the OpenAI baselines github repository:
     https://github.com/openai/baselines/blob/master/baselines/common/segment_tree.py
 
+    The tree is a NumPy array (node i has the children 2 * i and 2 * i + 1, the leaves start at capacity), so batches
+    of leaves are updated level by level with one array operation per level. The root tree[1] holds the result over
+    all leaves.
+
     Attributes:
         capacity (int)
-        tree (list)
-        operation (function)
+        tree (numpy.ndarray)
+        operation (numpy.ufunc)
 
     """
 
-    def __init__(self, capacity: int, operation: Callable, init_value: float):
+    def __init__(self, capacity: int, operation: Callable, init_value: float, tree: numpy.ndarray = None):
         """Initialization.
 
         Args:
             capacity (int)
-            operation (function)
+            operation (numpy.ufunc): elementwise operation, e.g. numpy.add or numpy.minimum
             init_value (float)
+            tree (numpy.ndarray): float64 array of 2 * capacity nodes used as the tree (e.g. a memory map of a
+                stored tree), a new one filled with init_value if None
 
         """
         assert (
             capacity > 0 and capacity & (capacity - 1) == 0
         ), "capacity must be positive and a power of 2."
         self.capacity = capacity
-        self.tree = [init_value for _ in range(2 * capacity)]
+        if tree is None:
+            tree = numpy.full(2 * capacity, init_value, dtype=numpy.float64)
+        assert tree.shape == (2 * capacity,), "tree must have 2 * capacity nodes."
+        self.tree = tree
         self.operation = operation
-
-    def _operate_helper(
-        self, start: int, end: int, node: int, node_start: int, node_end: int
-    ) -> float:
-        """Returns result of operation in segment."""
-        if start == node_start and end == node_end:
-            return self.tree[node]
-        mid = (node_start + node_end) // 2
-        if end <= mid:
-            return self._operate_helper(start, end, 2 * node, node_start, mid)
-        else:
-            if mid + 1 <= start:
-                return self._operate_helper(start, end, 2 * node + 1, mid + 1, node_end)
-            else:
-                return self.operation(
-                    self._operate_helper(start, mid, 2 * node, node_start, mid),
-                    self._operate_helper(mid + 1, end, 2 * node + 1, mid + 1, node_end),
-                )
+        self.levels = numpy.arange(capacity.bit_length())   # shifts from a leaf to its ancestors
 
     def operate(self, start: int = 0, end: int = 0) -> float:
-        """Returns result of applying `self.operation`."""
+        """Returns result of applying `self.operation` to arr[start], ..., arr[end - 1] (end <= 0 counts from the
+        capacity, the defaults cover all leaves)."""
         if end <= 0:
             end += self.capacity
-        end -= 1
+        if start == 0 and end == self.capacity:
+            return float(self.tree[1])
+        return float(self.operation.reduce(self.tree[self.capacity + start:self.capacity + end]))
 
-        return self._operate_helper(start, end, 1, 0, self.capacity - 1)
+    def update(self, indices, values):
+        """Set the values of the leaves at indices and update their parents.
 
-    def __setitem__(self, idx: int, val: float):
-        """Set value in tree."""
-        idx += self.capacity
-        self.tree[idx] = val
+        Args:
+            indices (array of int): for repeated indices the last value is set
+            values (array of float)
 
-        idx //= 2
-        while idx >= 1:
-            self.tree[idx] = self.operation(self.tree[2 * idx], self.tree[2 * idx + 1])
-            idx //= 2
+        """
+        nodes = numpy.asarray(indices, dtype=numpy.int64) + self.capacity
+        self.tree[nodes] = values
+        nodes = numpy.unique(nodes // 2)
+        while nodes[0] >= 1:
+            self.tree[nodes] = self.operation(self.tree[2 * nodes], self.tree[2 * nodes + 1])
+            nodes = numpy.unique(nodes // 2)
 
-    def __getitem__(self, idx: int) -> float:
-        """Get real value in leaf node of tree."""
-        assert 0 <= idx < self.capacity
+    def __setitem__(self, idx: int, val: float):
+        """Set value in tree - the ancestors of the leaf are the accumulated operation over the leaf value and the
+        siblings on the path to the root."""
+        path = (idx + self.capacity) >> self.levels
+        values = numpy.empty(len(path))
+        values[0] = val
+        values[1:] = self.tree[path[:-1] ^ 1]
+        self.tree[path] = self.operation.accumulate(values)
+
+    def __getitem__(self, idx):
+        """Get real value in leaf node of tree (idx may be an array of indices)."""
+        idx = numpy.asarray(idx)
+        assert numpy.all((0 <= idx) & (idx < self.capacity))
 
         return self.tree[self.capacity + idx]
 
@@ -80,63 +89,66 @@ class SegmentTree:
 class SumSegmentTree(SegmentTree):
     """ Create SumSegmentTree.
 
-    Taken from OpenAI baselines github repository:
+    Based on the OpenAI baselines github repository:
     https://github.com/openai/baselines/blob/master/baselines/common/segment_tree.py
 
     """
 
-    def __init__(self, capacity: int):
+    def __init__(self, capacity: int, tree: numpy.ndarray = None):
         """Initialization.
 
         Args:
             capacity (int)
+            tree (numpy.ndarray)
 
         """
         super(SumSegmentTree, self).__init__(
-            capacity=capacity, operation=operator.add, init_value=0.0
+            capacity=capacity, operation=numpy.add, init_value=0.0, tree=tree
         )
 
     def sum(self, start: int = 0, end: int = 0) -> float:
-        """Returns arr[start] + ... + arr[end]."""
+        """Returns arr[start] + ... + arr[end - 1]."""
         return super(SumSegmentTree, self).operate(start, end)
 
-    def retrieve(self, upperbound: float) -> int:
-        """Find the highest index `i` about upper bound in the tree"""
-        # TO?DO: Check assert case and fix bug
-        assert 0 <= upperbound <= self.sum() + 1e-5, "upperbound: {}".format(upperbound)
-
-        idx = 1
+    def retrieve(self, upperbound):
+        """Find the highest index `i` about upper bound in the tree (upperbound may be an array, then an array of
+        indices is returned)."""
+        upperbounds = numpy.array(upperbound, dtype=numpy.float64, ndmin=1)
+        assert numpy.all((0 <= upperbounds) & (upperbounds <= self.sum() + 1e-5)), "upperbound: {}".format(upperbound)
 
-        while idx < self.capacity:  # while non-leaf
+        idx = numpy.ones(len(upperbounds), dtype=numpy.int64)
+        while idx[0] < self.capacity:  # while non-leaf - all nodes are on the same level
             left = 2 * idx
-            right = left + 1
-            if self.tree[left] > upperbound:
-                idx = 2 * idx
-            else:
-                upperbound -= self.tree[left]
-                idx = right
-        return idx - self.capacity
+            left_values = self.tree[left]
+            go_right = left_values <= upperbounds
+            upperbounds -= numpy.where(go_right, left_values, 0.0)
+            idx = left + go_right
+        idx -= self.capacity
+        if numpy.ndim(upperbound) == 0:
+            return int(idx[0])
+        return idx
 
 
 class MinSegmentTree(SegmentTree):
     """ Create SegmentTree.
 
-    Taken from OpenAI baselines github repository:
+    Based on the OpenAI baselines github repository:
     https://github.com/openai/baselines/blob/master/baselines/common/segment_tree.py
 
     """
 
-    def __init__(self, capacity: int):
+    def __init__(self, capacity: int, tree: numpy.ndarray = None):
         """Initialization.
 
         Args:
             capacity (int)
+            tree (numpy.ndarray)
 
         """
         super(MinSegmentTree, self).__init__(
-            capacity=capacity, operation=min, init_value=float("inf")
+            capacity=capacity, operation=numpy.minimum, init_value=float("inf"), tree=tree
         )
 
     def min(self, start: int = 0, end: int = 0) -> float:
-        """Returns min(arr[start], ...,  arr[end])."""
-        return super(MinSegmentTree, self).operate(start, end)
\ No newline at end of file
+        """Returns min(arr[start], ...,  arr[end - 1])."""
+        return super(MinSegmentTree, self).operate(start, end)
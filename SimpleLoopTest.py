@@ -7,6 +7,10 @@ import matplotlib
 import matplotlib.pyplot as plt
 
 from FactoryObjects.Factory import Factory
+from FactoryObjects.EventSimulation import EventSimulation
+from GUI.FactoryRenderer import FactoryRenderer
+from GUI.PlotProcess import PlotProcess, plot_durations
+from GUI.SimulationPacer import SimulationPacer
 # from MachineLearning.MachineLearningEnvironment import MachineLearningEnvironment
 
 is_ipython = 'inline' in matplotlib.get_backend()
@@ -15,17 +19,23 @@ if is_ipython:
 
 
 class LoopTest:
-    def __init__(self):
-        self.factory = Factory()
-        self.factory.create_temp_factory_machines()
+    def __init__(self, factory=None):
+        if factory is None:
+            factory = Factory()
+            factory.create_temp_factory_machines()
+        self.factory = factory
         self.time_step = 0.1
-        self.simulation_speed = 5
+        self.simulation_speed = 5   # simulated seconds per real second in run_display
+        self.fps = 30   # frames per second of run_display
+        self.plot_interval = 1000   # steps between two plot updates
 
         self.pixel_size = 50
         self.height = self.factory.length
         self.width = self.factory.width
         self.reference_size = self.factory.cell_size * 1000
         self.screen = None
+        self.renderer = None
+        self.plot_process = None
 
         plt.ion()
         self.agvs_workload = []
@@ -43,7 +53,6 @@ class LoopTest:
         self.coupling_master = None
         self.output_object = None
         self.agv_couple_count = 0
-        self.sleep_time = 0.0001
         self.factory_index_list = list(range(len(self.factory.machines)))
 
     def run_display(self):
@@ -58,36 +67,35 @@ class LoopTest:
         pygame.display.set_caption('Color Data Display')
         color_grid = self.factory.get_color_grid()
         self.display_colors(color_grid)
-        real_time_lapsed = 0
-        start_time = time.time()
-        last_time = start_time
-        self.step_counter = 0   # Counts every simulation step. (Frame counter)
-        speed_time_step = self.time_step / self.simulation_speed    # Calculation for the accelerated step time
-        speed_sleep_time = speed_time_step / 4  # Sleep time. Small enough to not get over the time edge
-        while real_time_lapsed < 600:   # Simulation time in seconds. Real Time!
-            time.sleep(speed_sleep_time)
-            current_time = time.time()
-            delta_sim_time = (current_time - last_time)
-            if delta_sim_time < speed_time_step:    # if the time is not done, go back th the while commandline
-                continue
-            last_time += speed_time_step
-            real_time_lapsed = current_time - start_time
-            self.agv_basic_controller_step()
-            self.collect_data()  # collects data for csv and  plot, needs to be active for self.plot_durations()
-            if (self.step_counter % self.simulation_speed) == 0:
-                self.display_colors(color_grid)  # Updates the pygame display
-                self.time_convert(real_time_lapsed)  # prints current time in console
-            if (self.step_counter % 1000) == 0:
-                self.plot_durations()  # plots data
-            self.step_counter += 1
-
-        self.plot_durations(True)
-        # self.write_csv()
+        self.step_counter = 0   # Counts every simulation step.
+        # the simulation runs ahead in batches between the frames, plotting is done in a separate process
+        self.plot_process = PlotProcess(len(self.factory.agvs), len(self.factory.machines))
+        self.plot_process.start()
+        pacer = SimulationPacer(self.time_step, self.simulation_speed, self.fps)
+        pacer.start()
+        while pacer.get_real_time_lapsed() < 600:   # Simulation time in seconds. Real Time!
+            pacer.run_batch(self.display_step)
+            self.display_colors(color_grid)  # Updates the pygame display
+            self.time_convert(pacer.get_real_time_lapsed())  # prints current time in console
+            pacer.wait_for_next_frame()
+
+        print("\nSimulated " + str(round(pacer.get_simulation_time(), 1)) + "s at " +
+              str(round(pacer.get_achieved_speed(), 1)) + "x speed (requested " + str(self.simulation_speed) + "x)")
         pygame.quit()
-        plt.ioff()
-        plt.show()
+        self.plot_process.send(self.system_transport_data, self.system_stock_data, self.agvs_workload,
+                               self.machines_workload)
+        self.plot_process.close()  # shows the result until the plot window is closed
+        # self.write_csv()
         self.factory.shout_down()
 
+    def display_step(self):
+        self.agv_basic_controller_step()
+        self.collect_data()  # collects data for csv and plot
+        if (self.step_counter % self.plot_interval) == 0:
+            self.plot_process.send(self.system_transport_data, self.system_stock_data, self.agvs_workload,
+                                   self.machines_workload)
+        self.step_counter += 1
+
     def run(self):
         for self.step_counter in range(10000):  # Do x steps, attention: depends on time_step
             self.agv_basic_controller_step()
@@ -99,6 +107,21 @@ class LoopTest:
         plt.show()
         self.factory.shout_down()
 
+    def run_event_driven(self, simulation_time=600, max_event_interval=10.0):
+        # headless run that jumps from event to event instead of simulating every time_step
+        event_simulation = EventSimulation(self.factory)
+        start_time = time.time()
+        decisions = 0
+        while event_simulation.clock < simulation_time:
+            self.agv_basic_controller_decision()
+            event_simulation.advance_to_next_event(max_event_interval)
+            decisions += 1
+        print("Simulated " + str(round(event_simulation.clock, 3)) + "s with " + str(event_simulation.step_counter) +
+              " steps (" + str(decisions) + " decisions) in " + str(round(time.time() - start_time, 3)) + "s")
+        print("Finished products: " + str(len(self.factory.warehouses[0].end_product_store)))
+        self.factory.shout_down()
+        return event_simulation
+
     @staticmethod
     def time_convert(sec):
         mins = sec // 60
@@ -111,22 +134,21 @@ class LoopTest:
     def agv_basic_controller_step(self):
         self.block_until_synchronized()
         self.simulate_factory_objects()
+        self.agv_basic_controller_decision()
+
+    def agv_basic_controller_decision(self):
         if self.state == 'idle' or self.state == 'deliver':
             self.find_delivery_pair()
         elif self.state == 'couple':  # agv.unload_if_stuck() prevents the system for unlimited waiting time
             self.command_agvs_to_couple()
 
     def block_until_synchronized(self):
+        # the LockstepScheduler of the factory returns after all AGVs are stepped - nothing to wait for
         all_synchronized = True
-        for i in range(100):
-            all_synchronized = True
-            for agv in self.factory.agvs:
-                if agv.step_counter_last < self.step_counter-1:
-                    all_synchronized = False
-                    break
-            if all_synchronized:
+        for agv in self.factory.agvs:
+            if agv.step_counter_last < self.step_counter-1:
+                all_synchronized = False
                 break
-            time.sleep(self.sleep_time)
         if not all_synchronized:
             print("\n\n !!! ERROR can not synchronize !!!\n\n")
             print(self.step_counter, self.factory.agvs[0].step_counter_next,
@@ -137,6 +159,7 @@ class LoopTest:
     def simulate_factory_objects(self):
         for agv in self.factory.agvs:
             agv.step(self.time_step, self.step_counter)
+        self.factory.step_agvs(self.time_step)
         for warehouse in self.factory.warehouses:
             warehouse.step(self.time_step)
         for machine in self.factory.machines:
@@ -222,7 +245,7 @@ class LoopTest:
         """
         Display a 2D list of color data using pygame.
 
-        :param color_data: 2D list of RGB values.
+        :param color_data: color grid of the factory (not used anymore - the renderer caches it as background)
         """
 
         # Main loop to draw the colors and handle events
@@ -231,46 +254,10 @@ class LoopTest:
                 pygame.quit()
                 sys.exit()
 
-        # Draw the color data
-        for y in range(self.height):
-            for x in range(self.width):
-                pygame.draw.rect(self.screen, color_data[x][y],
-                                 (x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size))
-
-        # Draw the AGVs
-        for agv in self.factory.agvs:
-            agv_pos = [agv.pos_x, agv.pos_y]
-            pygame.draw.rect(self.screen, [0, 0, 0],
-                             (agv_pos[0] * self.pixel_size, agv_pos[1] * self.pixel_size,
-                              agv.width / self.reference_size * self.pixel_size, agv.length / self.reference_size * self.pixel_size),
-                             border_radius=3)
-
-        for agv in self.factory.agvs:
-            if agv.loaded_product is not None:
-                agv_pos = [agv.pos_x, agv.pos_y]
-                pygame.draw.rect(self.screen, [180, 180, 0],
-                                 (agv_pos[0] * self.pixel_size + 2,
-                                  agv_pos[1] * self.pixel_size + 2,
-                                  agv.loaded_product.width / self.reference_size * self.pixel_size, agv.loaded_product.length / self.reference_size * self.pixel_size))
-
-        # Draw machines data
-        for machine in self.factory.machines:
-            font = pygame.font.SysFont('arial', 20)
-            text = font.render(machine.get_status() +
-                               " I:" + str(len(machine.buffer_input_load)) +
-                               " O:" + str(len(machine.buffer_output_load)), True, (0, 0, 0))
-            self.screen.blit(text, [self.pixel_size * machine.pos_x, self.pixel_size * machine.pos_y])
-
-            font = pygame.font.SysFont('arial', 20)
-            text = font.render(str(int(machine.rest_process_time)), True, (0, 0, 0))
-            self.screen.blit(text, [self.pixel_size * machine.pos_x, self.pixel_size * (machine.pos_y + 1)])
-
-        for warehouse in self.factory.warehouses:
-            font = pygame.font.SysFont('arial', 20)
-            text = font.render(str(int(warehouse.rest_process_time)), True, (0, 0, 0))
-            self.screen.blit(text, [self.pixel_size * warehouse.pos_x, self.pixel_size * (warehouse.pos_y + 1)])
-
-        pygame.display.flip()
+        # only the regions that changed since the last frame are redrawn
+        if self.renderer is None or self.renderer.screen is not self.screen:
+            self.renderer = FactoryRenderer(self.factory, self.screen, self.pixel_size, self.reference_size)
+        self.renderer.draw()
 
     def collect_data(self):
         for i in range(len(self.factory.agvs)):
@@ -314,39 +301,8 @@ class LoopTest:
         self.system_transport_data.append(mean)
 
     def plot_durations(self, show_result=False):
-        # plt.figure(1)
-        plt.clf()
-        plt.subplot(1, 2, 1)  # row 1, column 2, count 1
-        plt.plot(self.system_transport_data, label='transport stock', color='r', linewidth=4)
-        plt.plot(self.system_stock_data, label='system stock', color='g', linewidth=2)
-        if show_result:
-            plt.title('Result')
-        else:
-            plt.title('Running...')
-        plt.xlabel('Time in 0.1s Steps')
-        plt.ylabel('Count')
-        plt.legend()
-
-        # using subplot function and creating plot two
-        # row 1, column 2, count 2
-        plt.subplot(1, 2, 2)
-        for i in range(len(self.agvs_workload)):
-            plt.plot(self.agvs_workload[i], label='AGV ' + str(i), linewidth=4-i)
-        for i in range(len(self.machines_workload)):
-            plt.plot(self.machines_workload[i], label='Machine ' + str(i), linewidth=4-i)
-        plt.title('Workload')
-        plt.xlabel('Time in 0.1s Steps')
-        plt.ylabel('Count')
-        plt.legend()
-
-        plt.tight_layout(pad=1.0)
-        plt.pause(0.001)  # pause a bit so that plots are updated
-        if is_ipython:
-            if not show_result:
-                display.display(plt.gcf())
-                display.clear_output(wait=True)
-            else:
-                display.display(plt.gcf())
+        plot_durations(self.system_transport_data, self.system_stock_data, self.agvs_workload, self.machines_workload,
+                       show_result)
 
     def collect_train_data(self, reward):
         self.system_stock_data.append(len(self.factory.warehouses[0].end_product_store))
@@ -19,18 +19,33 @@ import pandas as pd
 import threading
 
 from FactoryObjects.Factory import Factory
-from FactoryObjects.Machine import Machine  # needed for reward function
+from FactoryObjects.EventSimulation import EventSimulation
 import MachineLearning.RainbowNetwork
+from MachineLearning.ActionTable import ActionTable
+from MachineLearning.ActorLearner import ActorLearner
+from MachineLearning.CouplingTaskTable import CouplingTaskTable
+from MachineLearning.EnvironmentPool import make_environment_pool
+from MachineLearning.ObservationBuilder import ObservationBuilder
+from MachineLearning.PhaseTimer import PhaseTimer
+from MachineLearning.RewardState import RewardState, get_indices
+from GUI.FactoryRenderer import FactoryRenderer
 from MachineLearning.RainbowNextVersion import RainbowLearning
 
 is_ipython = 'inline' in matplotlib.get_backend()
 if is_ipython:
     from IPython import display
 
+# bookkeeping of CustomEnvironment that is part of its snapshots (see CustomEnvironment.snapshot)
+ENVIRONMENT_STATE = ['step_counter', 'step_duration', 'last_end_product_count', 'last_critical_conditions',
+                     'coupling_command', 'coupling_master', 'agv_couple_count', 'agv_positioning', 'good_agvs',
+                     'last_machine_priority']
+
 
 class CustomEnvironment(gymnasium.Env):
     def __init__(self, render=False, variation_training=False, var_save_path=None, var_save_name=None, timestep=1.0,
-                 adjust_ep_len=False, reward_type=1, episode_length=2048, rainbow_algo=False, reward_fac=1):
+                 adjust_ep_len=False, reward_type=1, episode_length=2048, rainbow_algo=False, reward_fac=1,
+                 fleet_engine=False, event_driven=False, max_event_interval=10.0, navigation=False,
+                 reservations=False, phase_timing=False, phase_summary_interval=10):
         super(CustomEnvironment, self).__init__()
         self.agv_positioning = None
         self.coupling_command = None
@@ -42,30 +57,41 @@ class CustomEnvironment(gymnasium.Env):
         self.last_end_product_count = 0
         self.last_critical_conditions = 0
         self.factory.create_temp_factory_machines()
+        if fleet_engine:  # vectorized AGV kinematics (pays off for large fleets)
+            self.factory.enable_fleet_engine()
+        if navigation:  # AGVs drive around machines and warehouses instead of straight lines
+            self.factory.enable_navigation()
+        if reservations:    # AGVs reserve the cells of their path and wait instead of driving through each other
+            self.factory.enable_reservations()
         # self.time_step = 0.1
         self.time_step = timestep  # should be the same for AGV.move_state(self) "distance if" (AGV have a speed of 1)
-        # self.sleep_time = 0.0001
-        self.sleep_time = 0.00001
 
         self.end_product_count = []  # only used for plotting
         self.reward_history = []  # only used for plotting
-        plt.ion()
+        if render:  # keeps worker processes (see MachineLearning/EnvironmentPool.py) free of GUI state
+            plt.ion()
 
         self.n_agv = len(self.factory.agvs)
-        self.n_agv_commands = 5
+        # commands from the delivery relationships of the factory (command 0: unload stuck AGVs)
+        self.action_table = ActionTable(self.factory)
+        self.n_agv_commands = self.action_table.n_commands
 
-        self.action_space = gymnasium.spaces.Discrete(n=self.n_agv * self.n_agv_commands)
+        self.action_space = gymnasium.spaces.Discrete(n=self.action_table.n_actions)
         self.observation_space = gymnasium.spaces.Box(low=0.0, high=1.0,
                                                       shape=(self.n_agv * (2 + len(self.factory.warehouses) + len(
                                                           self.factory.machines) + 1) +
                                                              len(self.factory.warehouses) * 2 + len(
-                                                          self.factory.machines) * 3,), dtype=float)
+                                                          self.factory.machines) * 3,), dtype=np.float32)
+        self.observation_builder = ObservationBuilder([self.factory], self.n_agv_commands)
 
         self.pixel_size = 50
         self.height = self.factory.length
         self.width = self.factory.width
         self.reference_size = self.factory.cell_size * 1000
         self.screen = None
+        self.renderer = None
+        self.render_interval = 0.125    # minimum time between two rendered steps in seconds
+        self.last_render_time = 0.0
 
         self.render = render
         if render:
@@ -73,15 +99,11 @@ class CustomEnvironment(gymnasium.Env):
             self.screen = pygame.display.set_mode((self.width * self.pixel_size, self.height * self.pixel_size))
             pygame.display.set_caption('Color Data Display')
 
-        self.GoodAGVs = []  # AGVs that are in a "good" position will be in this list (for reward function)
+        self.good_agvs = 0  # bitmask of the AGVs that are in a "good" position (for reward function)
+        self.reward_state = RewardState(self.factory)
         self.step_start_time = time.time()
-        self.coupling_at = []
-        self.coupling_at.extend([False] * self.n_agv_commands)
-        self.agv_couple_count_at = []
-        self.agv_couple_count_at.extend([0] * self.n_agv_commands)
-        self.coupling_master_at = []
-        self.coupling_master_at.extend([None] * self.n_agv_commands)
-        self.agv_positioning_at = [[1 for _ in range(2)] for _ in range(self.n_agv_commands)]
+        # master, remaining slave count and formation per command (see MachineLearning/CouplingTaskTable.py)
+        self.coupling_tasks = CouplingTaskTable(self.factory, self.n_agv_commands)
 
         self.render_delay = 0
         self.render_window = 0
@@ -98,9 +120,9 @@ class CustomEnvironment(gymnasium.Env):
         self.variation_training = variation_training
         self.var_save_path = var_save_path
         self.var_save_name = var_save_name
-        self.machine_status_history = [[] for _ in range(3)]
-        self.agv_free_history = [[] for _ in range(6)]
-        self.last_machine_priority = [[4, 4] for _ in range(3)]
+        self.machine_status_history = [[] for _ in range(len(self.factory.machines))]
+        self.agv_free_history = [[] for _ in range(self.n_agv)]
+        self.last_machine_priority = [[4, 4] for _ in range(len(self.factory.machines))]
 
         self.adjust_ep_len = adjust_ep_len
         self.restart_logger = []
@@ -109,6 +131,17 @@ class CustomEnvironment(gymnasium.Env):
         self.running_rainbow = rainbow_algo
         self.reward_factor = reward_fac
 
+        # discrete-event mode: every step jumps to the next state change of the factory (at most max_event_interval
+        # seconds) instead of advancing by time_step
+        self.event_driven = event_driven
+        self.max_event_interval = max_event_interval
+        self.event_simulation = EventSimulation(self.factory, self._step_factory_objects) if event_driven else None
+        self.step_duration = self.time_step  # simulated time of the last step
+
+        # wall time of the step phases - per step in info['phase_times'], per episode in info['episode_phase_times']
+        # and printed every phase_summary_interval episodes
+        self.phase_timer = PhaseTimer(phase_timing, phase_summary_interval)
+
     def plot_threading(self):
         plt.ion()  # Turn on interactive mode
         plt.show()
@@ -138,28 +171,25 @@ class CustomEnvironment(gymnasium.Env):
                 self.plot_update = False
 
     def reset(self, seed=None, options=None):
+        super().reset(seed=seed)  # per-worker seeding
+        self.phase_timer.end_episode()
+        if seed is not None:
+            self.action_space.seed(seed)
         self.factory.reset()
         self.step_counter = 0
         self.last_end_product_count = 0
         self.last_critical_conditions = 0
+        if self.event_simulation is not None:
+            self.event_simulation.reset()
 
         self.coupling_command = None
-        self.GoodAGVs.clear()
+        self.good_agvs = 0
 
-        self.coupling_at.clear()
-        self.coupling_at.extend([False] * self.n_agv_commands)
-        self.agv_couple_count_at.clear()
-        self.agv_couple_count_at.extend([0] * self.n_agv_commands)
-        self.coupling_master_at.clear()
-        self.coupling_master_at.extend([None] * self.n_agv_commands)
-        self.agv_positioning_at = [[1 for _ in range(2)] for _ in range(self.n_agv_commands)]
+        self.coupling_tasks.reset()
 
-        index = 0
-        for machine in self.factory.machines:
-            input_priority, output_priority = machine.get_buffer_status()
-            self.last_machine_priority[index][0] = input_priority
-            self.last_machine_priority[index][1] = output_priority
-            index += 1
+        for index, priority in enumerate(self.reward_state.update_machines()):
+            self.last_machine_priority[index][0] = priority[0]
+            self.last_machine_priority[index][1] = priority[1]
 
         if len(self.restart_logger) > 0:
             self.restart_logger.pop()
@@ -167,20 +197,79 @@ class CustomEnvironment(gymnasium.Env):
 
         return self._create_observation(), {'info': "Nothing"}
 
+    def snapshot(self):
+        """
+        Copies the state of the factory and the environment bookkeeping, e.g. to reset to an arbitrary start state
+        or to run several rollouts from the same state.
+        :return: FactorySnapshot
+        """
+        extra = {name: getattr(self, name) for name in ENVIRONMENT_STATE}
+        extra['coupling_tasks'] = self.coupling_tasks.get_state()
+        if self.event_simulation is not None:
+            extra['event_simulation'] = self.event_simulation.get_state()
+        return self.factory.snapshot(extra)
+
+    def restore(self, snapshot):
+        """
+        :param snapshot: FactorySnapshot or bytes - created by snapshot() of an environment with the same factory
+        :return: observation of the restored state
+        """
+        extra = self.factory.restore(snapshot)
+        event_state = extra.pop('event_simulation', None)
+        self.coupling_tasks.set_state(extra.pop('coupling_tasks'))
+        if event_state is not None and self.event_simulation is not None:
+            self.event_simulation.set_state(event_state)
+        for name, value in extra.items():
+            setattr(self, name, value)
+        return self._create_observation()
+
     def step(self, action):
-        self.step_counter += 1
-        # self._block_until_synchronized()  # may be used when threading agvs
-        self._perform_action(action)
+        self._step_action(action)
+        self._step_simulation()
+        reward = self._step_evaluation()
+
         truncated = False
         # TODO: According to https://stable-baselines3.readthedocs.io/en/master/guide/rl_tips.html
         terminated = False
+        # used for SB-learning (e.g. PPO)
+        if not self.running_rainbow:
+            truncated = self.sb3_step_completion()
+        # "!truncated is used when "time limit" is hit AND time is not part of the observation space, else terminated!"
+
+        observation = self._create_observation()
+        info = {'info': "Nothing"}
+        if self.phase_timer.enabled:
+            self.phase_timer.add_info(info, truncated)
+        return observation, reward, terminated, truncated, info
+
+    # step() is split into three phases so VectorFactory can batch the work between them
+    def _step_action(self, action):
+        start = self.phase_timer.begin_step()
+        self.step_counter += 1
+        # self._block_until_synchronized()  # may be used when threading agvs
+        self._perform_action(action)
+        start = self.phase_timer.lap('perform_action', start)
+        self.eliminate_two_searching_masters()  # ALTERNATIVE A LIFO SYSTEM FOR EVERY AGV POSITION
+        self.phase_timer.lap('eliminate_masters', start)
+
+    def _step_simulation(self):
         # time.sleep(0.001)       # TODO TODO Action Update in AGV needs to be ensured before simulating factory
-        self._simulate_factory_objects()
-        # !!! Factory simulation has to be done before processing step information (especially reward and observation)
-        self._block_until_synchronized()
+        start = self.phase_timer.start()
+        if self.event_driven:
+            self.step_duration = self.event_simulation.advance_to_next_event(self.max_event_interval)
+            self._collect_history()
+        else:
+            self._simulate_factory_objects()
+            # !!! Factory simulation has to be done before processing step information (especially reward and observation)
+            self._block_until_synchronized()
+        self.phase_timer.lap('simulation', start)
 
+    def _step_evaluation(self):
+        start = self.phase_timer.start()
         reward = self._get_reward()
+        start = self.phase_timer.lap('reward', start)
         self._collect_train_data(reward)
+        start = self.phase_timer.lap('collect_train_data', start)
         # plot training within an episode
 
         if self.step_counter % math.inf == 0:  # math.inf => (almost) never triggered   #512 is reasonable for observation
@@ -191,24 +280,24 @@ class CustomEnvironment(gymnasium.Env):
                 time.sleep(0.025)
                 print(reward)
 
-
-
         # display env continuously
         if self.render:
             self.display_colors()
-            time.sleep(0.125)  # necessary  delay to regulate run speed
-
-        # used for SB-learning (e.g. PPO)
-        if not self.running_rainbow:
-            truncated = self.sb3_step_completion()
-        # "!truncated is used when "time limit" is hit AND time is not part of the observation space, else terminated!"
-
-        return self._create_observation(), reward, terminated, truncated, {'info': "Nothing"}
+            # necessary delay to regulate run speed - only the rest of the interval that drawing did not use
+            time.sleep(max(0.0, self.render_interval - (time.time() - self.last_render_time)))
+            self.last_render_time = time.time()
+        self.phase_timer.lap('plotting', start)
+        return reward
 
     def sb3_step_completion(self):
+        start = self.phase_timer.start()
         truncated = False
         divisor = self.time_step if self.adjust_ep_len else 1
-        if self.step_counter > ((self.episode_length/divisor)-1):  # for smaller time steps 10* to 20*
+        if self.event_driven:  # same simulated time as the corresponding fixed time step episode
+            episode_done = self.event_simulation.clock >= (self.episode_length / divisor) * self.time_step
+        else:
+            episode_done = self.step_counter > ((self.episode_length / divisor) - 1)
+        if episode_done:  # for smaller time steps 10* to 20*
             print("EPISODE DONE")
             # for special condition display options
             if self.last_end_product_count > math.inf:
@@ -231,6 +320,7 @@ class CustomEnvironment(gymnasium.Env):
             self.reset()  # referring to SB3 Website: Custom Environments
             self.step_counter = 0  # UNNECESSARY HERE (ALREADY IN RESET)
             # self.display_colors()         # visual to ensure factory reset properly
+        self.phase_timer.lap('completion', start)
         return truncated
 
     def conditional_display(self, episode):
@@ -279,61 +369,19 @@ class CustomEnvironment(gymnasium.Env):
         return self._create_observation()
 
     def _create_observation(self):
-        observation = []
-        for agv in self.factory.agvs:
-            if agv.is_free:  # free status
-                observation.append(1.0)
-            else:
-                observation.append(0.0)
-            if agv.loaded_product is None:  # load status
-                observation.append(1.0)
-            else:
-                observation.append(0.0)
-            observation += self._get_agv_distances_normal(agv)  # distances
-            observation.append(agv.task_number / (self.n_agv_commands - 1))  # AGVs' task
-        for warehouse in self.factory.warehouses:
-            if len(warehouse.buffer_output_load) > 0:
-                observation.append(1.0)
-            else:
-                observation.append(0.0)
-            observation.append(warehouse.get_production_rest_time_percent())
-        for machine in self.factory.machines:
-            input_priority, output_priority = machine.get_buffer_status()
-            observation.append(input_priority * 0.25)
-            observation.append(output_priority * 0.25)
-            observation.append(machine.get_production_rest_time_percent())
+        # copy of the builder's float32 buffer - callers (e.g. RainbowLearning) keep the observations
+        start = self.phase_timer.start()
+        observation = self.observation_builder.build()[0].copy()
+        self.phase_timer.lap('observation', start)
         return observation
 
-    def _get_agv_distances_normal(self, agv):
-        agv_machines_distances_normal = []
-        pos_agv = agv.get_middle_position()
-        for warehouse in self.factory.warehouses:
-            pos_warehouse = warehouse.get_middle_position()
-            agv_machines_distances_normal.append(self._calculate_agv_distances(pos_agv, pos_warehouse))
-
-        for machine in self.factory.machines:
-            pos_machine = machine.get_middle_position()
-            agv_machines_distances_normal.append(self._calculate_agv_distances(pos_agv, pos_machine))
-
-        max_distance = max(agv_machines_distances_normal)
-        for i in range(len(agv_machines_distances_normal)):
-            agv_machines_distances_normal[i] = agv_machines_distances_normal[i] / max_distance
-        return agv_machines_distances_normal
-
-    @staticmethod
-    def _calculate_agv_distances(pos_a, pos_b):
-        return math.sqrt(math.pow(pos_a[0] - pos_b[0], 2) + math.pow(pos_a[1] - pos_b[1], 2))
-
     def _perform_action(self, action_numpy):
         if isinstance(action_numpy, np.ndarray):
             action = action_numpy.item()
         else:
             action = action_numpy
-        # command_index = int(action % self.n_agv_commands)  # the 1d action array is now used as a pseudo 2d array
-        # agv_index = int(action / self.n_agv_commands)
         # flipped interpretation to make right decision easier - better transport with a not perfect agv than not at all
-        command_index = int(action / self.n_agv)  # the 1d action array is now used as a pseudo 2d array
-        agv_index = int(action % self.n_agv)
+        command_index, agv_index = self.action_table.decode(action)  # the 1d action array is a pseudo 2d array
 
         # temporary enablement to send all stuck agv to the temp storage (no longer a timer runs down)
         if command_index == 0:
@@ -343,20 +391,11 @@ class CustomEnvironment(gymnasium.Env):
             for agv in self.factory.agvs:
                 agv.unload_stucked_agvs = False
 
-        if command_index == 1:
-            self.environment_set_action(self.factory.agvs[agv_index], self.factory.warehouses[0],
-                                        self.factory.machines[0], command_index)
-        elif command_index == 2:
-            self.environment_set_action(self.factory.agvs[agv_index], self.factory.machines[0],
-                                        self.factory.machines[1], command_index)
-        elif command_index == 3:
-            self.environment_set_action(self.factory.agvs[agv_index], self.factory.machines[1],
-                                        self.factory.machines[2], command_index)
-        elif command_index == 4:
-            self.environment_set_action(self.factory.agvs[agv_index], self.factory.machines[2],
-                                        self.factory.warehouses[0], command_index)
+        if command_index > 0:
+            command = self.action_table.get_command(command_index)
+            self.environment_set_action(self.factory.agvs[agv_index], command.output_object, command.input_object,
+                                        command_index)
 
-        self.eliminate_two_searching_masters()  # ALTERNATIVE A LIFO SYSTEM FOR EVERY AGV POSITION
         # elif action == 5:
         #    self.unload_agv(self.factory.agvs[0], self.factory.warehouses[0])
 
@@ -376,253 +415,188 @@ class CustomEnvironment(gymnasium.Env):
         if agv.task_number == command_index:
             return
 
-        # print(self.agv_couple_count_at[1], self.agv_couple_count_at[2])
         # print(str(agv)+ " " + str(command_index)) # useful for debugging
         # process all actions that don't require coupling
-        if command_index == 3 or command_index == 4:
+        if not self.action_table.get_command(command_index).coupling:
+            self.deliver(agv, command_index, input_object, output_object)
+        # process actions that require coupling - the first AGV becomes master unless a master still needs slaves
+        elif not self.coupling_tasks.has_searching_master(command_index, agv):
             self.deliver(agv, command_index, input_object, output_object)
-        # process actions that require coupling
         else:
-            first = True
-            for AGV in self.factory.agvs:
-                if AGV.task_number == command_index and AGV != agv:  # check whether different agv/s is/are first (/already assigned)
-                    try:  # since AGVs are running in a thread an update might rarely cause an AttributeError
-                        # (coupling_master does not exist) TODO should no longer be an issue
-                        if AGV.coupling_master == AGV:  # safe some computing power
-                            if not AGV.coupling_master.will_coupling_be_complete():
-                                # condition triggered when a master agv still needs slaves
-                                first = False
-                    except:
-                        pass
-
-            if first:
-                self.deliver(agv, command_index, input_object, output_object)
+            if not self.coupling_tasks[command_index].count > 0:
+                print("WFF")
+            self._couple(agv, output_object, command_index)
+
+    def deliver(self, agv, command_index, input_object, output_object):
+        # product and AGV formation of the delivery relationship (see MachineLearning/ActionTable.py)
+        command = self.action_table.get_command(command_index)
+        product = command.product
+        if output_object is not None:
+            self._leave_coupling(agv)
+            # TODO it may happen that when several masters and their slaves leave a position the counts of the tasks
+            #  become unsensible high - however, this isn't a significant issue (as soon as an agv gets assigned to the
+            #  position as a master or several masters look for slaves the count will be reset to a sophisticated amount)
+            agv.task_number = command_index
+            if command.coupling:  # formation bigger than [1,1] (size of a solo transport)
+                self.coupling_tasks.start(command_index, agv, list(command.formation))
+                task = self.coupling_tasks[command_index]
+                agv.coupling(agv, [0, 0], task.count, output_object, input_object, product, task.formation)
             else:
-                if not self.agv_couple_count_at[command_index] > 0:
-                    print("WFF")
-                self._couple(agv, output_object, command_index)
-
-    def deliver(self, agv, command_index, input_object, output_object):  # added _at[command_index] to all self.(...)
-        # TO-DO: (eventually) unsophisticated implementation when there are more input products (with different origins)
-        for product in input_object.input_products:  # required to get product properties
-            if output_object is not None:
-                # implemented for masters that move away
-                if agv.coupling_master == agv:
-                    self.replace_master(agv)
-                    self.agv_couple_count_at[agv.task_number] += 1
-                    # CAUTION! Such operations have to be processed before agv.task_number = command_index
-                # implemented to hinder coupled master to deliver - the leaving agv will cause a reset of the coupling process
-                if agv.coupling_master and agv.coupling_master != agv:  # masters got handled with above
-                    if agv.coupling_master.is_coupling_complete():  # masters' coupling was completed (a slave will be removed now though)
-                        agv.coupling_master.command = 'coupling'  # resetting master to coupling (waiting for slaves)
-                        agv.coupling_master.status = 'wait_for_coupling'
-                    # implemented for agvs that are slaves of a waiting coupling master
-                    '''if agv.coupling_master == self.coupling_master_at[agv.coupling_master.task_number]:  # if not there will be two masters and count_at will be figured out later
-                                        self.agv_couple_count_at[agv.coupling_master.task_number] += 1'''
-                    self.coupling_master_at[agv.coupling_master.task_number] = agv.coupling_master
-                    self.agv_couple_count_at[
-                        agv.coupling_master.task_number] += 1  # inconveniences will be resolved later anyways
-                agv.free_from_coupling()  # TODO it may happen that when several masters and their slaves leave a position the agv_couple_count_at become unsensible high
-                #  however, this isn't a significant issue (as soon as an agv gets assigned to the position as a master or several masters look for slaves the count will be reset to a sophisticated ammount)
-                agv.task_number = command_index
-                self.agv_positioning_at[command_index] = self.factory.get_agv_needed_for_product(product, agv)
-                if self.agv_positioning_at[command_index][0] > 1 or self.agv_positioning_at[command_index][
-                    1] > 1:  # triggers if bigger than [1,1] (size of a solo transport)
-                    self.coupling_master_at[command_index] = agv
-                    self.agv_couple_count_at[command_index] = self.agv_positioning_at[command_index][0] * \
-                                                              self.agv_positioning_at[command_index][1] - 1
-                    self.coupling_at[command_index] = True
-                    agv.coupling(agv, [0, 0], self.agv_couple_count_at[command_index], output_object, input_object,
-                                 product, self.agv_positioning_at[command_index])
-                else:
-                    agv.deliver(output_object, input_object, product)
+                self.coupling_tasks[command_index].formation = list(command.formation)
+                agv.deliver(output_object, input_object, product)
+
+    def _leave_coupling(self, agv):
+        # frees the AGV from its coupling - the coupling task it leaves needs another AGV
+        # implemented for masters that move away (become no master)
+        if agv.coupling_master == agv:
+            self.replace_master(agv)
+            self.coupling_tasks[agv.task_number].count += 1
+            # CAUTION! Such operations have to be processed before agv.task_number = command_index
+        # implemented to hinder coupled master to deliver - the leaving agv will cause a reset of the coupling process
+        if agv.coupling_master and agv.coupling_master != agv:  # masters got handled with above
+            if agv.coupling_master.is_coupling_complete():  # masters' coupling was completed (a slave will be removed now though)
+                agv.coupling_master.command = 'coupling'  # resetting master to coupling (waiting for slaves)
+                agv.coupling_master.status = 'wait_for_coupling'
+            # implemented for agvs that are slaves of a waiting coupling master
+            self.coupling_tasks.reopen(agv.coupling_master)  # inconveniences will be resolved later anyways
+        agv.free_from_coupling()
 
     def _couple(self, agv, output_object, command_index):
-        if self.agv_couple_count_at[command_index] > 0:
-            # if self.master_prevention(agv):
-            #     return
-            # implemented for masters that move away (become no master)
-            if agv.coupling_master == agv:
-                self.replace_master(agv)
-                self.agv_couple_count_at[agv.task_number] += 1
-                # CAUTION! Such operations have to be processed before agv.task_number = command_index
-            # implemented to hinder coupled master to deliver - the leaving agv will cause a reset of the coupling process
-            if agv.coupling_master and agv.coupling_master != agv:  # masters got handled with above
-                if agv.coupling_master.is_coupling_complete():  # masters' coupling was completed (a slave will be removed now though)
-                    agv.coupling_master.command = 'coupling'  # resetting master to coupling (waiting for slaves)
-                    agv.coupling_master.status = 'wait_for_coupling'
-                # implemented for agvs that are slaves of a waiting coupling master
-                '''if agv.coupling_master == self.coupling_master_at[agv.coupling_master.task_number]:  # if not there will be two masters and count_at will be figured out later
-                                    self.agv_couple_count_at[agv.coupling_master.task_number] += 1'''
-                self.coupling_master_at[agv.coupling_master.task_number] = agv.coupling_master
-                self.agv_couple_count_at[
-                    agv.coupling_master.task_number] += 1  # inconveniences will be resolved later anyways
-            agv.free_from_coupling()
+        task = self.coupling_tasks[command_index]
+        if task.count > 0:
+            self._leave_coupling(agv)
             agv.task_number = command_index
-            count = 0
-            pos = [0, 0]
-            for length in range(self.agv_positioning_at[command_index][1]):
-                for width in range(self.agv_positioning_at[command_index][0]):
-                    '''
-                    if count == self.agv_positioning_at[command_index][0] * self.agv_positioning_at[command_index][
-                        1] - self.agv_couple_count_at[command_index]:
-                        pos = [width, length]
-                    count += 1
-                    '''
-                    # check whether spot is occupied
-                    occ = False
-                    for AGV in self.factory.agvs:
-                        if AGV.coupling_master == self.coupling_master_at[command_index]:
-                            if AGV.coupling_formation_position == [width, length]:
-                                occ = True
-                                break
-                    if not occ:
-                        pos = [width, length]
-                        break
-                if pos != [0, 0]:
-                    break
-            agv.coupling(self.coupling_master_at[command_index], pos, output_object=output_object)
-            self.agv_couple_count_at[command_index] -= 1
+            agv.coupling(task.master, self.coupling_tasks.get_free_slot(command_index), output_object=output_object)
+            task.count -= 1
             return
         else:  # safeguard - todelete
             print("MISTAKE")
-            self.coupling_at[command_index] = False
+            task.active = False
 
     def master_prevention(self, agv):  # artefact function - todelete
         if agv.coupling_master == agv:
             # return True
             # reduce the incapability by those that have no slaves
-            for AGV in self.factory.agvs:  # check for alternative agv to be first
-                if AGV.coupling_master == agv and AGV != agv:
-                    return True
+            if self.factory.coupling_registry.get_slave_count(agv) > 0:  # check for alternative agv to be first
+                return True
         return False
 
     def replace_master(self, old_master):
         # rather slaves that are already at the output should become master
-        for AGV in self.factory.agvs:
-            if AGV.coupling_master == old_master and AGV != old_master:
-                if AGV.command == 'follow_master':
-                    self.assign_new_master(old_master, AGV)
-                    return
-        for AGV in self.factory.agvs:
-            if AGV.coupling_master == old_master and AGV != old_master:
-                if AGV.status == 'master_slave_decision':
-                    self.assign_new_master(old_master, AGV)
-                    return
-        for AGV in self.factory.agvs:
-            if AGV.coupling_master == old_master and AGV != old_master:
-                if AGV.status == 'move_to_coupling_position':  # (most likely) technically this condition is not needed
-                    self.assign_new_master(old_master, AGV)
-                    return
-        self.coupling_master_at[old_master.task_number] = None  # if no slaves are found
-        self.coupling_at[old_master.task_number] = False
+        slaves = self.factory.coupling_registry.get_slaves(old_master)
+        for AGV in slaves:
+            if AGV.command == 'follow_master':
+                self.assign_new_master(old_master, AGV)
+                return
+        for AGV in slaves:
+            if AGV.status == 'master_slave_decision':
+                self.assign_new_master(old_master, AGV)
+                return
+        for AGV in slaves:
+            if AGV.status == 'move_to_coupling_position':  # (most likely) technically this condition is not needed
+                self.assign_new_master(old_master, AGV)
+                return
+        self.coupling_tasks.close(old_master.task_number)  # if no slaves are found
         return
 
     def assign_new_master(self, old_master, new_master):
-        slave_list = [agv for agv in self.factory.agvs if agv.coupling_master == old_master and agv != old_master]
+        slave_list = self.factory.coupling_registry.get_slaves(old_master)
         for slave in slave_list:
             slave.coupling_master = new_master  # assign AGV as new master
         new_master.coupling(new_master, [0, 0], old_master.agv_couple_count, old_master.output_object,
                             old_master.input_object, old_master.target_product,
-                            self.agv_positioning_at[old_master.task_number])
+                            self.coupling_tasks[old_master.task_number].formation)
         new_master.status = 'move_to_coupling_position'
         new_master.move_target = old_master.move_target
-        self.coupling_master_at[old_master.task_number] = new_master
+        self.coupling_tasks[old_master.task_number].master = new_master
         # old_master.coupling_master = new_master     # necessary for some operation - will be shortly anyways
 
     def eliminate_two_searching_masters(self):
-        masters = []
-        master_tasks = []
-        # catch all masters
-        for agv in self.factory.agvs:
-            if agv.coupling_master == agv:
-                masters.append(agv)
-                master_tasks.append(agv.task_number)
-        for i in range(1, self.n_agv_commands):
-            if master_tasks.count(i) > 1:  # true if there are several masters with the same task
-                masters_need_slaves = []
-                for task, master_agv in zip(master_tasks, masters):
-                    if task == i:
-                        if not master_agv.will_coupling_be_complete():
-                            masters_need_slaves.append(master_agv)
-                            if len(masters_need_slaves) > 1:
-                                if len(masters_need_slaves) > 2:
-                                    print("MISTAKE: CHECK OUT eliminate_tow_searching_masters FUNCTION")
-                                # find master with more slaves
-                                m1_slaves = []
-                                m2_slaves = []
-                                for agv in self.factory.agvs:
-                                    if agv.coupling_master == masters_need_slaves[0]:
-                                        if agv != agv.coupling_master:
-                                            m1_slaves.append(agv)
-                                    elif agv.coupling_master == masters_need_slaves[1]:
-                                        if agv != agv.coupling_master:
-                                            m2_slaves.append(agv)
-                                if len(m2_slaves) > 0 or len(m1_slaves) > 0:  # when at least one master has a slave
-                                    if len(m2_slaves) > len(m1_slaves):
-                                        # assign a slave of m1 to m2
-                                        if len(m1_slaves) > 0:
-                                            m1_slaves[-1].free_from_coupling()
-                                            m1_slaves[-1].task_number = masters_need_slaves[1].task_number
-                                            self._couple(m1_slaves[-1], masters_need_slaves[1].output_object,
-                                                         masters_need_slaves[1].task_number)
-                                            if masters_need_slaves[
-                                                1].will_coupling_be_complete():  # ensure everything worked and sort out env-variables
-                                                self.agv_couple_count_at[i] = masters_need_slaves[
-                                                                                  0].agv_couple_count - len(
-                                                    m1_slaves) + 1  # +1 for the removed slave
-                                                self.coupling_master_at[i] = masters_need_slaves[0]
-                                            else:
-                                                print(
-                                                    "MISTAKE: THERE WAS A MASTER ALTHOUGH A DIFFERENT MASTER WITH SAME TASK WAITED FOR MORE THAN ONE SLAVE TO BE ASSIGNED @1")
-                                        else:
-                                            self.master_becomes_slave(masters_need_slaves[0], masters_need_slaves[1], i,
-                                                                      len(m2_slaves))
+        # two masters with the same task can only appear when the coupling assignments changed
+        if not self.coupling_tasks.has_assignments_changed():
+            return
+        # catch all masters grouped by task
+        masters_by_task = {}
+        for agv in self.factory.coupling_registry.get_masters():
+            masters_by_task.setdefault(agv.task_number, []).append(agv)
+        for i in sorted(masters_by_task):
+            if i == 0 or len(masters_by_task[i]) < 2:  # true if there are several masters with the same task
+                continue
+            masters_need_slaves = []
+            for master_agv in masters_by_task[i]:
+                if not master_agv.will_coupling_be_complete():
+                    masters_need_slaves.append(master_agv)
+                    if len(masters_need_slaves) > 1:
+                        if len(masters_need_slaves) > 2:
+                            print("MISTAKE: CHECK OUT eliminate_tow_searching_masters FUNCTION")
+                        # find master with more slaves
+                        m1_slaves = self.factory.coupling_registry.get_slaves(masters_need_slaves[0])
+                        m2_slaves = self.factory.coupling_registry.get_slaves(masters_need_slaves[1])
+                        if len(m2_slaves) > 0 or len(m1_slaves) > 0:  # when at least one master has a slave
+                            if len(m2_slaves) > len(m1_slaves):
+                                # assign a slave of m1 to m2
+                                if len(m1_slaves) > 0:
+                                    m1_slaves[-1].free_from_coupling()
+                                    m1_slaves[-1].task_number = masters_need_slaves[1].task_number
+                                    self._couple(m1_slaves[-1], masters_need_slaves[1].output_object,
+                                                 masters_need_slaves[1].task_number)
+                                    # ensure everything worked and sort out env-variables
+                                    if masters_need_slaves[1].will_coupling_be_complete():
+                                        # +1 for the removed slave
+                                        self.coupling_tasks[i].count = \
+                                            masters_need_slaves[0].agv_couple_count - len(m1_slaves) + 1
+                                        self.coupling_tasks[i].master = masters_need_slaves[0]
                                     else:
-                                        # assign a slave of m2 to m1
-                                        if len(m2_slaves) > 0:
-                                            m2_slaves[-1].free_from_coupling()
-                                            m2_slaves[-1].task_number = masters_need_slaves[0].task_number
-                                            self._couple(m2_slaves[-1], masters_need_slaves[0].output_object,
-                                                         masters_need_slaves[0].task_number)
-                                            if masters_need_slaves[
-                                                0].will_coupling_be_complete():  # ensure everything worked and sort out env-variables
-                                                self.agv_couple_count_at[i] = masters_need_slaves[
-                                                                                  1].agv_couple_count - len(
-                                                    m2_slaves) + 1  # +1 for the removed slave
-                                                self.coupling_master_at[i] = masters_need_slaves[1]
-                                            else:
-                                                print(
-                                                    "MISTAKE: THERE WAS A MASTER ALTHOUGH A DIFFERENT MASTER WITH SAME TASK WAITED FOR MORE THAN ONE SLAVE TO BE ASSIGNED @2")
-                                        else:
-                                            self.master_becomes_slave(masters_need_slaves[1], masters_need_slaves[0], i,
-                                                                      len(m1_slaves))
-                                else:  # both masters have no slaves (=> make second master slave of first)
-                                    # self.master_becomes_slave(masters_need_slaves[1], masters_need_slaves[0], i, 0) # TODO when ensured @3 is not needed this instead of following code:
-                                    masters_need_slaves[1].free_from_coupling()
-                                    masters_need_slaves[1].task_number = masters_need_slaves[0].task_number
-                                    self.coupling_master_at[i] = masters_need_slaves[0]  # necessary before _couple()
-                                    self._couple(masters_need_slaves[1], masters_need_slaves[0].output_object,
+                                        print(
+                                            "MISTAKE: THERE WAS A MASTER ALTHOUGH A DIFFERENT MASTER WITH SAME TASK WAITED FOR MORE THAN ONE SLAVE TO BE ASSIGNED @1")
+                                else:
+                                    self.master_becomes_slave(masters_need_slaves[0], masters_need_slaves[1], i,
+                                                              len(m2_slaves))
+                            else:
+                                # assign a slave of m2 to m1
+                                if len(m2_slaves) > 0:
+                                    m2_slaves[-1].free_from_coupling()
+                                    m2_slaves[-1].task_number = masters_need_slaves[0].task_number
+                                    self._couple(m2_slaves[-1], masters_need_slaves[0].output_object,
                                                  masters_need_slaves[0].task_number)
-                                    self.agv_couple_count_at[i] = masters_need_slaves[
-                                                                      0].agv_couple_count - 1  # one slave got assigned (possibly not needed)
-                                    if masters_need_slaves[0].will_coupling_be_complete():  # should m1 in any case
-                                        self.agv_couple_count_at[i] = 0
-                                        self.coupling_master_at[
-                                            i] = None  # since one master is filled and other master became slave
+                                    # ensure everything worked and sort out env-variables
+                                    if masters_need_slaves[0].will_coupling_be_complete():
+                                        # +1 for the removed slave
+                                        self.coupling_tasks[i].count = \
+                                            masters_need_slaves[1].agv_couple_count - len(m2_slaves) + 1
+                                        self.coupling_tasks[i].master = masters_need_slaves[1]
                                     else:
                                         print(
-                                            "MISTAKE: THERE WAS A MASTER ALTHOUGH A DIFFERENT MASTER WITH SAME TASK WAITED FOR MORE THAN ONE SLAVE TO BE ASSIGNED @3")
+                                            "MISTAKE: THERE WAS A MASTER ALTHOUGH A DIFFERENT MASTER WITH SAME TASK WAITED FOR MORE THAN ONE SLAVE TO BE ASSIGNED @2")
+                                else:
+                                    self.master_becomes_slave(masters_need_slaves[1], masters_need_slaves[0], i,
+                                                              len(m1_slaves))
+                        else:  # both masters have no slaves (=> make second master slave of first)
+                            # self.master_becomes_slave(masters_need_slaves[1], masters_need_slaves[0], i, 0) # TODO when ensured @3 is not needed this instead of following code:
+                            masters_need_slaves[1].free_from_coupling()
+                            masters_need_slaves[1].task_number = masters_need_slaves[0].task_number
+                            self.coupling_tasks[i].master = masters_need_slaves[0]  # necessary before _couple()
+                            self._couple(masters_need_slaves[1], masters_need_slaves[0].output_object,
+                                         masters_need_slaves[0].task_number)
+                            # one slave got assigned (possibly not needed)
+                            self.coupling_tasks[i].count = masters_need_slaves[0].agv_couple_count - 1
+                            if masters_need_slaves[0].will_coupling_be_complete():  # should m1 in any case
+                                self.coupling_tasks[i].count = 0
+                                # since one master is filled and other master became slave
+                                self.coupling_tasks[i].master = None
+                            else:
+                                print(
+                                    "MISTAKE: THERE WAS A MASTER ALTHOUGH A DIFFERENT MASTER WITH SAME TASK WAITED FOR MORE THAN ONE SLAVE TO BE ASSIGNED @3")
 
     def master_becomes_slave(self, new_slave, new_master, i, masters_slave_count):
         new_slave.free_from_coupling()
         new_slave.task_number = new_master.task_number
-        self.coupling_master_at[i] = new_master  # necessary before _couple()
+        self.coupling_tasks[i].master = new_master  # necessary before _couple()
         self._couple(new_slave, new_master.output_object, new_master.task_number)
-        self.agv_couple_count_at[i] = new_master.agv_couple_count - masters_slave_count - 1  # one slave is old_master
+        self.coupling_tasks[i].count = new_master.agv_couple_count - masters_slave_count - 1  # one slave is old_master
         if new_master.will_coupling_be_complete():  # should m1 in any case
-            self.agv_couple_count_at[i] = 0
-            self.coupling_master_at[i] = None
+            self.coupling_tasks[i].count = 0
+            self.coupling_tasks[i].master = None
 
     @staticmethod
     def agv_is_master(self, agv):  # unused ? - todelete
@@ -654,9 +628,7 @@ class CustomEnvironment(gymnasium.Env):
             divOut *= 4
 
         # Reward for lowering priority
-        index = 0
-        for machine in self.factory.machines:
-            input_priority, output_priority = machine.get_buffer_status()
+        for index, (input_priority, output_priority) in enumerate(self.reward_state.update_machines()):
             if input_priority < self.last_machine_priority[index][0]:
                 reward += self.last_machine_priority[index][0] * 1/divIn * self.reward_factor
             if self.reward_type != 7:
@@ -664,53 +636,32 @@ class CustomEnvironment(gymnasium.Env):
                     reward += self.last_machine_priority[index][1] * 1/divOut * self.reward_factor
             self.last_machine_priority[index][0] = input_priority
             self.last_machine_priority[index][1] = output_priority
-            index += 1
 
         # Reward for when an AGV is at an output that holds at least one product ("good position")
         if self.reward_type != 6:
-            for AGV in self.factory.agvs:
-                #try:  # TODO: (occasionally values that should be "defined" were "undefined" due to threading)
-                arrived = False
-                prod_needed = False
-                prod_available = False
-                if AGV.coupling_master:     # coupling_master only exists if task requires coupling
-                    arrived = (AGV.status == 'waiting_with_master' or AGV.status == 'wait_for_coupling' or AGV.status == 'master_slave_decision')
-                    prod_available = AGV.coupling_master.output_object.has_product(AGV.coupling_master.target_product)
-
-                    if isinstance(AGV.coupling_master.input_object, Machine):
-                        input_priority, output_priority = AGV.coupling_master.input_object.get_buffer_status()
-                        prod_needed = False if input_priority <= 0 else True
-                    if AGV.coupling_master.target_product in self.factory.warehouses[0].input_products:
-                        prod_needed = True
-                if prod_available and arrived and prod_needed:
-                    if AGV not in self.GoodAGVs:
-                        reward += 0.1
-                        self.GoodAGVs.append(AGV)
+            state = self.reward_state
+            state.update_agvs()
+            good_position = state.arrived & state.available & state.needed
+            staying = good_position & self.good_agvs
+            # remove if position is no longer good (for example other agvs realized the transport)
+            good_agvs = (self.good_agvs & ~state.arrived) | good_position
+            leaving = state.moving & good_agvs
+            self.good_agvs = good_agvs & ~leaving
+            # rewards are added in the order of the AGVs (same float results as one loop over the AGVs)
+            for index in get_indices(good_position | leaving):
+                bit = 1 << index
+                if bit & staying:
                     # Reward for being in a good position (to reinforce staying)
-                    else:
-                        if AGV.waiting_in_good_position_timer < 20:
-                            reward += 0.005 * self.time_step  # time payments should be scaled accordingly
-                            if self.reward_type != 5:
-                                AGV.waiting_in_good_position_timer += self.time_step
-                # remove from list if position is no longer good (for example other agvs realized the transport)
-                elif arrived:
-                    if not prod_available or not prod_needed:
-                        if AGV in self.GoodAGVs:
-                            self.GoodAGVs.remove(AGV)
-                #except:
-                 #   pass
-
+                    agv = self.factory.agvs[index]
+                    if agv.waiting_in_good_position_timer < 20:
+                        reward += 0.005 * self.step_duration  # time payments should be scaled accordingly
+                        if self.reward_type != 5:
+                            agv.waiting_in_good_position_timer += self.step_duration
+                elif bit & good_position:
+                    reward += 0.1
                 # Negative Reward for leaving a good positions (punishment)
-                if AGV.is_moving and AGV in self.GoodAGVs:
-                    if AGV.coupling_master:
-                        is_agv_delivering = (AGV.coupling_master.status == 'move_to_input')
-                    else:
-                        is_agv_delivering = (AGV.status == 'move_to_input')
-                    if is_agv_delivering:
-                        self.GoodAGVs.remove(AGV)
-                    else:
-                        reward -= 0.1
-                        self.GoodAGVs.remove(AGV)
+                if bit & leaving and not state.is_delivering(index):
+                    reward -= 0.1
 
         return reward
 
@@ -732,19 +683,9 @@ class CustomEnvironment(gymnasium.Env):
         agv.unload(unloading)
 
     def _block_until_synchronized(self):
-        all_synchronized = True
-        for i in range(10000):
-            all_synchronized = True
-            for agv in self.factory.agvs:
-                if agv.step_counter_last != self.step_counter:  # -1 when threading (WHY?)
-                    all_synchronized = False
-                    # print("\n bla")
-                    break
-            if all_synchronized:
-                break
-            time.sleep(self.sleep_time)
-        if not all_synchronized:
-            print("SYNCHRONIZATION TIMEOUT")
+        # the LockstepScheduler returns after all AGVs are stepped - nothing to wait for
+        if not self.factory.scheduler.is_synchronized(self.step_counter):
+            print("SYNCHRONIZATION ERROR")
             print(self.step_counter, self.factory.agvs[0].step_counter_next,
                   self.factory.agvs[0].step_counter_last, self.factory.agvs[1].step_counter_last,
                   self.factory.agvs[2].step_counter_last, self.factory.agvs[3].step_counter_last,
@@ -768,16 +709,24 @@ class CustomEnvironment(gymnasium.Env):
             self.machine_status_history[index].append(machine.status)
             index += 1
 
-    def _simulate_agvs_without_threading(self):
-        # simulate masters first
-        slaves = []
+    def _step_factory_objects(self, time_step):  # used by the EventSimulation (variable time steps)
         for agv in self.factory.agvs:
-            if agv.coupling_master == agv:  # TODO check whether this is working
-                agv.run_without_threads()
-            else:
-                slaves.append(agv)
-        for agv in slaves:
-            agv.run_without_threads()
+            agv.step(time_step, self.step_counter)
+        self._simulate_agvs_without_threading(time_step)
+        for warehouse in self.factory.warehouses:
+            warehouse.step(time_step)
+        for machine in self.factory.machines:
+            machine.step(time_step)
+
+    def _collect_history(self):
+        for index, agv in enumerate(self.factory.agvs):
+            self.agv_free_history[index].append(agv.is_free)
+        for index, machine in enumerate(self.factory.machines):
+            self.machine_status_history[index].append(machine.status)
+
+    def _simulate_agvs_without_threading(self, time_step=None):
+        # simulates masters first (see LockstepScheduler)
+        self.factory.step_agvs(self.time_step if time_step is None else time_step)
 
     def _collect_train_data(self, reward):
         self.end_product_count.append(len(self.factory.warehouses[0].end_product_store))
@@ -809,59 +758,19 @@ class CustomEnvironment(gymnasium.Env):
         """
         Display a 2D list of color data using pygame.
         """
-        color_data = self.factory.get_color_grid()
-
         # Main loop to draw the colors and handle events
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 pygame.quit()
                 sys.exit()
 
-        # Draw the color data
-        for y in range(self.height):
-            for x in range(self.width):
-                pygame.draw.rect(self.screen, color_data[x][y],
-                                 (x * self.pixel_size, y * self.pixel_size, self.pixel_size, self.pixel_size))
-
-        # Draw the AGVs
-        for agv in self.factory.agvs:
-            agv_pos = [agv.pos_x, agv.pos_y]
-            pygame.draw.rect(self.screen, [0, 0, 0],
-                             (agv_pos[0] * self.pixel_size, agv_pos[1] * self.pixel_size,
-                              agv.width / self.reference_size * self.pixel_size,
-                              agv.length / self.reference_size * self.pixel_size),
-                             border_radius=3)
-
-        for agv in self.factory.agvs:
-            if agv.loaded_product is not None:
-                agv_pos = [agv.pos_x, agv.pos_y]
-                pygame.draw.rect(self.screen, [180, 180, 0],
-                                 (agv_pos[0] * self.pixel_size + 2,
-                                  agv_pos[1] * self.pixel_size + 2,
-                                  agv.loaded_product.width / self.reference_size * self.pixel_size,
-                                  agv.loaded_product.length / self.reference_size * self.pixel_size))
-
-        # Draw machines data
-        for machine in self.factory.machines:
-            font = pygame.font.SysFont('arial', 20)
-            text = font.render(machine.get_status() +
-                               " I:" + str(len(machine.buffer_input_load)) +
-                               " O:" + str(len(machine.buffer_output_load)), True, (0, 0, 0))
-            self.screen.blit(text, [self.pixel_size * machine.pos_x, self.pixel_size * machine.pos_y])
+        # only the regions that changed since the last frame are redrawn
+        if self.renderer is None or self.renderer.factory is not self.factory or self.renderer.screen is not self.screen:
+            self.renderer = FactoryRenderer(self.factory, self.screen, self.pixel_size, self.reference_size)
+        self.renderer.draw()
 
-            font = pygame.font.SysFont('arial', 20)
-            text = font.render(str(int(machine.rest_process_time)), True, (0, 0, 0))
-            self.screen.blit(text, [self.pixel_size * machine.pos_x, self.pixel_size * (machine.pos_y + 1)])
 
-        for warehouse in self.factory.warehouses:
-            font = pygame.font.SysFont('arial', 20)
-            text = font.render(str(int(warehouse.rest_process_time)), True, (0, 0, 0))
-            self.screen.blit(text, [self.pixel_size * warehouse.pos_x, self.pixel_size * (warehouse.pos_y + 1)])
-
-        pygame.display.flip()
-
-
-def sb_train_variation():
+def sb_train_variation(n_envs=1):
     # flipped_actions means that action 1 = agent 1 drive to 1, action 2 = agent 2 drive to 1...
     episodes = 512
     episode_length = 2048
@@ -880,8 +789,9 @@ def sb_train_variation():
     id_name = "FINAL_no_output_rewards"
     save_path = save_folder + folder_spes
     save_name = save_name_start + id_name + trial + save_name_end
-    env = CustomEnvironment(render=False, variation_training=True, var_save_path=save_path, var_save_name=save_name, reward_type=7
-                            )
+    # n_envs > 1 runs one environment per process (histories of the workers are merged in env.close())
+    env = make_environment_pool(CustomEnvironment, n_envs, render=False, variation_training=True,
+                                var_save_path=save_path, var_save_name=save_name, reward_type=7)
     env.reset()
     save_nameApath = save_path + save_name
     model = sb.PPO('MlpPolicy', env=env, verbose=1, gamma=gamma, device="cpu", seed=777)
@@ -1249,10 +1159,13 @@ def create_folder(save_folder):#
     if not os.path.exists(save_folder):
         os.makedirs(save_folder)
 
-def sb_train():
-    env = CustomEnvironment(render=True)  # True for display (creates the factory display window)
-    env.display_colors()
-    time.sleep(2)
+def sb_train(n_envs=1):
+    if n_envs > 1:  # no display for worker processes
+        env = make_environment_pool(CustomEnvironment, n_envs)
+    else:
+        env = CustomEnvironment(render=True)  # True for display (creates the factory display window)
+        env.display_colors()
+        time.sleep(2)
     env.reset()
     model = sb.A2C('MlpPolicy', env=env, verbose=1, gamma=0.99, device="cpu")
     model = sb.A2C.load(
@@ -1308,8 +1221,11 @@ def sb_run_model():
 
 
 
-def custom_sb_train():
-    env = CustomEnvironment(render=True)  # True for display (creates the factory display window)
+def custom_sb_train(n_envs=1):
+    if n_envs > 1:  # no display for worker processes
+        env = make_environment_pool(CustomEnvironment, n_envs)
+    else:
+        env = CustomEnvironment(render=True)  # True for display (creates the factory display window)
     env.reset()
     policy_kwargs = dict(activation_fn=th.nn.ReLU,
                          net_arch=dict(pi=[32, 32, 32, 32, 32], vf=[32, 32, 32, 32, 32]))
@@ -1400,6 +1316,65 @@ def custom_train():
     env.close()
 
 
+def custom_train_pool(n_envs=4):
+    # Rainbow training with n_envs environment processes stepped together - one forward pass for all environments
+    n_steps = 200 * 2048  # defines number of steps of every environment (one update per step)
+    save_interval = 50 * 2048  # defines the saving interval in steps
+    max_steps = 2048  # defines length of an episode - the environments end and reset their episodes themselves
+
+    save_folder = "SAVE_FOLDER"
+    create_folder(save_folder)
+    save_name_start = "RainbowNetwork_SPECIFIC_NAME"
+    save_name_end = "SPECIFIC_DETAILS_IN_NAME"
+
+    env = make_environment_pool(CustomEnvironment, n_envs, render=False, episode_length=max_steps)
+    net = MachineLearning.RainbowNetwork.RainbowNetwork
+    ml_agent = RainbowLearning(state_d=env.observation_space.shape[0], action_d=env.action_space.n, net=net)
+    states = env.reset()
+    accu_rewards = np.zeros(n_envs)
+    for step in range(n_steps):
+        actions = ml_agent.get_actions(states)
+        states, rewards, dones, infos = env.step(actions)
+        ml_agent.add_batch(states, rewards, dones, infos)
+        ml_agent.train()
+
+        accu_rewards += rewards
+        for k in np.flatnonzero(dones):
+            print("Environment: " + str(k) + " Score: " + str(accu_rewards[k]))
+            accu_rewards[k] = 0
+        if step % save_interval == save_interval - 1:
+            ml_agent.save(save_folder + save_name_start + str(step + 1) + "steps" + save_name_end)
+            print("Model saved")
+    env.close()
+
+
+def custom_train_actor_learner(n_actors=4):
+    # Rainbow training with n_actors environment processes and a learner in this process
+    n_updates = 200 * 2048  # defines number of learner updates
+    save_interval = 50 * 2048  # defines the saving interval in updates
+    max_steps = 2048  # defines length of an episode of the actors
+
+    save_folder = "SAVE_FOLDER"
+    create_folder(save_folder)
+    save_name_start = "RainbowNetwork_SPECIFIC_NAME"
+    save_name_end = "SPECIFIC_DETAILS_IN_NAME"
+
+    env = CustomEnvironment(render=False, rainbow_algo=True)    # only for the sizes of the spaces
+    agent_kwargs = dict(state_d=env.observation_space.shape[0], action_d=env.action_space.n,
+                        net=MachineLearning.RainbowNetwork.RainbowNetwork)
+    env.close()
+    actor_learner = ActorLearner(CustomEnvironment, n_actors, agent_kwargs, dict(render=False, rainbow_algo=True),
+                                 max_steps=max_steps)
+    actor_learner.start()   # the actors keep running while the agent is saved
+    try:
+        for i in range(n_updates // save_interval):
+            ml_agent = actor_learner.run(save_interval)
+            ml_agent.save(save_folder + save_name_start + str((i + 1) * save_interval) + "updates" + save_name_end)
+            print("Model saved")
+    finally:
+        actor_learner.stop()
+
+
 def custom_run_model():  # TODO
     env = CustomEnvironment(episode_length=6000, render=False, variation_training=True,
                             var_save_path="models/flipped_actions/Rainbow_DQN/RainbowNetworkMedium/FINAL_Training_1/100minRun/",
@@ -4,6 +4,7 @@ from math import sqrt, ceil
 import os
 
 from FactoryObjects.Factory import Factory
+from FactoryObjects.FactoryGenerator import FactoryGenerator
 from FactoryObjects.Warehouse import Warehouse
 from FactoryObjects.Machine import Machine
 from FactoryObjects.LoadingStation import LoadingStation
@@ -17,7 +18,6 @@ class VRP_cellAGV():
     def __init__(self, factory: Factory):
         self.factory: Factory = factory
         self.agv = AGV()
-        self.agv.thread_running = False
         self.agv.length = 500  # length of agv in mm
         self.agv.width = 500  # width of agv in mm
         self.amounts_of_objects = self.factory.get_amount_of_factory_objects()
@@ -744,7 +744,6 @@ def create_default_factory_3(self):
     n = 6  # Anzahl der AGVs
     for i in range(n):
         self.agvs.append(AGV([0, 7]))
-        self.agvs[i].thread_running = False
         self.agvs[i].factory = self
 
 
@@ -836,7 +835,6 @@ def create_default_factory_4(self):
     n = 1  # Anzahl der AGVs
     for i in range(n):
         self.agvs.append(AGV([0, 3]))
-        self.agvs[i].thread_running = False
         self.agvs[i].factory = self
 
 
@@ -865,9 +863,10 @@ def create_random_factory(self):
     self.amount_of_machines = 10
     self.amount_of_loading_stations = 10  # entspricht hier der Anzahl an AGVs
 
-    self.no_columns = int(self.length // self.cell_size)
-    self.no_rows = int(self.width // self.cell_size)
-    self.factory_grid_layout = np.zeros(shape=(self.no_columns, self.no_rows)).tolist()
+    generator = FactoryGenerator(seed=None, length=int(self.length // self.cell_size),
+                                 width=int(self.width // self.cell_size), n_warehouses=self.amount_of_warehouses,
+                                 n_machines=self.amount_of_machines, n_agvs=self.amount_of_loading_stations)
+    generator.generate(self)
 
 def main():
     factory = Factory()
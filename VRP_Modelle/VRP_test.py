@@ -20,7 +20,6 @@ class VRP_cellAGV():
     def __init__(self, factory: Factory):
         self.factory: Factory = factory
         self.agv = AGV()
-        self.agv.thread_running = False
         self.agv.length = 500  # length of agv in mm
         self.agv.width = 500  # width of agv in mm
         self.amounts_of_objects = self.factory.get_amount_of_factory_objects()
@@ -678,7 +677,6 @@ def create_default_factory_2(self):
     n = 10  # Anzahl der AGVs
     for i in range(n):
         self.agvs.append(AGV([0, 20]))
-        self.agvs[i].thread_running = False
         self.agvs[i].factory = self
 
     return self
@@ -762,7 +760,6 @@ def create_default_factory_3(self):
     n = 6  # Anzahl der AGVs
     for i in range(n):
         self.agvs.append(AGV([0, 7]))
-        self.agvs[i].thread_running = False
         self.agvs[i].factory = self
 
     return self
@@ -866,7 +863,6 @@ def create_default_factory_4(self):
 
     for i in range(n):
         self.agvs.append(AGV([0, 30 + i]))
-        self.agvs[i].thread_running = False
         self.agvs[i].factory = self
 
     return self
@@ -0,0 +1,5 @@
+# makes the packages of the repository root (FactoryObjects, MachineLearning, ...) importable for the tests
+
+# scripts named like tests - they run their examples on import (some need optional solvers like pulp)
+collect_ignore = ['test_file.py', 'VRP_Modelle/VRP_test.py', 'VRP_Modelle/ZellFTF_VRP_test.py',
+                  'VRP_Modelle/or_test.py']
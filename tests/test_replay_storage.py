@@ -0,0 +1,174 @@
+import numpy
+import pytest
+
+from MachineLearning.Buffer import PrioritizedReplayBuffer
+from MachineLearning.ReplayStorage import ReplayStorage
+
+
+def state(value):
+    return numpy.full(3, value, dtype=numpy.float32)
+
+
+def add_chain(storage, values, action=0):
+    # consecutive transitions values[k] -> values[k + 1] of one episode
+    return [storage.add(state(values[k]), action, float(k), state(values[k + 1]), 0) for k in range(len(values) - 1)]
+
+
+def test_share_next_state_follows_the_next_slot():
+    storage = ReplayStorage(5, 3)
+    assert add_chain(storage, [0, 1, 2, 3]) == [0, 1, 2]
+    assert len(storage) == 3 and storage.index == 3
+    states, _, rewards, next_states, _ = storage.get_batch(numpy.array([0, 1, 2]))
+    assert numpy.array_equal(states[:, 0], [0, 1, 2])
+    assert numpy.array_equal(next_states[:, 0], [1, 2, 3])
+    assert numpy.array_equal(rewards[:, 0], [0, 1, 2])
+
+
+def test_gap_after_reset():
+    storage = ReplayStorage(5, 3)
+    add_chain(storage, [0, 1])
+    # new episode - the slot of the next state 1 becomes a gap
+    assert storage.add(state(5), 1, 0.0, state(6), 0) == 2
+    assert list(storage.valid[:4]) == [True, False, True, False]
+    assert len(storage) == 2
+    assert storage.get_next_states([0])[0, 0] == 1
+    states, actions, _, next_states, _ = storage.get_batch(numpy.array([2]))
+    assert (states[0, 0], actions[0, 0], next_states[0, 0]) == (5, 1, 6)
+    numpy.random.seed(0)
+    assert set(storage.sample_indices(1000)) == {0, 2}  # gaps are not sampled
+
+
+def test_wrap_around_invalidates_overwritten_transitions():
+    storage = ReplayStorage(3, 3)
+    add_chain(storage, [0, 1, 2, 3])
+    assert storage.index == 3 and len(storage) == 3
+    # the next state of the new transition overwrites the state of the oldest one
+    assert storage.add(state(3), 0, 0.0, state(4), 0) == 3
+    assert len(storage) == 3 and not storage.valid[0]
+    assert storage.get_next_states([3])[0, 0] == 4
+    numpy.random.seed(0)
+    assert set(storage.sample_indices(1000)) == {1, 2, 3}
+
+
+def test_wrap_around_with_gaps():
+    storage = ReplayStorage(3, 3)
+    add_chain(storage, [0, 1])
+    add_chain(storage, [5, 6])  # gap in slot 1
+    add_chain(storage, [7, 8])  # gap in slot 3, wraps to slot 0 and overwrites the gap of slot 1 with its next state
+    assert list(storage.valid) == [True, False, True, False]
+    assert len(storage) == 2
+    states, _, _, next_states, _ = storage.get_batch(numpy.array([0, 2]))
+    assert numpy.array_equal(states[:, 0], [7, 5])
+    assert numpy.array_equal(next_states[:, 0], [8, 6])
+
+
+def test_without_share_next_state():
+    storage = ReplayStorage(3, 3, share_next_state=False)
+    storage.add(state(0), 0, 0.0, state(1), 0)
+    storage.add(state(5), 0, 0.0, state(6), 0)   # no gaps
+    add_chain(storage, [7, 8, 9])
+    assert len(storage) == 3 and storage.index == 1
+    states, _, _, next_states, _ = storage.get_batch(numpy.array([0, 1, 2]))
+    assert numpy.array_equal(states[:, 0], [8, 5, 7])
+    assert numpy.array_equal(next_states[:, 0], [9, 6, 8])
+
+
+def test_batched_add_matches_single_adds():
+    for share_next_state in (True, False):
+        single = ReplayStorage(6, 3, share_next_state=share_next_state)
+        batched = ReplayStorage(6, 3, share_next_state=share_next_state)
+        chains = [[0, 1, 2], [2, 3, 4, 5], [7, 8], [8, 9, 10, 11]]  # the third chain starts a new episode
+        for chain in chains:
+            add_chain(single, chain)
+            states = numpy.stack([state(value) for value in chain[:-1]])
+            next_states = numpy.stack([state(value) for value in chain[1:]])
+            n = len(states)
+            batched.add_batch(states, numpy.zeros(n), numpy.arange(n, dtype=numpy.float32), next_states,
+                              numpy.zeros(n))
+        for name in ('obs', 'next_obs', 'action', 'reward', 'done', 'valid'):
+            if getattr(single, name) is not None:
+                assert numpy.array_equal(getattr(single, name), getattr(batched, name)), name
+        assert (single.index, single.size, single.filled) == (batched.index, batched.size, batched.filled)
+
+
+def test_quantized_observations():
+    storage = ReplayStorage(4, 3, obs_dtype=numpy.uint8, obs_scale=252)
+    values = numpy.array([0.0, 0.25, 0.5], dtype=numpy.float32)
+    storage.add(values, 0, 0.0, numpy.array([1.0, 0.3, 0.7], dtype=numpy.float32), 1)
+    states, _, _, next_states, dones = storage.get_batch(numpy.array([0]))
+    assert storage.obs.dtype == numpy.uint8
+    assert numpy.array_equal(states[0], values)
+    assert next_states[0, 0] == 1.0
+    assert numpy.allclose(next_states[0, 1:], [0.3, 0.7], atol=1 / 504)
+    assert dones[0, 0] == 1
+
+
+def test_reopen_continues_the_stored_transitions(tmp_path):
+    path = str(tmp_path / 'storage')
+    storage = ReplayStorage(5, 3, path=path)
+    add_chain(storage, [0, 1, 2])
+    storage.flush()
+    reopened = ReplayStorage(5, 3, path=path)
+    assert (reopened.index, reopened.size, reopened.filled, reopened.has_next_slot) == (2, 2, 3, True)
+    for stored, loaded in zip(storage.get_batch(numpy.array([0, 1])), reopened.get_batch(numpy.array([0, 1]))):
+        assert numpy.array_equal(stored, loaded)
+    # the next transition continues the episode without a gap
+    assert reopened.add(state(2), 0, 0.0, state(3), 0) == 2
+    assert len(reopened) == 3
+
+
+def test_reopen_with_another_layout(tmp_path):
+    path = str(tmp_path / 'storage')
+    add_chain(ReplayStorage(5, 3, path=path), [0, 1])
+    for kwargs in (dict(max_size=5, state_d=4), dict(max_size=6, state_d=3),
+                   dict(max_size=5, state_d=3, obs_dtype=numpy.float16)):
+        with pytest.raises(ValueError):
+            ReplayStorage(path=path, **kwargs)
+
+
+def test_incomplete_storage_is_created_anew(tmp_path):
+    path = str(tmp_path / 'storage')
+    ReplayStorage(5, 3, path=path)    # no transition - storage.json is not written
+    storage = ReplayStorage(5, 4, path=path)
+    assert len(storage) == 0 and storage.obs.shape == (6, 4)
+
+
+def test_remove_newest():
+    storage = ReplayStorage(3, 3, share_next_state=False)
+    add_chain(storage, [0, 1, 2, 3])
+    assert storage.remove_newest() == 2
+    assert len(storage) == 2 and storage.index == 2 and not storage.valid[2]
+    assert storage.add(state(7), 0, 0.0, state(8), 0) == 2
+    shared = ReplayStorage(3, 3)
+    add_chain(shared, [0, 1])
+    with pytest.raises(AssertionError):     # the next state of the newest transition is shared
+        shared.remove_newest()
+
+
+def create_prioritized_buffer(path):
+    return PrioritizedReplayBuffer(8, 2, 3, 'cpu', n_actions=4, obs_dtype=numpy.uint8, obs_scale=252, path=path)
+
+
+def test_reopen_quantized_prioritized_buffer(tmp_path):
+    path = str(tmp_path / 'memory')
+    buffer = create_prioritized_buffer(path)
+    for k in range(5):
+        buffer.add(state(k / 4), k % 4, float(k), state((k + 1) / 4), 0, priority=None if k % 2 else 0.5 + k)
+    buffer.update_priorities(numpy.array([1, 3, 1]), numpy.array([2.0, 7.5, 3.0]))
+    buffer.remove_newest()
+    buffer.flush()
+
+    reopened = create_prioritized_buffer(path)
+    assert reopened.storage.obs.dtype == numpy.uint8
+    assert len(reopened) == 4 and reopened.tree_ptr == reopened.storage.index == 4
+    assert reopened.max_priority == buffer.max_priority == 7.5
+    assert numpy.array_equal(reopened.sum_tree.tree, buffer.sum_tree.tree)
+    assert numpy.array_equal(reopened.min_tree.tree, buffer.min_tree.tree)
+    assert reopened.sum_tree[4] == 0.0 and reopened.min_tree[4] == float("inf")     # removed transition
+    batch = reopened.storage.get_batch(numpy.arange(4))
+    for stored, loaded in zip(buffer.storage.get_batch(numpy.arange(4)), batch):
+        assert numpy.array_equal(stored, loaded)
+    states, actions, _, next_states, _ = batch
+    assert numpy.allclose(states[:, 0], [0, 0.25, 0.5, 0.75], atol=1 / 504)
+    assert numpy.allclose(next_states[:, 0], [0.25, 0.5, 0.75, 1.0], atol=1 / 504)
+    assert numpy.array_equal(actions[:, 0], [0, 1, 2, 3])
@@ -0,0 +1,52 @@
+import numpy
+
+from MachineLearning.SegmentTree import MinSegmentTree, SumSegmentTree
+
+
+def create_trees(values):
+    sum_tree = SumSegmentTree(len(values))
+    min_tree = MinSegmentTree(len(values))
+    for index, value in enumerate(values):
+        sum_tree[index] = value
+        min_tree[index] = value
+    return sum_tree, min_tree
+
+
+def test_sum_and_min_of_ranges():
+    values = numpy.random.default_rng(0).uniform(0.1, 2.0, size=8)
+    sum_tree, min_tree = create_trees(values)
+    assert numpy.isclose(sum_tree.sum(), values.sum())
+    assert min_tree.min() == values.min()
+    for start in range(8):
+        for end in range(start + 1, 9):
+            assert numpy.isclose(sum_tree.sum(start, end), values[start:end].sum())
+            assert min_tree.min(start, end) == values[start:end].min()
+    # end <= 0 counts from the capacity
+    assert numpy.isclose(sum_tree.sum(2, -1), values[2:7].sum())
+    assert min_tree.min(0, -4) == values[:4].min()
+
+
+def test_batched_update_with_repeated_indices():
+    sum_tree, min_tree = create_trees(numpy.ones(8))
+    for tree in (sum_tree, min_tree):
+        tree.update([1, 5, 1, 6], [4.0, 0.5, 2.0, 3.0])     # last value of index 1 is set
+    expected_sum, expected_min = create_trees([1.0, 2.0, 1.0, 1.0, 1.0, 0.5, 3.0, 1.0])
+    assert numpy.array_equal(sum_tree.tree, expected_sum.tree)
+    assert numpy.array_equal(min_tree.tree, expected_min.tree)
+    assert list(sum_tree[[1, 5, 6]]) == [2.0, 0.5, 3.0]
+
+
+def test_retrieve_at_boundaries():
+    sum_tree, _ = create_trees([1.0, 2.0, 0.0, 3.0])
+    # prefix sums 1, 3, 3, 6 - an upper bound equal to a prefix sum belongs to the next leaf with a priority
+    expected = {0.0: 0, 0.999: 0, 1.0: 1, 2.999: 1, 3.0: 3, 5.999: 3, 6.0: 3}
+    for upperbound, index in expected.items():
+        assert sum_tree.retrieve(upperbound) == index
+    upperbounds = list(expected) + [1.0, 0.0, 3.0]  # repeated upper bounds in one batch
+    assert list(sum_tree.retrieve(upperbounds)) == [sum_tree.retrieve(upperbound) for upperbound in upperbounds]
+
+
+def test_retrieve_skips_empty_leaves():
+    sum_tree, _ = create_trees([0.0, 0.0, 0.5, 0.0, 0.0, 0.0, 0.0, 0.25])
+    upperbounds = numpy.random.default_rng(1).uniform(0.0, sum_tree.sum(), size=100)
+    assert set(sum_tree.retrieve(upperbounds)) == {2, 7}